@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Script de migração: adiciona coluna canonical_url (com índice) e preenche
+os artigos existentes com utils.canonicalizar_url(url).
+
+Pode ser executado de novo a qualquer momento: só preenche linhas com
+canonical_url NULL.
+"""
+from db import get_session
+from sqlalchemy import text
+from sqlmodel import select
+from models import Article
+from utils import canonicalizar_url
+
+BATCH_SIZE = 1000
+
+print('=== Migração: Adicionando canonical_url ===\n')
+
+with get_session() as session:
+    try:
+        session.exec(text('ALTER TABLE articles ADD COLUMN canonical_url VARCHAR'))
+        session.commit()
+        print('✅ Coluna canonical_url adicionada com sucesso!\n')
+    except Exception as e:
+        error_msg = str(e).lower()
+        if 'duplicate column' in error_msg or 'already exists' in error_msg:
+            print('ℹ️  Coluna canonical_url já existe, pulando...\n')
+        else:
+            print(f'❌ Erro ao adicionar coluna: {e}\n')
+            raise
+
+with get_session() as session:
+    # Mesmo nome de índice que o SQLModel cria em bancos novos
+    session.exec(text('CREATE INDEX IF NOT EXISTS ix_articles_canonical_url ON articles (canonical_url)'))
+    session.commit()
+    print('✅ Índice ix_articles_canonical_url OK\n')
+
+print('Preenchendo canonical_url dos artigos existentes...')
+total = 0
+ultimo_id = 0
+while True:
+    with get_session() as session:
+        artigos = session.exec(
+            select(Article)
+            .where(Article.canonical_url.is_(None), Article.id > ultimo_id)  # type: ignore
+            .order_by(Article.id)                                             # type: ignore
+            .limit(BATCH_SIZE)
+        ).all()
+
+        if not artigos:
+            break
+
+        for artigo in artigos:
+            artigo.canonical_url = canonicalizar_url(artigo.url)
+            session.add(artigo)
+        session.commit()
+
+        ultimo_id = artigos[-1].id
+        total += len(artigos)
+        print(f'  {total} artigos atualizados...')
+
+print(f'\n✅ {total} artigos preenchidos')
+print('Migração concluída!')
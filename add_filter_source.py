@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Script de migração: adiciona a coluna filter_source (origem do
+initial_filter_score: 'llm', 'prefiltro', 'conteudo' ou 'padrao').
+
+Artigos antigos ficam com filter_source NULL; o treino do pré-filtro
+(prefilter.py) trata esses scores à parte.
+"""
+from db import get_session
+from sqlalchemy import text
+
+print('=== Migração: Adicionando filter_source ===\n')
+
+with get_session() as session:
+    try:
+        session.exec(text('ALTER TABLE articles ADD COLUMN filter_source VARCHAR'))
+        session.commit()
+        print('✅ Coluna filter_source adicionada com sucesso!\n')
+    except Exception as e:
+        error_msg = str(e).lower()
+        if 'duplicate column' in error_msg or 'already exists' in error_msg:
+            print('ℹ️  Coluna filter_source já existe, pulando...\n')
+        else:
+            print(f'❌ Erro ao adicionar coluna: {e}\n')
+            raise
+
+print('Migração concluída!')
@@ -1,9 +1,14 @@
 import json, time, tempfile, openai, importlib
 from pathlib import Path
+from types import SimpleNamespace
 from datetime import datetime
 import numpy as np
 
 import config_base as config
+import llm_cache
+import embedding_cache
+from prompt_cache import params_anthropic
+import token_budget
 from utils import get_active_feeds, logger, deduplicar_artigos
 from newsletter import enviar_batch_anthropic, aguardar_batch_anthropic, processar_resultados_batch
 from sklearn.cluster import KMeans
@@ -24,6 +29,64 @@ BATCH_POLL_INTERVAL = 60
 
 
 
+def _registro_cache(line):
+    """Registro no cache de LLM de uma linha JSONL (só chat completions é cacheado)."""
+    if line["url"] != "/v1/chat/completions":
+        return None
+    body = line["body"]
+    params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+    return llm_cache.registro("openai", body["model"], body["messages"], params)
+
+
+def _registros_do_arquivo_batch(batch_status):
+    """
+    Registros do cache de LLM das linhas de um batch enviado por outro
+    processo (ex.: recuperar_batch.py), lidos do arquivo de entrada.
+    """
+    if not config.LLM_CACHE_ENABLED or not getattr(batch_status, "input_file_id", None):
+        return {}
+    try:
+        conteudo = batch_client.files.content(batch_status.input_file_id)
+        registros = {}
+        for line in conteudo.text.strip().split("\n"):
+            if not line:
+                continue
+            line = json.loads(line)
+            reg = _registro_cache(line)
+            if reg:
+                registros[line["custom_id"]] = reg
+        return registros
+    except Exception as e:
+        logger.warning(f"Não foi possível ler o arquivo de entrada do batch para o cache de LLM: {e}")
+        return {}
+
+
+def lotes_do_arquivo_batch(batch_status) -> dict:
+    """
+    custom_id "feed-lote-N" -> ids dos artigos, lidos dos prompts no arquivo
+    de entrada de um batch de filtro em lote (ex.: para recuperar_batch.py).
+    """
+    from packed_filter import ids_do_prompt_lote
+
+    if not getattr(batch_status, "input_file_id", None):
+        return {}
+    try:
+        conteudo = batch_client.files.content(batch_status.input_file_id)
+        lotes = {}
+        for line in conteudo.text.strip().split("\n"):
+            if not line:
+                continue
+            line = json.loads(line)
+            if "-lote-" not in line["custom_id"]:
+                continue
+            prompt = line["body"]["messages"][-1]["content"]
+            lotes[line["custom_id"]] = ids_do_prompt_lote(prompt)
+        return lotes
+    except Exception as e:
+        logger.warning(f"Não foi possível ler os lotes do arquivo de entrada do batch: {e}")
+        return {}
+
+
 def enviar_batch(requests_list, description="batch", endpoint="/v1/chat/completions"):
     """
     Cria arquivo JSONL e envia para a Batch API da OpenAI.
@@ -35,7 +98,7 @@ def enviar_batch(requests_list, description="batch", endpoint="/v1/chat/completi
     logger.info(f"Montando batch '{description}' com {len(requests_list)} requests...")
     
     # Monta as linhas JSONL
-    jsonl_lines = []
+    lines = []
     for req in requests_list:
         if "body" in req:
             body = req["body"]
@@ -52,9 +115,17 @@ def enviar_batch(requests_list, description="batch", endpoint="/v1/chat/completi
             "url": endpoint,
             "body": body
         }
-        jsonl_lines.append(json.dumps(line))
+        lines.append(line)
+    
+    # Linhas já respondidas no cache de LLM não vão para a API
+    lines, em_cache, registros = llm_cache.separar_lote(lines, _registro_cache)
+    if not lines:
+        logger.info(f"Batch '{description}': todas as {len(em_cache)} requests estão no cache de LLM")
+        return llm_cache.registrar_lote(None, em_cache, registros)
+    if em_cache:
+        logger.info(f"  {len(em_cache)} requests no cache de LLM, {len(lines)} vão para a API")
     
-    jsonl_content = "\n".join(jsonl_lines)
+    jsonl_content = "\n".join(json.dumps(line) for line in lines)
     
     # Cria arquivo temporário e faz upload
     try:
@@ -83,7 +154,7 @@ def enviar_batch(requests_list, description="batch", endpoint="/v1/chat/completi
         )
         
         logger.info(f"Batch criado: {batch.id}")
-        return batch.id
+        return llm_cache.registrar_lote(batch.id, em_cache, registros)
         
     except Exception as e:
         logger.error(f"Erro ao enviar batch: {e}")
@@ -97,6 +168,9 @@ def aguardar_batch(batch_id, description="batch"):
     if not batch_id:
         return None
     
+    if llm_cache.lote_so_cache(batch_id):
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=None)
+    
     logger.info(f"Aguardando batch '{description}' ({batch_id})...")
     
     start_time = time.time()
@@ -142,6 +216,9 @@ def baixar_resultados_batch(batch_status, description="batch", is_embedding=Fals
     if not batch_status:
         return None
     
+    if llm_cache.lote_so_cache(batch_status.id):
+        return llm_cache.concluir_lote(batch_status.id, {})
+    
     output_file_id = batch_status.output_file_id
     
     if not output_file_id:
@@ -187,7 +264,12 @@ def baixar_resultados_batch(batch_status, description="batch", is_embedding=Fals
                 erros += 1
         
         logger.info(f"Resultados processados: {len(resultados)} ok, {erros} erros")
-        return resultados
+        
+        # Respostas novas vão para o cache; as que vieram dele no envio voltam junto
+        registros = None
+        if not is_embedding and llm_cache.registros_do_lote(batch_status.id) is None:
+            registros = _registros_do_arquivo_batch(batch_status)
+        return llm_cache.concluir_lote(batch_status.id, resultados, registros)
         
     except Exception as e:
         logger.error(f"Erro ao baixar resultados do batch: {e}")
@@ -217,20 +299,30 @@ def executar_batch(requests_list, description="batch", endpoint="/v1/chat/comple
     return resultados
 
 
-def scrape_metadata_only(feed_profile, rss_feeds, effective_config):
+def scrape_metadata_only(feed_profile, rss_feeds, effective_config, feeds_baixados=None, urls_vistas=None):
     """
     Fase 1 do pipeline batch: coleta metadados do RSS sem chamar API de filtro.
     
     Salva apenas: url, title, rss_description, published_date, feed_source, url_encoding
     Deixa initial_filter_score=NULL para processamento posterior em batch.
+    
+    feeds_baixados: resultado de buscar_feeds() já feito pelo pipeline. Se None,
+    os feeds deste perfil são baixados aqui.
+    urls_vistas: set de URLs canônicas já tratadas nesta execução, compartilhado
+    entre perfis pelo pipeline. Entradas repetidas são descartadas antes de
+    qualquer consulta ao banco.
     """
     logger.info(f"--- [BATCH] Coletando metadados RSS [{feed_profile}] ---")
     
     # Importações necessárias
-    import feedparser
+    from feed_fetcher import (
+        buscar_feeds, feed_nao_modificado, circuito_aberto, entradas_nao_vistas, registrar_estado_feeds
+    )
     from datetime import datetime, timedelta
     from models import Article
     from db import get_db_connection
+    from database import get_existing_urls
+    from utils import canonicalizar_url
     from sqlmodel import select, func
     
     # Verificar cold start
@@ -252,28 +344,69 @@ def scrape_metadata_only(feed_profile, rss_feeds, effective_config):
     
     new_articles_count = 0
     skipped_existing = 0
+    skipped_duplicadas = 0
+    
+    if urls_vistas is None:
+        urls_vistas = set()
     
     if not rss_feeds:
         logger.warning(f"Nenhum RSS_FEEDS definido para '{feed_profile}'")
         return 0
     
-    for feed_url in rss_feeds:
+    # Quando o pipeline já baixou os feeds, ele mesmo registra o estado no final
+    registrar_estado = feeds_baixados is None
+    if feeds_baixados is None:
+        feeds_baixados = buscar_feeds(rss_feeds, feed_profile=feed_profile)
+    
+    # dict.fromkeys: um feed listado duas vezes no perfil é lido uma vez só
+    for feed_url in dict.fromkeys(rss_feeds):
         logger.info(f"Lendo feed: {feed_url}")
-        feed = feedparser.parse(feed_url)
+        feed = feeds_baixados.get(feed_url)
+        
+        if feed is None:
+            logger.warning(f"Feed indisponível, pulando: {feed_url}")
+            continue
+        
+        if circuito_aberto(feed):
+            logger.info(f"  Circuito aberto (falhas/lentidão recentes), pulando")
+            continue
+        
+        if feed_nao_modificado(feed):
+            logger.info(f"  Sem mudanças desde a última execução (304)")
+            continue
         
         if feed.bozo:
             logger.warning(f"Problema no feed {feed_url}: {feed.bozo_exception}")
         
-        for entry in feed.entries:
+        # Entradas já vistas na última busca foram salvas ou descartadas por idade.
+        # Deduplicação pela URL canônica antes de qualquer consulta ao banco:
+        # a mesma notícia repetida no feed ou já tratada por outro feed/perfil
+        entradas = []
+        for entry in entradas_nao_vistas(feed):
             url = entry.get('link')
             if not url:
                 continue
             
+            # Verificar idade
+            published_parsed = entry.get('published_parsed')
+            published_date = datetime(*published_parsed[:6]) if published_parsed else datetime.now()
+            if published_date < cutoff_date:
+                continue
+            
+            chave = canonicalizar_url(url)
+            if chave in urls_vistas:
+                skipped_duplicadas += 1
+                continue
+            urls_vistas.add(chave)
+            entradas.append((entry, url, published_date))
+        
+        # Uma consulta em lote por feed em vez de uma por entrada
+        urls_existentes = get_existing_urls([url for _, url, _ in entradas])
+        
+        for entry, url, published_date in entradas:
             # Dados básicos
             title = entry.get('title', 'No Title')
             description = entry.get('description', '') or entry.get('summary', '')
-            published_parsed = entry.get('published_parsed')
-            published_date = datetime(*published_parsed[:6]) if published_parsed else datetime.now()
             feed_source = feed.feed.get('title', feed_url)
             
             # URL encoding para Marreta
@@ -283,15 +416,8 @@ def scrape_metadata_only(feed_profile, rss_feeds, effective_config):
                 url_encoding = url_encoding.replace(old, new)
             url_encoding = "https://marreta.galdinho.news/p/" + url_encoding
             
-            # Verificar idade
-            if published_date < cutoff_date:
-                continue
-            
             # Verificar se já existe
-            with get_db_connection() as session:
-                exists = session.exec(select(Article).where(Article.url == url)).first()
-            
-            if exists:
+            if url in urls_existentes:
                 skipped_existing += 1
                 continue
             
@@ -315,7 +441,13 @@ def scrape_metadata_only(feed_profile, rss_feeds, effective_config):
                 new_articles_count += 1
                 logger.info(f"  Salvo: {title[:60]}...")
     
-    logger.info(f"--- Metadados coletados: {new_articles_count} novos, {skipped_existing} já existiam [{feed_profile}] ---")
+    if registrar_estado:
+        registrar_estado_feeds(feeds_baixados, feed_profile)
+    
+    logger.info(
+        f"--- Metadados coletados: {new_articles_count} novos, {skipped_existing} já existiam, "
+        f"{skipped_duplicadas} duplicados na execução [{feed_profile}] ---"
+    )
     return new_articles_count
 
 
@@ -329,8 +461,12 @@ def batch_filter(feed_profile: str = None):
     import importlib
     import re
     from database import get_articles_pending_filter, update_article_filter_score
+    from packed_filter import dividir_em_lotes, montar_prompt_lote, max_tokens_lote, parsear_scores_lote
+    import prefilter
     
     logger.info(f"--- [BATCH] Iniciando filtro batch [{feed_profile or 'TODOS'}] ---")
+    cache_antes = llm_cache.estatisticas()
+    prefiltro_antes = prefilter.estatisticas()
     
     # 1. Buscar artigos pendentes
     pendentes = get_articles_pending_filter(feed_profile)
@@ -351,8 +487,13 @@ def batch_filter(feed_profile: str = None):
         artigos_por_feed[fp].append(art)
     
 
-    # 3. Montar requests com prompt específico de cada feed
+    # 3. Montar requests com prompt específico de cada feed.
+    # No modo em lote, cada request avalia até FILTER_PACK_SIZE artigos e
+    # responde um JSON {id: score}; custom_id "feed-lote-N" → ids em `lotes`.
     requests_list = []
+    lotes = {}
+    prompts_individuais = {}  # article_id -> (fp, request) para o fallback item a item
+    decididos_prefiltro = {}  # article_id -> aprovado? (score do pré-filtro local, sem batch)
     
     for fp, artigos in artigos_por_feed.items():
         # Carregar config do feed
@@ -362,6 +503,21 @@ def batch_filter(feed_profile: str = None):
             logger.warning(f"Config não encontrada para feed '{fp}', usando default")
             feed_config = None
         
+        # Pré-filtro local: snippets com decisão confiante não vão para o LLM
+        min_score = getattr(feed_config, 'MIN_INITIAL_FILTER_SCORE', config.MIN_INITIAL_FILTER_SCORE)
+        scores_prefiltro = prefilter.classificar(
+            fp,
+            [prefilter.texto_snippet(art['title'], art['rss_description']) for art in artigos],
+            feed_config
+        )
+        for art, score in zip(artigos, scores_prefiltro):
+            if score is not None:
+                update_article_filter_score(art['id'], score, source='prefiltro')
+                decididos_prefiltro[art['id']] = score >= min_score
+        artigos = [art for art, score in zip(artigos, scores_prefiltro) if score is None]
+        if not artigos:
+            continue
+        
         # Pegar prompt e modelo
         prompt_template = getattr(
             feed_config, 
@@ -382,8 +538,10 @@ def batch_filter(feed_profile: str = None):
         )
         
         filter_model = getattr(feed_config, 'FILTER_MODEL', None) or config.FILTER_MODEL
+        em_lote = getattr(feed_config, 'FILTER_PACKED_ENABLED', config.FILTER_PACKED_ENABLED)
+        tamanho_lote = getattr(feed_config, 'FILTER_PACK_SIZE', config.FILTER_PACK_SIZE)
         
-        # Montar request para cada artigo
+        # Request individual de cada artigo (modo normal e fallback do modo em lote)
         for art in artigos:
             prompt = prompt_template.format(
                 feed_profile=fp,
@@ -391,14 +549,34 @@ def batch_filter(feed_profile: str = None):
                 description=art['rss_description'] or "Sem descrição"
             )
             
-            requests_list.append({
+            prompts_individuais[art['id']] = {
                 "custom_id": f"{fp}-{art['id']}",
                 "model": filter_model,
                 "messages": [{"role": "user", "content": prompt}],
                 "max_tokens": 10
+            }
+        
+        if not em_lote:
+            requests_list.extend(prompts_individuais[art['id']] for art in artigos)
+            continue
+        
+        for n, lote in enumerate(dividir_em_lotes(artigos, tamanho_lote)):
+            itens = [
+                {"id": art['id'], "title": art['title'], "description": art['rss_description']}
+                for art in lote
+            ]
+            custom_id = f"{fp}-lote-{n}"
+            lotes[custom_id] = [art['id'] for art in lote]
+            requests_list.append({
+                "custom_id": custom_id,
+                "model": filter_model,
+                "messages": [{"role": "user", "content": montar_prompt_lote(prompt_template, fp, itens)}],
+                "max_completion_tokens": max_tokens_lote(len(lote))
             })
     
-    logger.info(f"Montados {len(requests_list)} requests para batch")
+    if decididos_prefiltro:
+        logger.info(f"Pré-filtro local decidiu {len(decididos_prefiltro)} artigos sem chamar o LLM")
+    logger.info(f"Montados {len(requests_list)} requests para batch ({len(lotes)} em lote)")
     
 
     # 4. Executar batch
@@ -406,37 +584,80 @@ def batch_filter(feed_profile: str = None):
     
     if resultados is None:
         logger.error("Falha ao executar batch de filtro")
-        return {"total": len(pendentes), "aprovados": 0, "rejeitados": 0, "erros": len(pendentes)}
+        aprovados = sum(decididos_prefiltro.values())
+        return {"total": len(pendentes), "aprovados": aprovados,
+                "rejeitados": len(decididos_prefiltro) - aprovados,
+                "erros": len(pendentes) - len(decididos_prefiltro),
+                "prefiltro": _estatisticas_prefiltro(prefiltro_antes, artigos_por_feed)}
     
-
-    # 5. Processar resultados e atualizar banco
-    stats = {"total": len(pendentes), "aprovados": 0, "rejeitados": 0, "erros": 0}
     
+    # 4b. Desempacotar respostas em lote; ids sem score válido vão para o fallback
+    respostas = {}  # article_id -> score (int) ou resposta de texto a parsear
+    faltando = []
     for custom_id, resposta in resultados.items():
-        # Extrair article_id do custom_id (formato: "feed-123")
-        parts = custom_id.rsplit("-", 1)
-        if len(parts) != 2:
-            logger.warning(f"custom_id inválido: {custom_id}")
-            stats["erros"] += 1
-            continue
-        
-        try:
-            article_id = int(parts[1])
-        except ValueError:
-            logger.warning(f"Não foi possível extrair article_id de: {custom_id}")
-            stats["erros"] += 1
+        if custom_id not in lotes:
+            respostas[custom_id] = resposta
             continue
         
-        # Parsear score da resposta
-        match = re.search(r'\b([1-5])\b', resposta.strip())
-        if match:
-            score = int(match.group(1))
+        scores = parsear_scores_lote(resposta, lotes[custom_id])
+        for article_id in lotes[custom_id]:
+            if article_id in scores:
+                respostas[article_id] = scores[article_id]
+            else:
+                faltando.append(article_id)
+    
+    # Lotes que nem voltaram (erro na request) também caem no fallback
+    for custom_id, ids in lotes.items():
+        if custom_id not in resultados:
+            faltando.extend(ids)
+    
+    if faltando:
+        logger.warning(f"{len(faltando)} artigos sem score na resposta em lote, reavaliando um a um")
+        resultados_fallback = executar_batch(
+            [prompts_individuais[article_id] for article_id in faltando],
+            description="filter-fallback"
+        )
+        respostas.update(resultados_fallback or {})
+    
+
+    # 5. Processar resultados e atualizar banco
+    stats = {"total": len(pendentes), "aprovados": 0, "rejeitados": 0, "erros": 0}
+    
+    stats["aprovados"] += sum(decididos_prefiltro.values())
+    stats["rejeitados"] += len(decididos_prefiltro) - sum(decididos_prefiltro.values())
+    
+    for chave, resposta in respostas.items():
+        origem = 'llm'
+        if isinstance(chave, int):
+            # Score já extraído da resposta em lote
+            article_id, score = chave, resposta
         else:
-            logger.warning(f"Score inválido para {custom_id}: '{resposta}'")
-            score = 3  # Default se não conseguir parsear
+            # Extrair article_id do custom_id (formato: "feed-123")
+            custom_id = chave
+            parts = custom_id.rsplit("-", 1)
+            if len(parts) != 2:
+                logger.warning(f"custom_id inválido: {custom_id}")
+                stats["erros"] += 1
+                continue
+            
+            try:
+                article_id = int(parts[1])
+            except ValueError:
+                logger.warning(f"Não foi possível extrair article_id de: {custom_id}")
+                stats["erros"] += 1
+                continue
+            
+            # Parsear score da resposta
+            match = re.search(r'\b([1-5])\b', resposta.strip())
+            if match:
+                score = int(match.group(1))
+            else:
+                logger.warning(f"Score inválido para {custom_id}: '{resposta}'")
+                score = 3  # Default se não conseguir parsear
+                origem = 'padrao'
         
         # Atualizar no banco
-        update_article_filter_score(article_id, score)
+        update_article_filter_score(article_id, score, source=origem)
         
         if score >= 3:
             stats["aprovados"] += 1
@@ -445,13 +666,67 @@ def batch_filter(feed_profile: str = None):
     
     
     # Contar erros (artigos sem resposta)
-    respondidos = len(resultados)
+    respondidos = len(respostas) + len(decididos_prefiltro)
     stats["erros"] = len(pendentes) - respondidos
     
+    stats["cache"] = llm_cache.estatisticas(desde=cache_antes)
+    stats["prefiltro"] = _estatisticas_prefiltro(prefiltro_antes, artigos_por_feed)
+    
     logger.info(f"--- Filtro batch concluído: {stats} ---")
     return stats
 
 
+def _estatisticas_prefiltro(antes, feeds):
+    """Decisões do pré-filtro nesta fase e a precisão medida no treino de cada feed."""
+    import prefilter
+    stats = prefilter.estatisticas(desde=antes)
+    stats["precisao"] = {fp: prefilter.precisao(fp) for fp in feeds}
+    return stats
+
+
+MIN_CONTENT_LENGTH = 500
+PAYWALL_INDICATORS = [
+    'subscribe to continue reading',
+    'this content is for subscribers',
+    'sign up to read more',
+    'become a member to',
+    'subscribe for full access',
+    'continue reading for',
+]
+
+
+def validar_conteudo(raw_content):
+    """
+    Valida o conteúdo extraído de um artigo.
+    
+    Retorna None se o conteúdo é aceitável, ou o motivo da rejeição:
+    'curto', 'paywall' ou 'truncado'.
+    """
+    # Conteúdo vazio ou muito curto
+    if not raw_content or len(raw_content) < MIN_CONTENT_LENGTH:
+        logger.warning(f"    Conteúdo muito curto ({len(raw_content) if raw_content else 0} chars)")
+        return "curto"
+    
+    # Detecção de paywall
+    content_lower = raw_content[-200:].lower()
+    for indicator in PAYWALL_INDICATORS:
+        if indicator in content_lower:
+            logger.warning(f"    Paywall detectado: '{indicator}'")
+            return "paywall"
+    
+    # Conteúdo truncado
+    content_tail = raw_content[-50:].strip()
+    last_char = content_tail[-1] if content_tail else ''
+    
+    if last_char.isalnum() and len(raw_content) < 2000:
+        last_words = content_tail.split()[-3:]
+        if len(last_words) > 0 and len(last_words[-1]) < 3:
+            logger.warning(f"    Conteúdo aparenta estar truncado")
+            return "truncado"
+    
+    return None
+
+
 def fetch_approved_content(feed_profile: str = None):
     """
     Fase 3 do pipeline batch: busca conteúdo dos artigos aprovados no filtro.
@@ -461,14 +736,20 @@ def fetch_approved_content(feed_profile: str = None):
     - Valida conteúdo (tamanho, paywall, truncamento)
     - Se falhar validação → marca score=1 (rejeitado)
     - Se passar → salva raw_content, image_url
+    
+    As buscas rodam em paralelo (CONTENT_FETCH_MAX_WORKERS), com um token
+    bucket por domínio para não sobrecarregar nenhum publisher, e a extração
+    do HTML roda num pool de processos (content_pipeline). Validação e
+    gravação no banco continuam sendo feitas artigo a artigo, na thread principal.
     """
     from database import (
         get_approved_articles_without_content,
         update_article_content,
         update_article_filter_score
     )
-    from utils import fetch_article_content_and_og_image
-    import time
+    from content_pipeline import buscar_e_extrair
+    from rate_limit import LimitadorPorDominio
+    import domain_stats
     
     logger.info(f"--- [BATCH] Buscando conteúdo [{feed_profile or 'TODOS'}] ---")
     
@@ -483,80 +764,51 @@ def fetch_approved_content(feed_profile: str = None):
     
     stats = {"total": len(artigos), "sucesso": 0, "falha_fetch": 0, "falha_validacao": 0}
     
-    MIN_CONTENT_LENGTH = 500
-    PAYWALL_INDICATORS = [
-        'subscribe to continue reading',
-        'this content is for subscribers',
-        'sign up to read more',
-        'become a member to',
-        'subscribe for full access',
-        'continue reading for',
-    ]
+    limitador = LimitadorPorDominio(config.CONTENT_FETCH_DOMAIN_RATE, config.CONTENT_FETCH_DOMAIN_BURST)
     
-    for art in artigos:
+    def _antes_de_baixar(art):
+        logger.info(f"  Buscando: {(art['title'] or 'Sem título')[:60]}...")
+    
+    # 2. Buscar (threads) e extrair (processos) conteúdo em paralelo,
+    # com limite de taxa por domínio do artigo (ser educado com os servidores)
+    resultados = buscar_e_extrair(
+        artigos,
+        obter_urls=lambda art: (art['url'], art['url_encoding']),
+        antes_de_baixar=_antes_de_baixar,
+        limitador=limitador
+    )
+    
+    for art, fetch_result, marreta, erro in resultados:
         article_id = art['id']
-        url = art['url']
-        url_encoding = art['url_encoding']
-        title = art['title'] or "Sem título"
         
-        logger.info(f"  Buscando: {title[:60]}...")
-        
-        # 2. Tentar buscar conteúdo
-        try:
-            fetch_result, marreta = fetch_article_content_and_og_image(url, url_encoding)
-            raw_content = fetch_result['content']
-            og_image = fetch_result['og_image']
-        except Exception as e:
-            logger.warning(f"    Erro ao buscar {url}: {e}")
+        if erro is not None:
+            logger.warning(f"    Erro ao buscar {art['url']}: {erro}")
             stats["falha_fetch"] += 1
             continue
         
-        # 3. Validar conteúdo
+        raw_content = fetch_result['content']
+        og_image = fetch_result['og_image']
         
-        # 3a. Conteúdo vazio ou muito curto
-        if not raw_content or len(raw_content) < MIN_CONTENT_LENGTH:
-            logger.warning(f"    Conteúdo muito curto ({len(raw_content) if raw_content else 0} chars)")
-            update_article_filter_score(article_id, 1)  # Marca como rejeitado
-            stats["falha_validacao"] += 1
-            continue
-        
-        # 3b. Detecção de paywall
-        content_lower = raw_content[-200:].lower()
-        paywall_detected = False
-        for indicator in PAYWALL_INDICATORS:
-            if indicator in content_lower:
-                logger.warning(f"    Paywall detectado: '{indicator}'")
-                paywall_detected = True
-                break
-        
-        if paywall_detected:
-            update_article_filter_score(article_id, 1)
+        # 3. Validar conteúdo
+        motivo = validar_conteudo(raw_content)
+        if motivo:
+            if raw_content:
+                domain_stats.registrar_rejeicao(art['url'], motivo, marreta)
+            update_article_filter_score(article_id, 1, source='conteudo')  # Marca como rejeitado
             stats["falha_validacao"] += 1
             continue
         
-        # 3c. Conteúdo truncado
-        content_tail = raw_content[-50:].strip()
-        last_char = content_tail[-1] if content_tail else ''
-        
-        if last_char.isalnum() and len(raw_content) < 2000:
-            last_words = content_tail.split()[-3:]
-            if len(last_words) > 0 and len(last_words[-1]) < 3:
-                logger.warning(f"    Conteúdo aparenta estar truncado")
-                update_article_filter_score(article_id, 1)
-                stats["falha_validacao"] += 1
-                continue
-        
         # 4. Buscar imagem do RSS se não tiver og:image
         # (simplificado - usa só og:image por enquanto)
         final_image_url = og_image
         
         # 5. Salvar conteúdo
         update_article_content(article_id, raw_content, final_image_url, marreta)
-        logger.info(f"    ✓ Conteúdo salvo ({len(raw_content)} chars)")
+        logger.info(f"    ✓ Conteúdo salvo ({len(raw_content)} chars): {(art['title'] or 'Sem título')[:60]}")
         stats["sucesso"] += 1
-        
-        # Rate limiting - ser educado com os servidores
-        time.sleep(0.5)
+    
+    # Resultados por domínio alimentam o roteamento Marreta/origem das próximas buscas
+    domain_stats.salvar()
     
     logger.info(f"--- Busca de conteúdo concluída: {stats} ---")
     return stats
@@ -568,11 +820,16 @@ def batch_summary(feed_profile: str = None):
     
     Busca artigos com raw_content mas sem processed_content,
     envia para sumarização em batch, e salva os resumos.
+    
+    Feeds com FUSED_SUMMARY_RATING pedem resumo e impact_score na mesma
+    request (JSON); esses artigos já saem avaliados e a Fase 5 os ignora.
     """
     import importlib
-    from database import get_articles_pending_summary, update_article_processing
+    from database import get_articles_pending_summary, update_article_processing, update_article_rating
+    from fused_summary import montar_prompt_fundido, parsear_resposta_fundida, RESPONSE_FORMAT
     
     logger.info(f"--- [BATCH] Iniciando sumarização [{feed_profile or 'TODOS'}] ---")
+    cache_antes = llm_cache.estatisticas()
     
     # 1. Buscar artigos pendentes
     pendentes = get_articles_pending_summary(feed_profile)
@@ -582,6 +839,7 @@ def batch_summary(feed_profile: str = None):
         return {"total": 0, "sucesso": 0, "erros": 0}
     
     logger.info(f"Encontrados {len(pendentes)} artigos para sumarizar")
+    orcamento_antes = token_budget.estatisticas("summary")
     
     # 2. Agrupar por feed_profile
     artigos_por_feed = {}
@@ -593,6 +851,7 @@ def batch_summary(feed_profile: str = None):
     
     # 3. Montar requests com prompt específico de cada feed
     requests_list = []
+    fundidos = {}  # custom_id -> (request fundida, request de resumo simples para o fallback)
     
     for fp, artigos in artigos_por_feed.items():
         # Carregar config do feed
@@ -609,21 +868,50 @@ def batch_summary(feed_profile: str = None):
         )
         
         summary_model = getattr(feed_config, 'SUMMARY_MODEL', None) or config.SUMMARY_MODEL
+        orcamentos = getattr(feed_config, 'TOKEN_BUDGETS', None)
+        fundido = getattr(feed_config, 'FUSED_SUMMARY_RATING', config.FUSED_SUMMARY_RATING)
+        rating_template = getattr(feed_config, 'PROMPT_IMPACT_RATING', config.PROMPT_IMPACT_RATING)
         
         # Montar request para cada artigo
         for art in artigos:
-            prompt = prompt_template.format(
-                article_content=art['raw_content'][:4000]  # Limitar contexto
+            # Limitar contexto ao orçamento de tokens da etapa, no fim de uma frase
+            conteudo = token_budget.aparar_para_etapa(
+                art['raw_content'], "summary", summary_model, orcamentos
             )
             
-            requests_list.append({
+            prompt = prompt_template.format(article_content=conteudo)
+            
+            request_simples = {
                 "custom_id": f"{fp}-{art['id']}",
                 "model": summary_model,
                 "messages": [{"role": "user", "content": prompt}],
                 "max_completion_tokens": 3000
-            })
+            }
+            
+            if fundido:
+                request_fundida = {
+                    "custom_id": request_simples["custom_id"],
+                    "body": {
+                        "model": summary_model,
+                        "max_completion_tokens": 3000,
+                        "messages": [{
+                            "role": "user",
+                            "content": montar_prompt_fundido(prompt_template, rating_template, conteudo)
+                        }],
+                        "response_format": RESPONSE_FORMAT
+                    }
+                }
+                fundidos[request_simples["custom_id"]] = (request_fundida, request_simples)
+                requests_list.append(request_fundida)
+                continue
+            
+            requests_list.append(request_simples)
     
-    logger.info(f"Montados {len(requests_list)} requests para batch de sumarização")
+    orcamento = token_budget.estatisticas("summary")
+    aparados = orcamento["aparados"] - orcamento_antes["aparados"]
+    tokens_economizados = orcamento["tokens_economizados"] - orcamento_antes["tokens_economizados"]
+    logger.info(f"Montados {len(requests_list)} requests para batch de sumarização "
+                f"({len(fundidos)} com rating, {aparados} aparados, {tokens_economizados} tokens economizados)")
     
     # 4. Executar batch
     resultados = executar_batch(requests_list, description="summary")
@@ -633,7 +921,29 @@ def batch_summary(feed_profile: str = None):
         return {"total": len(pendentes), "sucesso": 0, "erros": len(pendentes)}
     
     # 5. Processar resultados e atualizar banco
-    stats = {"total": len(pendentes), "sucesso": 0, "erros": 0}
+    stats = {"total": len(pendentes), "sucesso": 0, "erros": 0, "avaliados": 0,
+             "aparados": aparados, "tokens_economizados": tokens_economizados}
+    
+    # Respostas fundidas sem resumo válido (modelo ignorou o JSON, resposta
+    # truncada...) saem do cache de LLM e são refeitas com o prompt de resumo simples
+    sem_resumo = [
+        custom_id for custom_id, resposta in resultados.items()
+        if custom_id in fundidos and not parsear_resposta_fundida(resposta)[0]
+    ]
+    if sem_resumo:
+        logger.warning(f"{len(sem_resumo)} respostas fundidas sem resumo válido, refazendo com o resumo simples")
+        llm_cache.descartar([
+            _registro_cache({"url": "/v1/chat/completions", "body": fundidos[custom_id][0]["body"]})
+            for custom_id in sem_resumo
+        ])
+        resultados_fallback = executar_batch(
+            [fundidos[custom_id][1] for custom_id in sem_resumo],
+            description="summary-fallback"
+        ) or {}
+        for custom_id in sem_resumo:
+            del resultados[custom_id]
+            fundidos.pop(custom_id)
+        resultados.update(resultados_fallback)
     
     for custom_id, resumo in resultados.items():
         # Extrair article_id do custom_id
@@ -648,13 +958,28 @@ def batch_summary(feed_profile: str = None):
             stats["erros"] += 1
             continue
         
+        impact_score = None
+        if custom_id in fundidos:
+            resumo, impact_score = parsear_resposta_fundida(resumo)
+            if not resumo:
+                logger.warning(f"Resposta sem resumo válido para {custom_id}")
+                stats["erros"] += 1
+                continue
+        
         # Salvar resumo (sem embedding por enquanto)
         update_article_processing(article_id, resumo, embedding=None)
         stats["sucesso"] += 1
+        
+        # Sem score válido, o artigo fica para o batch de rating normal
+        if impact_score is not None:
+            update_article_rating(article_id, impact_score)
+            stats["avaliados"] += 1
     
     # Contar erros (artigos sem resposta)
     stats["erros"] += len(pendentes) - len(resultados)
     
+    stats["cache"] = llm_cache.estatisticas(desde=cache_antes)
+    
     logger.info(f"--- Sumarização batch concluída: {stats} ---")
     return stats
 
@@ -678,11 +1003,27 @@ def batch_embedding(feed_profile: str = None):
         return {"total": 0, "sucesso": 0, "erros": 0}
     
     logger.info(f"Encontrados {len(pendentes)} artigos para embedding")
+    cache_antes = embedding_cache.estatisticas()
+    
+    # 2. Resumos já embedados (mesmo texto normalizado e modelo) saem do cache
+    # e não vão para o batch
+    em_cache = embedding_cache.buscar([art['processed_content'] for art in pendentes], config.EMBEDDING_MODEL)
+    do_cache = 0
+    faltando = []
+    for art, embedding in zip(pendentes, em_cache):
+        if embedding:
+            update_article_embedding(art['id'], embedding)
+            do_cache += 1
+        else:
+            faltando.append(art)
+    
+    if do_cache:
+        logger.info(f"{do_cache} embeddings vieram do cache")
     
-    # 2. Montar requests (mesmo modelo para todos)
+    # 3. Montar requests (mesmo modelo para todos)
     requests_list = []
     
-    for art in pendentes:
+    for art in faltando:
         requests_list.append({
             "custom_id": f"{art['feed_profile']}-{art['id']}",
             "body": {
@@ -693,7 +1034,7 @@ def batch_embedding(feed_profile: str = None):
     
     logger.info(f"Montados {len(requests_list)} requests para batch de embedding")
     
-    # 3. Executar batch (endpoint diferente!)
+    # 4. Executar batch (endpoint diferente!)
     resultados = executar_batch(
         requests_list, 
         description="embedding",
@@ -703,10 +1044,16 @@ def batch_embedding(feed_profile: str = None):
     
     if resultados is None:
         logger.error("Falha ao executar batch de embedding")
-        return {"total": len(pendentes), "sucesso": 0, "erros": len(pendentes)}
-    
-    # 4. Processar resultados e atualizar banco
-    stats = {"total": len(pendentes), "sucesso": 0, "erros": 0}
+        return {"total": len(pendentes), "sucesso": do_cache, "erros": len(faltando)}
+    
+    # 5. Processar resultados, atualizar banco e guardar os vetores novos no cache
+    stats = {"total": len(pendentes), "sucesso": do_cache, "erros": 0}
+    textos = {f"{art['feed_profile']}-{art['id']}": art['processed_content'] for art in faltando}
+    embedding_cache.gravar(
+        [textos[custom_id] for custom_id in resultados if custom_id in textos],
+        [embedding for custom_id, embedding in resultados.items() if custom_id in textos],
+        config.EMBEDDING_MODEL
+    )
     
     for custom_id, embedding in resultados.items():
         # Extrair article_id do custom_id
@@ -726,7 +1073,8 @@ def batch_embedding(feed_profile: str = None):
         stats["sucesso"] += 1
     
     # Contar erros (artigos sem resposta)
-    stats["erros"] += len(pendentes) - len(resultados)
+    stats["erros"] += len(faltando) - len(resultados)
+    stats["cache"] = embedding_cache.estatisticas(desde=cache_antes)
     
     logger.info(f"--- Embedding batch concluído: {stats} ---")
     return stats
@@ -744,6 +1092,7 @@ def batch_rating(feed_profile: str = None):
     from database import get_articles_pending_rating, update_article_rating
     
     logger.info(f"--- [BATCH] Iniciando rating [{feed_profile or 'TODOS'}] ---")
+    cache_antes = llm_cache.estatisticas()
     
     # 1. Buscar artigos pendentes
     pendentes = get_articles_pending_rating(feed_profile)
@@ -832,11 +1181,29 @@ def batch_rating(feed_profile: str = None):
     # Contar erros (artigos sem resposta)
     stats["erros"] += len(pendentes) - len(resultados)
     
+    stats["cache"] = llm_cache.estatisticas(desde=cache_antes)
+    
     logger.info(f"--- Rating batch concluído: {stats} ---")
     return stats
 
 
 
+def montar_registro_feeds(configs_por_feed: dict) -> dict:
+    """
+    Registro de feeds da execução: {feed_url: [perfis que o assinam]}.
+    
+    URLs repetidas (no mesmo perfil ou em perfis diferentes) aparecem uma vez,
+    na ordem em que surgem nas configs.
+    """
+    registro = {}
+    for feed_name, (_, rss_feeds) in configs_por_feed.items():
+        for url in rss_feeds:
+            perfis = registro.setdefault(url, [])
+            if feed_name not in perfis:
+                perfis.append(feed_name)
+    return registro
+
+
 def executar_pipeline_batch():
     """
     Executa o pipeline completo de preparação de artigos via Batch API.
@@ -846,13 +1213,16 @@ def executar_pipeline_batch():
     1. Coleta metadados do RSS (loop por cada feed)
     2. Filtra artigos via batch (todos juntos)
     3. Busca conteúdo dos aprovados (todos juntos)
-    4a. Sumariza via batch (todos juntos, prompts específicos por feed)
+    4a. Sumariza via batch (todos juntos, prompts específicos por feed; feeds
+        com FUSED_SUMMARY_RATING já recebem o impact_score aqui)
     4b. Gera embeddings via batch (todos juntos)
-    5. Avalia impacto via batch (todos juntos, prompts específicos por feed)
+    5. Avalia impacto via batch (só o que ainda não tem score; sem pendentes,
+       nenhum batch é enviado)
     
     Após isso, os artigos estão prontos para gerar briefing.
     """
     import importlib
+    from feed_fetcher import buscar_feeds, feeds_devidos, registrar_estado_feeds, resumo_feeds
     
     logger.info(f"{'='*60}")
     logger.info(f"PIPELINE BATCH - TODOS OS FEEDS")
@@ -867,24 +1237,56 @@ def executar_pipeline_batch():
     total_novos = 0
     novos_por_feed = {}
     
+    # Carrega as configs primeiro para baixar os feeds de todos os perfis de uma vez
+    configs_por_feed = {}
     for feed_name in feeds_ativos:
         try:
             feed_config = importlib.import_module(f"feeds.{feed_name}")
-            rss_feeds = getattr(feed_config, 'RSS_FEEDS', [])
-            
-            if not rss_feeds:
-                logger.warning(f"  {feed_name}: Nenhum RSS_FEEDS definido")
-                continue
-            
-            novos = scrape_metadata_only(feed_name, rss_feeds, feed_config)
-            novos_por_feed[feed_name] = novos
-            total_novos += novos
-            
         except ImportError as e:
             logger.error(f"  {feed_name}: Erro ao carregar config - {e}")
+            continue
+        
+        rss_feeds = getattr(feed_config, 'RSS_FEEDS', [])
+        if not rss_feeds:
+            logger.warning(f"  {feed_name}: Nenhum RSS_FEEDS definido")
+            continue
+        
+        configs_por_feed[feed_name] = (feed_config, rss_feeds)
+    
+    # Registro da execução: cada URL de feed é baixada e parseada uma vez e
+    # suas entradas são oferecidas a todos os perfis que a assinam
+    registro = montar_registro_feeds(configs_por_feed)
+    compartilhados = {url: perfis for url, perfis in registro.items() if len(perfis) > 1}
+    logger.info(f"Registro de feeds: {len(registro)} URLs distintas, {len(compartilhados)} compartilhadas entre perfis")
+    for url, perfis in compartilhados.items():
+        logger.info(f"  {url}: {perfis}")
+    
+    # Agenda adaptativa: só busca os feeds que já estão na hora
+    devidos, adiados = feeds_devidos(list(registro))
+    devidos_set = set(devidos)
+    feeds_baixados = buscar_feeds(devidos)
+    
+    # URLs canônicas já tratadas na execução, compartilhadas entre os perfis.
+    # Como Article.url é único, a entrada fica com o primeiro perfil que a aceita.
+    urls_vistas = set()
+    
+    for feed_name, (feed_config, rss_feeds) in configs_por_feed.items():
+        rss_devidos = [url for url in rss_feeds if url in devidos_set]
+        if not rss_devidos:
+            logger.info(f"  {feed_name}: nenhum feed devido nesta execução")
+            novos_por_feed[feed_name] = 0
+            continue
+        novos = scrape_metadata_only(feed_name, rss_devidos, feed_config, feeds_baixados, urls_vistas)
+        novos_por_feed[feed_name] = novos
+        total_novos += novos
+    
+    registrar_estado_feeds(feeds_baixados)
+    stats_feeds = resumo_feeds(feeds_baixados)
+    stats_feeds["adiados"] = len(adiados)
     
     logger.info(f"Fase 1 concluída: {total_novos} novos artigos")
     logger.info(f"  Por feed: {novos_por_feed}")
+    logger.info(f"  Feeds RSS: {stats_feeds}")
     
     # Fase 2: Filtrar via batch (todos os feeds juntos)
     logger.info(f"\n>>> FASE 2: Filtro batch <<<")
@@ -919,6 +1321,7 @@ def executar_pipeline_batch():
         "feeds_processados": feeds_ativos,
         "novos_artigos": total_novos,
         "novos_por_feed": novos_por_feed,
+        "feeds": stats_feeds,
         "filter": stats_filter,
         "content": stats_content,
         "summary": stats_summary,
@@ -1004,22 +1407,15 @@ def montar_requests_analise_clusters(clusters: dict, feed_profile: str) -> list:
         
         cluster_summaries_text = "\n\n".join(summaries)
         
-        # Formatar prompt
-        prompt = prompt_template.format(
-            cluster_summaries_text=cluster_summaries_text,
-            feed_profile=feed_profile
-        )
-        
-        # Montar request no formato Anthropic Batch
+        # Montar request no formato Anthropic Batch: instruções do template no
+        # system (igual para o feed inteiro, cacheado), resumos na mensagem
         request = {
             "custom_id": f"{feed_profile}-cluster-{label}",
-            "params": {
-                "model": cluster_model,
-                "max_tokens": 2024,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
+            "params": params_anthropic(
+                cluster_model, 2024, prompt_template,
+                "cluster_summaries_text", cluster_summaries_text,
+                feed_profile=feed_profile
+            )
         }
         
         requests.append(request)
@@ -1064,22 +1460,14 @@ def montar_request_sintese_briefing(
         cluster_analyses_text += f"--- Cluster {label + 1} ({len(artigos)} artigos) ---\n"
         cluster_analyses_text += f"Análise: {analise}\n\n"
     
-    # Formatar prompt
-    prompt = prompt_template.format(
-        cluster_analyses_text=cluster_analyses_text,
-        feed_profile=feed_profile
-    )
-    
-    # Montar request
+    # Montar request (instruções do template no system cacheado, análises na mensagem)
     request = {
         "custom_id": f"{feed_profile}-sintese",
-        "params": {
-            "model": brief_model,
-            "max_tokens": 20096,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
+        "params": params_anthropic(
+            brief_model, 20096, prompt_template,
+            "cluster_analyses_text", cluster_analyses_text,
+            feed_profile=feed_profile
+        )
     }
     
     logger.info(f"  Request de síntese montado para {feed_profile} ({len(clusters)} clusters)")
@@ -1101,6 +1489,7 @@ def batch_weekly_briefing(feed_profile: str = None):
     logger.info(f"{'='*60}")
     logger.info(f"BRIEFING SEMANAL - {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     logger.info(f"{'='*60}")
+    cache_antes = llm_cache.estatisticas()
     
     # Determinar feeds a processar
     if feed_profile:
@@ -1280,5 +1669,6 @@ def batch_weekly_briefing(feed_profile: str = None):
         "status": "sucesso",
         "batch_analise": batch_id_analise,
         "batch_sintese": batch_id_sintese,
-        "briefings": briefings_salvos
+        "briefings": briefings_salvos,
+        "cache": llm_cache.estatisticas(desde=cache_antes)
     }
\ No newline at end of file
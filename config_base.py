@@ -75,6 +75,28 @@ N_CLUSTERS = 10  # Example, adjust as needed
 
 # --- Filtering Settings ---
 MIN_INITIAL_FILTER_SCORE = 3
+# Packed filter: score up to FILTER_PACK_SIZE RSS snippets per LLM call
+# (JSON answer keyed by article id, per-item fallback on parse failure)
+FILTER_PACKED_ENABLED = True
+FILTER_PACK_SIZE = 20
+
+# Local pre-filter: TF-IDF + logistic regression per feed profile, trained
+# offline on past LLM filter scores (run_briefing.py --train-prefilter).
+# Snippets it is confident about skip the LLM filter; it only acts on a
+# profile once a model was trained and reached PREFILTER_MIN_PRECISION on
+# held-out labels.
+PREFILTER_ENABLED = True
+PREFILTER_MODEL_DIR = os.getenv("PREFILTER_MODEL_DIR", "data/prefilter")
+PREFILTER_MIN_LABELS = 500        # labelled snippets needed to train a profile
+PREFILTER_MIN_PRECISION = 0.95    # on the held-out split, for each side
+PREFILTER_MIN_SUPPORT = 20        # held-out snippets a threshold must cover
+PREFILTER_REJECT_SCORE = 1        # initial_filter_score written for auto-rejects
+PREFILTER_ACCEPT_SCORE = 4        # ... and for auto-accepts
+
+# Fused summary + rating: one call returns JSON with the summary and the
+# impact score (sync process_articles and batch phase 4a; batch phase 5 then
+# only rates what is left). Usually enabled per feed profile.
+FUSED_SUMMARY_RATING = False
 
 # --- Newsletter ---
 MIN_SCORE_NEWSLETTER = 5
@@ -91,6 +113,112 @@ MANUALLY_ADDED_PROFILE_NAME = 'manual'
 SCRAPING_MAX_AGE_DAYS_INITIAL = 7
 SCRAPING_MAX_AGE_DAYS_NORMAL = 3
 
+# --- Feed Fetching ---
+# Feeds are downloaded concurrently before the per-entry logic runs
+FEED_FETCH_MAX_WORKERS = 8
+FEED_FETCH_PER_HOST_LIMIT = 2  # Simultaneous requests to the same host
+FEED_FETCH_TIMEOUT = 30  # Seconds, per feed
+FEED_CONNECT_TIMEOUT = 5
+FEED_READ_TIMEOUT = 15
+FEED_MAX_BYTES = 10 * 1024 * 1024
+
+# Circuit breaker: feeds that fail repeatedly (or are too slow) are skipped
+# for a cooling-off period that doubles on every new failure
+FEED_CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures before skipping
+FEED_CIRCUIT_COOLDOWN_MINUTES = 60
+FEED_CIRCUIT_MAX_COOLDOWN_MINUTES = 24 * 60
+FEED_CIRCUIT_SLOW_SECONDS = 20  # Average latency that also opens the circuit
+
+# Adaptive polling: each feed is only fetched when due, based on how often it
+# publishes (interval * factor, clamped), its <ttl> and its <skipHours>
+FEED_ADAPTIVE_POLLING = True
+FEED_POLL_INTERVAL_FACTOR = 0.5
+FEED_POLL_MIN_MINUTES = 15
+FEED_POLL_MAX_MINUTES = 12 * 60
+
+# In-memory Bloom filter of every stored article URL (topped up with rows
+# written since, by any process): entries it has never seen skip the database
+# lookup; possible matches are confirmed there.
+URL_BLOOM_FILTER_ENABLED = True
+URL_BLOOM_FILTER_ERROR_RATE = 1e-6
+
+# --- HTTP Client (article fetching) ---
+HTTP_POOL_CONNECTIONS = 32  # Number of hosts with a pooled connection kept per thread
+HTTP_POOL_MAXSIZE = 8  # Keep-alive connections kept per host
+HTTP_RETRIES = 2  # Retries on connection errors and 429/5xx responses
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 20
+HTTP_MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+
+# Adaptive routing: domains where Marreta keeps failing but the origin works
+# are fetched from the origin first (Marreta becomes the fallback)
+DOMAIN_ROUTING_ENABLED = True
+DOMAIN_ROUTING_MIN_SAMPLES = 5  # Attempts per path before trusting the stats
+DOMAIN_ROUTING_EXPLORE_RATE = 0.1  # Share of fetches that still try Marreta first
+
+# Hedged fetch: if Marreta hasn't answered after HEDGED_FETCH_DELAY seconds,
+# request the original URL in parallel and keep the first usable response
+HEDGED_FETCH_ENABLED = False
+HEDGED_FETCH_DELAY = 3.0
+
+# Raw HTML cache on local disk (zstd-compressed, keyed by URL hash)
+HTML_CACHE_ENABLED = True
+HTML_CACHE_DIR = os.getenv("HTML_CACHE_DIR", "data/html_cache")
+HTML_CACHE_TTL_HOURS = 72
+HTML_CACHE_MAX_MB = 500
+
+# --- Content Fetching (batch phase 3 and sync scraper) ---
+CONTENT_FETCH_MAX_WORKERS = 8
+CONTENT_FETCH_DOMAIN_RATE = 0.5  # Requests per second to the same publisher domain
+CONTENT_FETCH_DOMAIN_BURST = 2
+# HTML->content extraction runs in separate processes (0 = inline, in the consumer)
+CONTENT_EXTRACT_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+CONTENT_PIPELINE_QUEUE_SIZE = 32  # Downloaded pages waiting for extraction
+
+# --- Sync LLM calls (process_articles / rate_articles) ---
+LLM_MAX_IN_FLIGHT = 8  # Concurrent requests per stage
+# Requests and tokens per minute per model (exact name or prefix)
+LLM_RATE_LIMITS = {
+    "gpt-5-mini": (500, 500_000),
+    "gpt-5": (500, 500_000),
+    "gpt-4o-mini": (500, 200_000),
+    "claude": (50, 40_000),
+    "text-embedding": (3_000, 1_000_000),
+}
+LLM_DEFAULT_RPM = 60
+LLM_DEFAULT_TPM = 60_000
+# The limits above are only the starting point: each response's rate-limit
+# headers (limit, remaining, reset) resize the limiter, keeping this share of
+# the limit in reserve; a 429 pauses the model for the Retry-After time
+LLM_RATE_LIMIT_HEADROOM = 0.05
+LLM_RATE_LIMIT_BACKOFF_SECONDS = 10  # Pause after a 429 without Retry-After/reset headers
+# Sync embeddings: summaries are sent in groups, one request per group
+EMBEDDING_BATCH_MAX_ITEMS = 100
+EMBEDDING_BATCH_MAX_TOKENS = 100_000
+# Embedding cache (embedding_cache table), keyed by normalized text and model
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+
+# Input token budget per stage: article text above it is trimmed at a
+# sentence boundary (token_budget.py; exact counts if tiktoken is installed)
+TOKEN_BUDGETS = {
+    "summary": 1_000,  # Was raw_content[:4000] characters
+    "newsletter": 6_000,
+}
+
+# Anthropic prompt caching: static template instructions are sent as a
+# system block marked with cache_control (cluster analysis, brief synthesis,
+# newsletter) when they reach the ~1024-token cacheable minimum; shorter
+# templates are sent whole in the user message, as before
+ANTHROPIC_PROMPT_CACHING = True
+
+# Persistent LLM response cache (llm_cache table), keyed by provider, model,
+# parameters and prompt hash. Used by call_llm and the batch senders.
+LLM_CACHE_ENABLED = True
+LLM_CACHE_TTL_DAYS = 30
+LLM_CACHE_MAX_MB = 200
+
 # --- Other ---
 DATABASE_FILE = "meridian.db"  # Keep for backward compatibility
 
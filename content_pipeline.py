@@ -0,0 +1,201 @@
+"""
+Busca de conteúdo em dois estágios: rede e extração separadas.
+
+Os downloads rodam em um pool de threads (I/O) e entregam o HTML numa fila
+limitada; a extração HTML→conteúdo (trafilatura/lxml, CPU-bound) roda num
+ProcessPoolExecutor. Assim a extração escala com os núcleos enquanto a rede
+continua saturada, e a fila limitada impede que HTML baixado se acumule na
+memória quando a extração fica para trás.
+
+Com um LimitadorPorDominio, os itens ficam numa fila por domínio e só vão
+para o pool de threads quando o bucket do domínio libera; as threads nunca
+dormem esperando um host, então um publisher com muitos artigos não ocupa
+o pool enquanto os outros domínios esperam.
+"""
+
+import logging, multiprocessing, queue, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+
+import config_base as config
+from rate_limit import dominio
+from utils import baixar_html, extrair_pagina
+
+logger = logging.getLogger(__name__)
+
+_FIM = object()
+
+RESULTADO_VAZIO = {'content': None, 'formatted': None, 'og_image': None, 'title': None, 'canonical_url': None}
+
+
+def _contexto_processos():
+    """
+    Contexto dos processos de extração. Nunca "fork": o processo principal já
+    tem threads (downloads, pools HTTP, logging) que podem estar segurando
+    locks no momento do fork, e o filho herdaria esses locks travados.
+    """
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+class _ExecutorInline:
+    """Executor síncrono usado quando CONTENT_EXTRACT_PROCESSES = 0."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def buscar_e_extrair(
+    itens: list,
+    obter_urls,
+    antes_de_baixar=None,
+    limitador=None,
+    max_workers: int = None,
+    processos: int = None,
+    tamanho_fila: int = None
+):
+    """
+    Baixa e extrai o conteúdo de vários artigos, entregando os resultados
+    conforme ficam prontos (ordem não garantida).
+
+    Args:
+        itens: objetos quaisquer (dicts de artigo, candidatos do scraper...)
+        obter_urls: item -> (url, url_encoded)
+        antes_de_baixar: callback opcional item -> None, chamado na thread de
+            I/O antes do download (log)
+        limitador: LimitadorPorDominio opcional; cada download espera o
+            bucket do seu domínio na fila do domínio, fora do pool de threads
+        max_workers: threads de download (padrão CONTENT_FETCH_MAX_WORKERS)
+        processos: processos de extração (padrão CONTENT_EXTRACT_PROCESSES; 0 = inline)
+        tamanho_fila: HTMLs baixados aguardando extração (padrão CONTENT_PIPELINE_QUEUE_SIZE)
+
+    Yields:
+        tuple: (item, resultado, marreta, erro) — resultado no formato de
+        extrair_pagina; erro é None ou a exceção do download/extração.
+    """
+    max_workers = max_workers or config.CONTENT_FETCH_MAX_WORKERS
+    processos = config.CONTENT_EXTRACT_PROCESSES if processos is None else processos
+    tamanho_fila = tamanho_fila or config.CONTENT_PIPELINE_QUEUE_SIZE
+
+    if not itens:
+        return
+
+    fila = queue.Queue(maxsize=tamanho_fila)
+    cancelado = threading.Event()
+
+    def _entregar(mensagem):
+        # put bloqueia quando a fila está cheia: backpressure sobre a rede.
+        # O timeout permite abandonar a entrega se o consumidor desistiu.
+        while not cancelado.is_set():
+            try:
+                fila.put(mensagem, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # Uma vaga por thread: só sai da fila do domínio o que uma thread vai baixar logo
+    vagas = threading.Semaphore(max_workers)
+
+    def _baixar(item):
+        try:
+            if cancelado.is_set():
+                return
+            if antes_de_baixar:
+                antes_de_baixar(item)
+            url, url_encoded = obter_urls(item)
+            html_content, marreta = baixar_html(url, url_encoded)
+            _entregar((item, url, html_content, marreta, None))
+        except Exception as e:
+            _entregar((item, None, None, False, e))
+        finally:
+            vagas.release()
+
+    falha_produtor = []  # exceção do produtor, relançada no consumidor
+
+    def _produtor():
+        try:
+            # Fila por domínio, percorridas em rodízio; um domínio sem token é
+            # pulado (e o item volta na próxima rodada) em vez de ocupar uma thread
+            filas = {}
+            for item in itens:
+                url = obter_urls(item)[0]
+                filas.setdefault(dominio(url or ""), deque()).append((url, item))
+
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conteudo") as io_pool:
+                while filas and not cancelado.is_set():
+                    menor_espera, enviou = None, False
+                    for chave in list(filas):
+                        url, item = filas[chave][0]
+                        espera = limitador.tentar_adquirir(url) if limitador and url else 0.0
+                        if espera > 0:
+                            menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+                            continue
+                        filas[chave].popleft()
+                        if not filas[chave]:
+                            del filas[chave]
+                        vagas.acquire()
+                        io_pool.submit(_baixar, item)
+                        enviou = True
+                    # Rodada sem nenhum envio: todos os domínios estão sem token
+                    if not enviou and menor_espera is not None:
+                        cancelado.wait(menor_espera)
+        except Exception as e:
+            falha_produtor.append(e)
+        finally:
+            # Sempre sinaliza o fim, senão o consumidor esperaria para sempre
+            _entregar(_FIM)
+
+    cpu_pool = (
+        ProcessPoolExecutor(max_workers=processos, mp_context=_contexto_processos())
+        if processos > 0 else _ExecutorInline()
+    )
+    threading.Thread(target=_produtor, name="conteudo-produtor", daemon=True).start()
+
+    limite_em_voo = max(processos, 1) * 2
+    em_voo = {}
+    terminou = False
+
+    try:
+        while not terminou or em_voo:
+            # Consome a fila enquanto houver espaço no pool de extração
+            while not terminou and len(em_voo) < limite_em_voo:
+                try:
+                    mensagem = fila.get(timeout=0.05 if em_voo else 1)
+                except queue.Empty:
+                    break
+
+                if mensagem is _FIM:
+                    if falha_produtor:
+                        raise falha_produtor[0]
+                    terminou = True
+                    break
+
+                item, url, html_content, marreta, erro = mensagem
+                if erro is not None or html_content is None:
+                    yield item, dict(RESULTADO_VAZIO), marreta, erro
+                    continue
+
+                em_voo[cpu_pool.submit(extrair_pagina, html_content, url)] = (item, marreta)
+
+            if not em_voo:
+                continue
+
+            prontos, _ = wait(list(em_voo), timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in prontos:
+                item, marreta = em_voo.pop(future)
+                try:
+                    yield item, future.result(), marreta, None
+                except Exception as e:
+                    logger.warning(f"Erro na extração de conteúdo: {e}")
+                    yield item, dict(RESULTADO_VAZIO), marreta, e
+    finally:
+        cancelado.set()
+        cpu_pool.shutdown(wait=False, cancel_futures=True)
@@ -5,20 +5,32 @@ This replaces the SQLite-based database.py with modern SQLModel operations.
 
 import json, logging
 from datetime import datetime, date, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import and_, asc, desc, func, or_, select
-from sqlalchemy import text
+from sqlalchemy import delete, text
 
 import config_base as config
-from models import Article, Brief, Newsletter
+from models import Article, Brief, Newsletter, FeedState, DomainStats, LLMCache, EmbeddingCache
 from db import get_db_connection
 
 logger = logging.getLogger(__name__)
 
 ARTICLES_PER_PAGE_DEFAULT = 25
 
+# Tamanho máximo da lista em cada consulta IN
+URL_LOOKUP_CHUNK_SIZE = 500
+
+# Filtro de Bloom das URLs recentes, carregado sob demanda em get_existing_urls
+_url_bloom = None
+_url_bloom_ultimo_id = 0  # maior Article.id já colocado no filtro
+_url_bloom_total = 0
+_url_bloom_capacidade = 0
+# Ids abaixo do último visto relidos a cada atualização: no Postgres, uma
+# transação concorrente pode gravar um id menor depois de um maior ser visto
+_URL_BLOOM_SOBREPOSICAO_IDS = 1000
+
 def get_unrated_articles(
     feed_profile: str, limit: int = 50
 ) -> List[Dict[str, Any]]:
@@ -306,9 +318,13 @@ def add_article(
     marreta: bool = False,
     briefing_analyzed: bool = False,
     formatted_content: Optional[str] = None,
-    rss_description: Optional[str] = None
+    rss_description: Optional[str] = None,
+    filter_source: Optional[str] = None
 ) -> Optional[int]:
     """Adds a new article with optional image URL."""
+    from utils import canonicalizar_url
+    canonical_url = canonicalizar_url(url)
+
     with get_db_connection() as session:
         try:
             # Ensure Postgres sequence is in sync to avoid duplicate primary key errors
@@ -327,6 +343,7 @@ def add_article(
 
             article = Article(
                 url=url,
+                canonical_url=canonical_url,
                 title=title,
                 published_date=published_date,
                 feed_source=feed_source,
@@ -336,6 +353,7 @@ def add_article(
                 feed_profile=feed_profile,
                 fetched_at=datetime.now(),
                 initial_filter_score=initial_filter_score,
+                filter_source=filter_source,
                 url_encoding=url_encoding,
                 marreta=marreta,
                 briefing_analyzed=briefing_analyzed,
@@ -344,6 +362,8 @@ def add_article(
             session.add(article)
             session.commit()
             session.refresh(article)  # Get the ID
+            if _url_bloom is not None:
+                _url_bloom.add(canonical_url)
             print(f"Added article [{feed_profile}]: {title}")
             return article.id
         except IntegrityError:
@@ -351,6 +371,102 @@ def add_article(
             return None
 
 
+def _get_url_bloom():
+    """
+    Filtro de Bloom com as URLs canônicas de todos os artigos da tabela.
+
+    Carregado uma vez por processo; a cada chamada recebe as linhas gravadas
+    depois (Article.id maior que o último visto), inclusive por outros
+    processos, para que um negativo continue valendo para a tabela inteira.
+    Quando passa da capacidade, é recarregado do zero.
+    """
+    from utils import BloomFilter, canonicalizar_url
+    global _url_bloom, _url_bloom_ultimo_id, _url_bloom_total, _url_bloom_capacidade
+
+    if not config.URL_BLOOM_FILTER_ENABLED:
+        return None
+
+    with get_db_connection() as session:
+        if _url_bloom is None:
+            total = session.exec(select(func.count(Article.id))).one()
+            # Folga para as URLs adicionadas depois da carga
+            _url_bloom_capacidade = max(total * 2, 10000)
+            _url_bloom = BloomFilter(_url_bloom_capacidade, config.URL_BLOOM_FILTER_ERROR_RATE)
+            _url_bloom_ultimo_id, _url_bloom_total = 0, 0
+            carga_inicial = True
+        else:
+            carga_inicial = False
+
+        linhas = session.exec(
+            select(Article.id, Article.url, Article.canonical_url)
+            .where(Article.id > _url_bloom_ultimo_id - _URL_BLOOM_SOBREPOSICAO_IDS)  # type: ignore
+            .order_by(Article.id)                       # type: ignore
+        ).all()
+
+    for id_, url, canonical_url in linhas:
+        # Linhas ainda sem backfill são canonicalizadas aqui
+        _url_bloom.add(canonical_url or canonicalizar_url(url))
+        if id_ > _url_bloom_ultimo_id:
+            _url_bloom_ultimo_id = id_
+            _url_bloom_total += 1
+
+    if carga_inicial:
+        logger.info(f"Filtro de Bloom carregado com {_url_bloom_total} URLs")
+    elif _url_bloom_total > _url_bloom_capacidade:
+        _url_bloom = None
+        return _get_url_bloom()
+    return _url_bloom
+
+
+def get_existing_urls(urls: List[str], use_bloom: bool = True) -> Set[str]:
+    """
+    Retorna o subconjunto de `urls` que já existe na tabela de artigos, seja
+    pela URL exata ou pela URL canônica (utils.canonicalizar_url).
+
+    Faz uma consulta IN por lote em vez de uma consulta por URL. Com o filtro
+    de Bloom ativo (todas as linhas da tabela, ver _get_url_bloom), só as URLs
+    que ele reconhece vão ao banco: o filtro não tem falsos negativos, e um
+    positivo pode ser falso, então é confirmado pela consulta.
+    """
+    from utils import canonicalizar_url
+
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return set()
+
+    canonicas = {u: canonicalizar_url(u) for u in urls}
+    existentes: Set[str] = set()
+    bloom = _get_url_bloom() if use_bloom else None
+
+    if bloom is not None:
+        # Negativos do filtro são novos sem consulta; só os prováveis existentes vão ao banco
+        urls = [u for u in urls if canonicas[u] in bloom]
+
+    if urls:
+        with get_db_connection() as session:
+            for i in range(0, len(urls), URL_LOOKUP_CHUNK_SIZE):
+                chunk = urls[i:i + URL_LOOKUP_CHUNK_SIZE]
+                chunk_canonicas = list({canonicas[u] for u in chunk})
+                encontrados = session.exec(
+                    select(Article.url, Article.canonical_url).where(
+                        or_(
+                            Article.url.in_(chunk),                         # type: ignore
+                            Article.canonical_url.in_(chunk_canonicas)      # type: ignore
+                        )
+                    )
+                ).all()
+
+                urls_encontradas = {url for url, _ in encontrados}
+                canonicas_encontradas = {c for _, c in encontrados if c}
+                for url in chunk:
+                    if url in urls_encontradas or canonicas[url] in canonicas_encontradas:
+                        existentes.add(url)
+                        if bloom is not None:
+                            bloom.add(canonicas[url])
+
+    return existentes
+
+
 def get_unprocessed_articles(
     feed_profile: str, limit: int = 50
 ) -> List[Dict[str, Any]]:
@@ -548,17 +664,50 @@ def get_distinct_feed_profiles(table: str = "articles") -> List[str]:
         return list(result)
 
 
-def update_article_filter_score(article_id: int, score: int) -> None:
-    """Atualiza o initial_filter_score de um artigo."""
+def update_article_filter_score(article_id: int, score: int, source: Optional[str] = None) -> None:
+    """Atualiza o initial_filter_score de um artigo (e a origem do score, ver Article.filter_source)."""
     with get_db_connection() as session:
         statement = select(Article).where(Article.id == article_id)
         article = session.exec(statement).first()
         if article:
             article.initial_filter_score = score
+            article.filter_source = source
             session.add(article)
             session.commit()
 
 
+def get_filter_labels(feed_profile: str) -> List[Dict[str, Any]]:
+    """
+    Snippets já avaliados pelo filtro inicial do LLM, para treinar o pré-filtro local.
+
+    Usa os scores com filter_source='llm' e, dos artigos anteriores à coluna
+    (filter_source NULL), só os scores 2-5: o score 1 antigo também era gravado
+    em rejeições por conteúdo (curto, truncado, paywall, falha no resumo) e não
+    diz nada sobre o snippet.
+    """
+    with get_db_connection() as session:
+        statement = select(
+            Article.title, Article.rss_description, Article.initial_filter_score
+        ).where(
+            and_(
+                Article.feed_profile == feed_profile,
+                Article.initial_filter_score.is_not(None),      # type: ignore
+                or_(
+                    Article.filter_source == "llm",
+                    and_(
+                        Article.filter_source.is_(None),        # type: ignore
+                        Article.initial_filter_score > 1        # type: ignore
+                    )
+                )
+            )
+        )
+        rows = session.exec(statement).all()
+        return [
+            {"title": title, "rss_description": description, "initial_filter_score": score}
+            for title, description, score in rows
+        ]
+
+
 def get_approved_articles_without_content(feed_profile: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
     """
     Busca artigos aprovados no filtro (score >= 3) mas sem raw_content.
@@ -896,6 +1045,298 @@ def mark_articles_newsletter_deduplicated(article_ids: List[int]) -> int:
         logger.info(f"Marcados {count} artigos como deduplicados para newsletter")
 
 
+FEED_STATE_HEALTH_FIELDS = (
+    "consecutive_failures", "total_failures", "avg_latency_ms",
+    "last_latency_ms", "last_error", "circuit_open_until",
+)
+
+FEED_STATE_SCHEDULE_FIELDS = ("publish_interval_minutes", "feed_ttl_minutes", "next_check_at")
+
+
+def get_feed_states(feed_urls: List[str], feed_profile: str = "*") -> Dict[str, Dict[str, Any]]:
+    """
+    Busca o estado HTTP salvo (ETag, Last-Modified, IDs vistos) de vários feeds
+    para um perfil ('*' = pipeline de todos os perfis).
+    """
+    if not feed_urls:
+        return {}
+
+    with get_db_connection() as session:
+        statement = select(FeedState).where(
+            FeedState.feed_profile == feed_profile,
+            FeedState.feed_url.in_(feed_urls)  # type: ignore
+        )
+        states = session.exec(statement).all()
+
+        resultado = {}
+        for state in states:
+            resultado[state.feed_url] = {
+                "etag": state.etag,
+                "last_modified": state.last_modified,
+                "last_status": state.last_status,
+                "last_entry_ids": json.loads(state.last_entry_ids) if state.last_entry_ids else [],
+                "last_fetched_at": state.last_fetched_at,
+                "consecutive_failures": state.consecutive_failures,
+                "total_failures": state.total_failures,
+                "avg_latency_ms": state.avg_latency_ms,
+                "last_latency_ms": state.last_latency_ms,
+                "last_error": state.last_error,
+                "circuit_open_until": state.circuit_open_until,
+                "publish_interval_minutes": state.publish_interval_minutes,
+                "feed_ttl_minutes": state.feed_ttl_minutes,
+                "skip_hours": json.loads(state.skip_hours) if state.skip_hours else [],
+                "next_check_at": state.next_check_at,
+            }
+        return resultado
+
+
+def save_feed_states(states: Dict[str, Dict[str, Any]], feed_profile: str = "*") -> None:
+    """
+    Salva (insere ou atualiza) o estado HTTP de vários feeds de um perfil em
+    uma transação.
+
+    Chaves aceitas por feed: etag, last_modified, last_status, last_entry_ids
+    e as de saúde/agenda (FEED_STATE_HEALTH_FIELDS, FEED_STATE_SCHEDULE_FIELDS,
+    skip_hours). Chaves ausentes mantêm o valor anterior.
+    """
+    if not states:
+        return
+
+    with get_db_connection() as session:
+        statement = select(FeedState).where(
+            FeedState.feed_profile == feed_profile,
+            FeedState.feed_url.in_(list(states))  # type: ignore
+        )
+        existentes = {s.feed_url: s for s in session.exec(statement).all()}
+
+        for feed_url, dados in states.items():
+            state = existentes.get(feed_url) or FeedState(feed_profile=feed_profile, feed_url=feed_url)
+
+            if "etag" in dados:
+                state.etag = dados["etag"]
+            if "last_modified" in dados:
+                state.last_modified = dados["last_modified"]
+            if "last_status" in dados:
+                state.last_status = dados["last_status"]
+            if "last_entry_ids" in dados:
+                state.last_entry_ids = json.dumps(dados["last_entry_ids"])
+            if "skip_hours" in dados:
+                state.skip_hours = json.dumps(dados["skip_hours"])
+            for campo in FEED_STATE_HEALTH_FIELDS + FEED_STATE_SCHEDULE_FIELDS:
+                if campo in dados:
+                    setattr(state, campo, dados[campo])
+            state.last_fetched_at = datetime.now()
+
+            session.add(state)
+
+        session.commit()
+
+
+DOMAIN_STATS_FIELDS = (
+    "marreta_ok", "marreta_homepage", "marreta_error", "origin_ok",
+    "origin_error", "content_short", "paywall", "origin_rejected",
+    "marreta_rejected",
+)
+
+
+def get_domain_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores de resultado da busca de conteúdo de todos os domínios."""
+    with get_db_connection() as session:
+        return {
+            stats.domain: {campo: getattr(stats, campo) for campo in DOMAIN_STATS_FIELDS}
+            for stats in session.exec(select(DomainStats)).all()
+        }
+
+
+def add_domain_stats(deltas: Dict[str, Dict[str, int]]) -> None:
+    """Soma incrementos aos contadores por domínio (cria o domínio se não existir)."""
+    if not deltas:
+        return
+
+    with get_db_connection() as session:
+        statement = select(DomainStats).where(DomainStats.domain.in_(list(deltas)))  # type: ignore
+        existentes = {s.domain: s for s in session.exec(statement).all()}
+
+        for domain, contadores in deltas.items():
+            stats = existentes.get(domain) or DomainStats(domain=domain)
+            for campo, valor in contadores.items():
+                if campo in DOMAIN_STATS_FIELDS:
+                    setattr(stats, campo, (getattr(stats, campo) or 0) + valor)
+            stats.updated_at = datetime.now()
+            session.add(stats)
+
+        session.commit()
+
+
+def get_llm_cache(chaves: List[str], validade: datetime) -> Dict[str, str]:
+    """
+    Respostas em cache para as chaves dadas, criadas depois de `validade`.
+    Marca as encontradas como usadas (hits, last_used_at).
+    """
+    if not chaves:
+        return {}
+
+    resultado = {}
+    agora = datetime.now()
+    with get_db_connection() as session:
+        for i in range(0, len(chaves), URL_LOOKUP_CHUNK_SIZE):
+            chunk = chaves[i:i + URL_LOOKUP_CHUNK_SIZE]
+            statement = select(LLMCache).where(
+                and_(
+                    LLMCache.cache_key.in_(chunk),  # type: ignore
+                    LLMCache.created_at >= validade,
+                )
+            )
+            for registro in session.exec(statement).all():
+                resultado[registro.cache_key] = registro.response
+                registro.hits += 1
+                registro.last_used_at = agora
+                session.add(registro)
+        session.commit()
+    return resultado
+
+
+def put_llm_cache(registros: List[Dict[str, Any]]) -> None:
+    """
+    Grava (ou substitui) respostas no cache de LLM. Cada registro tem
+    cache_key, provider, model, prompt_hash e response.
+    """
+    if not registros:
+        return
+
+    # A mesma chave pode aparecer duas vezes (custom_ids diferentes, mesmo prompt)
+    por_chave = {r["cache_key"]: r for r in registros}
+    agora = datetime.now()
+    with get_db_connection() as session:
+        statement = select(LLMCache).where(LLMCache.cache_key.in_(list(por_chave)))  # type: ignore
+        existentes = {r.cache_key: r for r in session.exec(statement).all()}
+
+        for chave, dados in por_chave.items():
+            registro = existentes.get(chave) or LLMCache(
+                cache_key=chave,
+                provider=dados["provider"],
+                model=dados["model"],
+                prompt_hash=dados["prompt_hash"],
+                response="",
+            )
+            registro.response = dados["response"]
+            registro.size_bytes = len(dados["response"].encode("utf-8"))
+            registro.created_at = agora
+            registro.last_used_at = agora
+            session.add(registro)
+
+        try:
+            session.commit()
+        except IntegrityError:
+            # Outra thread gravou a mesma chave no meio do caminho: tanto faz qual fica
+            session.rollback()
+
+
+def evict_llm_cache(validade: datetime, max_bytes: int) -> int:
+    """
+    Remove respostas criadas antes de `validade` e, se o total passar de
+    max_bytes, as usadas há mais tempo até voltar ao limite. Retorna quantas removeu.
+    """
+    with get_db_connection() as session:
+        removidos = session.execute(
+            delete(LLMCache).where(LLMCache.created_at < validade)
+        ).rowcount or 0
+
+        total = session.exec(select(func.coalesce(func.sum(LLMCache.size_bytes), 0))).one()
+        if total > max_bytes:
+            statement = select(LLMCache.id, LLMCache.size_bytes).order_by(asc(LLMCache.last_used_at))  # type: ignore
+            remover = []
+            for id_, tamanho in session.exec(statement):
+                if total <= max_bytes:
+                    break
+                remover.append(id_)
+                total -= tamanho
+            for i in range(0, len(remover), URL_LOOKUP_CHUNK_SIZE):
+                chunk = remover[i:i + URL_LOOKUP_CHUNK_SIZE]
+                session.execute(delete(LLMCache).where(LLMCache.id.in_(chunk)))  # type: ignore
+            removidos += len(remover)
+
+        session.commit()
+        return removidos
+
+
+def delete_llm_cache(chaves: List[str]) -> int:
+    """Remove as respostas com as chaves dadas. Retorna quantas removeu."""
+    if not chaves:
+        return 0
+
+    removidos = 0
+    with get_db_connection() as session:
+        for i in range(0, len(chaves), URL_LOOKUP_CHUNK_SIZE):
+            chunk = chaves[i:i + URL_LOOKUP_CHUNK_SIZE]
+            removidos += session.execute(
+                delete(LLMCache).where(LLMCache.cache_key.in_(chunk))  # type: ignore
+            ).rowcount or 0
+        session.commit()
+        return removidos
+
+def get_embedding_cache(chaves: List[str]) -> Dict[str, List[float]]:
+    """Vetores em cache para as chaves dadas. Marca os encontrados como usados."""
+    if not chaves:
+        return {}
+
+    resultado = {}
+    agora = datetime.now()
+    with get_db_connection() as session:
+        for i in range(0, len(chaves), URL_LOOKUP_CHUNK_SIZE):
+            chunk = chaves[i:i + URL_LOOKUP_CHUNK_SIZE]
+            statement = select(EmbeddingCache).where(EmbeddingCache.cache_key.in_(chunk))  # type: ignore
+            for registro in session.exec(statement).all():
+                resultado[registro.cache_key] = json.loads(registro.embedding)
+                registro.hits += 1
+                registro.last_used_at = agora
+                session.add(registro)
+        session.commit()
+    return resultado
+
+
+def put_embedding_cache(vetores: Dict[str, List[float]], model: str) -> None:
+    """Grava vetores no cache de embeddings ({cache_key: vetor})."""
+    if not vetores:
+        return
+
+    agora = datetime.now()
+    with get_db_connection() as session:
+        statement = select(EmbeddingCache).where(EmbeddingCache.cache_key.in_(list(vetores)))  # type: ignore
+        existentes = {r.cache_key: r for r in session.exec(statement).all()}
+
+        for chave, vetor in vetores.items():
+            registro = existentes.get(chave) or EmbeddingCache(cache_key=chave, model=model, embedding="")
+            registro.embedding = json.dumps(vetor)
+            registro.last_used_at = agora
+            session.add(registro)
+
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+
+
+def evict_embedding_cache(max_entradas: int) -> int:
+    """Mantém só os max_entradas vetores usados mais recentemente. Retorna quantos removeu."""
+    with get_db_connection() as session:
+        total = session.exec(select(func.count(EmbeddingCache.id))).one()  # type: ignore
+        excedente = total - max_entradas
+        if excedente <= 0:
+            return 0
+
+        statement = (
+            select(EmbeddingCache.id)
+            .order_by(asc(EmbeddingCache.last_used_at))  # type: ignore
+            .limit(excedente)
+        )
+        remover = list(session.exec(statement).all())
+        for i in range(0, len(remover), URL_LOOKUP_CHUNK_SIZE):
+            chunk = remover[i:i + URL_LOOKUP_CHUNK_SIZE]
+            session.execute(delete(EmbeddingCache).where(EmbeddingCache.id.in_(chunk)))  # type: ignore
+        session.commit()
+        return len(remover)
+
 
 def init_db() -> None:
     from db import create_db_and_tables
@@ -0,0 +1,115 @@
+"""
+Estatísticas de busca de conteúdo por domínio e roteamento Marreta/origem.
+
+Cada busca registra o que aconteceu (Marreta ok, Marreta devolveu a
+homepage, erro no Marreta, origem ok/erro) e a validação registra conteúdo
+curto/truncado ou paywall. Os contadores ficam em memória durante a
+execução e são somados à tabela domain_stats em salvar().
+
+rota() usa esses números para mandar cada artigo direto pelo caminho com
+mais chance de sucesso, economizando uma ida e volta (muitas vezes um
+timeout) por artigo em domínios conhecidos.
+"""
+
+import logging, random, threading
+from collections import defaultdict
+
+import config_base as config
+from rate_limit import dominio
+
+logger = logging.getLogger(__name__)
+
+MARRETA = "marreta"
+ORIGEM = "origem"
+
+_lock = threading.Lock()
+_persistidos = None  # {domínio: {campo: n}} carregado do banco uma vez por processo
+_pendentes = defaultdict(lambda: defaultdict(int))  # incrementos ainda não salvos
+
+
+def _carregar():
+    global _persistidos
+    if _persistidos is None:
+        try:
+            import database
+            _persistidos = database.get_domain_stats()
+        except Exception as e:
+            logger.warning(f"Não foi possível carregar as estatísticas por domínio: {e}")
+            _persistidos = {}
+    return _persistidos
+
+
+def registrar(url: str, evento: str, quantidade: int = 1) -> None:
+    """
+    Soma um evento ao domínio da URL. Eventos: marreta_ok, marreta_homepage,
+    marreta_error, origin_ok, origin_error, content_short, paywall,
+    origin_rejected, marreta_rejected.
+    """
+    with _lock:
+        _pendentes[dominio(url)][evento] += quantidade
+
+
+def registrar_rejeicao(url: str, motivo: str, marreta: bool) -> None:
+    """Registra a rejeição de conteúdo na validação ('curto', 'truncado' ou 'paywall')."""
+    registrar(url, "paywall" if motivo == "paywall" else "content_short")
+    registrar(url, "marreta_rejected" if marreta else "origin_rejected")
+
+
+def _contadores(chave: str) -> dict:
+    with _lock:
+        base = dict(_carregar().get(chave, {}))
+        for campo, valor in _pendentes.get(chave, {}).items():
+            base[campo] = base.get(campo, 0) + valor
+    return base
+
+
+def rota(url: str) -> str:
+    """
+    Caminho a tentar primeiro para a URL: MARRETA (padrão) ou ORIGEM.
+
+    Vai direto à origem quando os dois caminhos têm amostras suficientes e a
+    taxa de conteúdo utilizável da origem supera a do Marreta (nos dois, o
+    conteúdo rejeitado como curto/paywall não conta como sucesso). Uma fração
+    DOMAIN_ROUTING_EXPLORE_RATE continua indo ao Marreta para que as
+    estatísticas não congelem.
+    """
+    if not config.DOMAIN_ROUTING_ENABLED:
+        return MARRETA
+
+    c = _contadores(dominio(url))
+    tentativas_marreta = c.get("marreta_ok", 0) + c.get("marreta_homepage", 0) + c.get("marreta_error", 0)
+    tentativas_origem = c.get("origin_ok", 0) + c.get("origin_error", 0)
+    minimo = config.DOMAIN_ROUTING_MIN_SAMPLES
+    if tentativas_marreta < minimo or tentativas_origem < minimo:
+        return MARRETA
+
+    taxa_marreta = max(0, c.get("marreta_ok", 0) - c.get("marreta_rejected", 0)) / tentativas_marreta
+    taxa_origem = max(0, c.get("origin_ok", 0) - c.get("origin_rejected", 0)) / tentativas_origem
+    if taxa_origem <= taxa_marreta or random.random() < config.DOMAIN_ROUTING_EXPLORE_RATE:
+        return MARRETA
+    return ORIGEM
+
+
+def salvar() -> None:
+    """Grava os incrementos pendentes na tabela domain_stats."""
+    global _pendentes
+    with _lock:
+        deltas = {d: dict(c) for d, c in _pendentes.items()}
+        _pendentes = defaultdict(lambda: defaultdict(int))
+    if not deltas:
+        return
+
+    try:
+        import database
+        database.add_domain_stats(deltas)
+    except Exception as e:
+        logger.warning(f"Não foi possível salvar as estatísticas por domínio: {e}")
+        return
+
+    # Mantém o cache do processo coerente com o banco (se já foi carregado)
+    with _lock:
+        for d, contadores in (deltas.items() if _persistidos is not None else ()):
+            atual = _persistidos.setdefault(d, {})
+            for campo, valor in contadores.items():
+                atual[campo] = atual.get(campo, 0) + valor
+    logger.info(f"Estatísticas de busca salvas para {len(deltas)} domínios")
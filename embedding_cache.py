@@ -0,0 +1,113 @@
+"""
+Cache persistente de embeddings, por hash do texto normalizado e modelo.
+
+O mesmo resumo volta a ser embedado quando um artigo é reprocessado, e cópias
+sindicalizadas da mesma notícia geram resumos idênticos ou quase (só espaços,
+quebras de linha ou formas Unicode diferentes). O texto é normalizado antes
+do hash, então todos esses casos reaproveitam o vetor já pago.
+
+Quando a tabela passa de EMBEDDING_CACHE_MAX_ENTRIES, os vetores usados há
+mais tempo são removidos.
+"""
+
+import hashlib, logging, re, threading, unicodedata
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+# Verifica o tamanho da tabela a cada N vetores gravados
+_EVICAO_A_CADA = 500
+
+_RE_ESPACOS = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_contadores = {"hits": 0, "misses": 0}
+_gravacoes = 0
+
+
+def normalizar_texto(texto: str) -> str:
+    """Forma Unicode NFKC, espaços em branco colapsados e sem espaços nas pontas."""
+    return _RE_ESPACOS.sub(" ", unicodedata.normalize("NFKC", texto or "")).strip()
+
+
+def chave(texto: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalizar_texto(texto)}".encode("utf-8")).hexdigest()
+
+
+def estatisticas(desde: dict = None) -> dict:
+    """
+    Contadores de hits/misses do processo. Com `desde` (um retorno anterior
+    desta função), devolve só o que aconteceu depois dele.
+    """
+    with _lock:
+        atual = dict(_contadores)
+    if desde:
+        atual = {k: atual[k] - desde.get(k, 0) for k in atual}
+    return atual
+
+
+def buscar(textos: list, model: str) -> list:
+    """Vetores em cache alinhados com `textos` (None onde não há)."""
+    if not config.EMBEDDING_CACHE_ENABLED or not textos:
+        return [None] * len(textos)
+
+    chaves = [chave(texto, model) for texto in textos]
+    try:
+        import database
+        encontrados = database.get_embedding_cache(list(dict.fromkeys(chaves)))
+    except Exception as e:
+        logger.warning(f"Não foi possível consultar o cache de embeddings: {e}")
+        encontrados = {}
+
+    vetores = [encontrados.get(c) for c in chaves]
+    hits = sum(1 for v in vetores if v)
+    with _lock:
+        _contadores["hits"] += hits
+        _contadores["misses"] += len(textos) - hits
+    return vetores
+
+
+def get(texto: str, model: str) -> list | None:
+    return buscar([texto], model)[0]
+
+
+def gravar(textos: list, vetores: list, model: str) -> None:
+    """Grava os vetores (alinhados com `textos`; None é ignorado). Erros são apenas logados."""
+    global _gravacoes
+
+    novos = {chave(texto, model): vetor for texto, vetor in zip(textos, vetores) if vetor}
+    if not config.EMBEDDING_CACHE_ENABLED or not novos:
+        return
+
+    try:
+        import database
+        database.put_embedding_cache(novos, model)
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar no cache de embeddings: {e}")
+        return
+
+    with _lock:
+        antes = _gravacoes
+        _gravacoes += len(novos)
+        verificar = antes // _EVICAO_A_CADA != _gravacoes // _EVICAO_A_CADA
+    if verificar:
+        evict()
+
+
+def put(texto: str, vetor: list, model: str) -> None:
+    gravar([texto], [vetor], model)
+
+
+def evict() -> int:
+    """Remove os vetores usados há mais tempo acima de EMBEDDING_CACHE_MAX_ENTRIES."""
+    try:
+        import database
+        removidos = database.evict_embedding_cache(config.EMBEDDING_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        logger.warning(f"Não foi possível limpar o cache de embeddings: {e}")
+        return 0
+
+    if removidos:
+        logger.info(f"Cache de embeddings: {removidos} vetores removidos")
+    return removidos
@@ -0,0 +1,416 @@
+"""
+Busca concorrente de feeds RSS.
+
+Baixa os feeds de uma execução em um pool de threads limitado, com limite
+de conexões simultâneas por host e timeout rígido por feed. O resultado é
+entregue já parseado para a lógica de entradas de cada scraper.
+
+Os feeds são pedidos com GET condicional (ETag / Last-Modified) usando o
+estado salvo na tabela feed_state; um 304 devolve o feed sem entradas.
+O estado é separado por perfil (feed_profile): o mesmo feed assinado por
+dois perfis tem validadores, IDs vistos e agenda próprios em cada um, e o
+pipeline batch de todos os perfis usa TODOS_OS_PERFIS.
+
+O download é feito pelo http_client (timeouts de conexão/leitura e limite de
+tamanho do corpo) e só os bytes são entregues ao feedparser. Falhas e
+latência de cada feed ficam registradas no feed_state; feeds que falham
+seguidamente ou são lentos demais entram em "circuito aberto" e são pulados
+até o fim do período de resfriamento.
+
+Com FEED_ADAPTIVE_POLLING, cada feed também tem uma agenda: o intervalo
+médio entre publicações, o <ttl> e o <skipHours> do próprio feed definem o
+próximo horário em que vale a pena buscá-lo (ver feeds_devidos()).
+"""
+
+import calendar, re, threading, time, feedparser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import config_base as config
+import database
+import http_client
+from utils import logger
+
+FEED_HEADERS = {
+    "Accept": "application/rss+xml, application/atom+xml, application/xml;q=0.9, text/xml;q=0.9, */*;q=0.8",
+    "Sec-Fetch-Dest": "empty",
+}
+
+# feed_profile do estado salvo pelo pipeline que lê os feeds de todos os perfis
+TODOS_OS_PERFIS = "*"
+
+# Peso da última medição na média móvel de latência
+_ALFA_LATENCIA = 0.3
+
+# Peso da última estimativa na média móvel do intervalo de publicação
+_ALFA_PUBLICACAO = 0.5
+
+# Entradas mais recentes usadas para estimar o intervalo de publicação
+_ENTRADAS_PARA_INTERVALO = 20
+
+_RE_SKIP_HOURS = re.compile(rb'<skipHours\b[^>]*>(.*?)</skipHours>', re.S | re.I)
+_RE_HOUR = re.compile(rb'<hour>\s*(\d{1,2})\s*</hour>', re.I)
+
+
+def _host(feed_url: str) -> str:
+    return urlparse(feed_url).netloc.lower()
+
+
+def _id_entrada(entry) -> str | None:
+    return entry.get('id') or entry.get('link')
+
+
+def feed_nao_modificado(feed) -> bool:
+    """True se o servidor respondeu 304 ao GET condicional."""
+    return feed is not None and feed.get('status') == 304
+
+
+def circuito_aberto(feed) -> bool:
+    """True se o feed foi pulado por estar com o circuit breaker aberto."""
+    return feed is not None and bool(feed.get('circuito_aberto'))
+
+
+def resumo_feeds(feeds_baixados: dict) -> dict:
+    """Contagem por situação dos feeds de uma execução (para as estatísticas da fase)."""
+    resumo = {"total": len(feeds_baixados), "ok": 0, "nao_modificados": 0, "falhas": 0, "circuito_aberto": 0}
+    for feed in feeds_baixados.values():
+        if feed is None:
+            resumo["falhas"] += 1
+        elif circuito_aberto(feed):
+            resumo["circuito_aberto"] += 1
+        elif feed_nao_modificado(feed):
+            resumo["nao_modificados"] += 1
+        else:
+            resumo["ok"] += 1
+    return resumo
+
+
+def _baixar_feed(feed_url: str, estado: dict, timeout: float) -> feedparser.FeedParserDict:
+    """
+    GET condicional do feed pelo http_client e parse dos bytes com o feedparser.
+    Levanta RequestException em erro de rede/HTTP ou corpo grande demais.
+    """
+    headers = dict(FEED_HEADERS)
+    if estado.get('etag'):
+        headers["If-None-Match"] = estado['etag']
+    if estado.get('last_modified'):
+        headers["If-Modified-Since"] = estado['last_modified']
+
+    response = http_client.get(
+        feed_url,
+        headers=headers,
+        timeout=(config.FEED_CONNECT_TIMEOUT, min(config.FEED_READ_TIMEOUT, timeout)),
+        max_bytes=config.FEED_MAX_BYTES
+    )
+
+    if response.status_code == 304:
+        feed = feedparser.FeedParserDict(entries=[], feed=feedparser.FeedParserDict(), bozo=0)
+    else:
+        cabecalhos = dict(response.headers)
+        cabecalhos.setdefault("content-location", response.url)  # Resolve URIs relativas
+        feed = feedparser.parse(response.content, response_headers=cabecalhos)
+
+        # O feedparser não expõe <skipHours>
+        bloco = _RE_SKIP_HOURS.search(response.content)
+        if bloco:
+            feed['skip_hours'] = sorted({int(h) for h in _RE_HOUR.findall(bloco.group(1)) if int(h) < 24})
+
+    feed['status'] = response.status_code
+    feed['href'] = response.url
+    feed['etag'] = response.headers.get('ETag') or estado.get('etag')
+    feed['modified'] = response.headers.get('Last-Modified') or estado.get('last_modified')
+    return feed
+
+
+def _saude_feed(estado: dict, sucesso: bool, latencia: float | None, erro: str | None) -> dict:
+    """
+    Atualiza o histórico de falhas/latência de um feed e decide se o circuito abre.
+
+    Falhas consecutivas >= FEED_CIRCUIT_FAILURE_THRESHOLD abrem o circuito por
+    FEED_CIRCUIT_COOLDOWN_MINUTES, dobrando a cada nova falha (até o máximo).
+    Latência média acima de FEED_CIRCUIT_SLOW_SECONDS também abre o circuito.
+    Depois do resfriamento o feed é tentado de novo (meio-aberto).
+    """
+    falhas = estado.get('consecutive_failures') or 0
+    media = estado.get('avg_latency_ms')
+    abrir_ate = None
+
+    if latencia is not None:
+        latencia_ms = latencia * 1000
+        media = latencia_ms if media is None else _ALFA_LATENCIA * latencia_ms + (1 - _ALFA_LATENCIA) * media
+
+    if sucesso:
+        falhas = 0
+        if media is not None and media > config.FEED_CIRCUIT_SLOW_SECONDS * 1000:
+            abrir_ate = datetime.now() + timedelta(minutes=config.FEED_CIRCUIT_COOLDOWN_MINUTES)
+            erro = f"lento (média {media / 1000:.1f}s)"
+    else:
+        falhas += 1
+        excesso = falhas - config.FEED_CIRCUIT_FAILURE_THRESHOLD
+        if excesso >= 0:
+            minutos = min(
+                config.FEED_CIRCUIT_COOLDOWN_MINUTES * (2 ** excesso),
+                config.FEED_CIRCUIT_MAX_COOLDOWN_MINUTES
+            )
+            abrir_ate = datetime.now() + timedelta(minutes=minutos)
+
+    saude = {
+        "consecutive_failures": falhas,
+        "total_failures": (estado.get('total_failures') or 0) + (0 if sucesso else 1),
+        "avg_latency_ms": media,
+        "last_latency_ms": latencia * 1000 if latencia is not None else None,
+        "last_error": None if sucesso and abrir_ate is None else erro,
+        "circuit_open_until": abrir_ate,
+    }
+    if abrir_ate:
+        logger.warning(f"Circuito aberto para o feed até {abrir_ate:%Y-%m-%d %H:%M} ({erro})")
+    return saude
+
+
+def entradas_nao_vistas(feed) -> list:
+    """
+    Entradas do feed que não estavam presentes na última busca bem-sucedida.
+    """
+    estado = feed.get('estado_anterior') or {}
+    vistos = set(estado.get('last_entry_ids') or [])
+    return [e for e in feed.entries if _id_entrada(e) not in vistos]
+
+
+def _intervalo_publicacao(feed) -> float | None:
+    """Intervalo médio (min) entre as entradas mais recentes do feed, ou None."""
+    datas = sorted(
+        (calendar.timegm(d) for d in (e.get('published_parsed') or e.get('updated_parsed') for e in feed.entries) if d),
+        reverse=True
+    )[:_ENTRADAS_PARA_INTERVALO]
+    if len(datas) < 2 or datas[0] == datas[-1]:
+        return None
+    return (datas[0] - datas[-1]) / (len(datas) - 1) / 60
+
+
+def _agenda_feed(feed, estado: dict) -> dict:
+    """
+    Calcula a agenda do feed após uma busca bem-sucedida (200 ou 304).
+
+    O próximo check fica em intervalo_publicação * FEED_POLL_INTERVAL_FACTOR,
+    limitado a [FEED_POLL_MIN_MINUTES, FEED_POLL_MAX_MINUTES], nunca antes do
+    <ttl> do feed e fora das horas listadas em <skipHours> (UTC).
+    """
+    intervalo = estado.get('publish_interval_minutes')
+    ttl = estado.get('feed_ttl_minutes')
+    skip_hours = estado.get('skip_hours') or []
+
+    if not feed_nao_modificado(feed):
+        observado = _intervalo_publicacao(feed)
+        if observado is not None:
+            intervalo = observado if intervalo is None else _ALFA_PUBLICACAO * observado + (1 - _ALFA_PUBLICACAO) * intervalo
+
+        ttl_declarado = (feed.get('feed') or {}).get('ttl')
+        ttl = int(ttl_declarado) if ttl_declarado and str(ttl_declarado).strip().isdigit() else None
+        skip_hours = feed.get('skip_hours') or []
+
+    espera = config.FEED_POLL_MIN_MINUTES if intervalo is None else intervalo * config.FEED_POLL_INTERVAL_FACTOR
+    espera = min(max(espera, config.FEED_POLL_MIN_MINUTES), config.FEED_POLL_MAX_MINUTES)
+    if ttl:
+        espera = max(espera, min(ttl, config.FEED_POLL_MAX_MINUTES))
+
+    proximo = datetime.now() + timedelta(minutes=espera)
+    if skip_hours and len(skip_hours) < 24:
+        # skipHours é em GMT; avança hora a hora até sair da janela
+        offset = datetime.now(timezone.utc).replace(tzinfo=None) - datetime.now()
+        while (proximo + offset).hour in skip_hours:
+            proximo = (proximo + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+
+    return {
+        "publish_interval_minutes": intervalo,
+        "feed_ttl_minutes": ttl,
+        "skip_hours": skip_hours,
+        "next_check_at": proximo,
+    }
+
+
+def feeds_devidos(feed_urls: list, feed_profile: str = TODOS_OS_PERFIS) -> tuple:
+    """
+    Separa os feeds que devem ser buscados nesta execução dos que ainda não
+    estão na hora (next_check_at no futuro). Com FEED_ADAPTIVE_POLLING
+    desligado, todos são devidos.
+
+    Returns:
+        tuple: (devidos, adiados) — listas de URLs, sem repetição, na ordem original
+    """
+    urls_unicas = list(dict.fromkeys(u for u in feed_urls if u))
+    if not config.FEED_ADAPTIVE_POLLING:
+        return urls_unicas, []
+
+    try:
+        estados = database.get_feed_states(urls_unicas, feed_profile)
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar a agenda dos feeds, buscando todos: {e}")
+        return urls_unicas, []
+
+    agora = datetime.now()
+    devidos, adiados = [], []
+    for url in urls_unicas:
+        proximo = (estados.get(url) or {}).get('next_check_at')
+        (adiados if proximo and proximo > agora else devidos).append(url)
+
+    logger.info(f"Agenda de feeds: {len(devidos)} devidos, {len(adiados)} adiados")
+    return devidos, adiados
+
+
+def registrar_estado_feeds(feeds_baixados: dict, feed_profile: str = TODOS_OS_PERFIS) -> None:
+    """
+    Persiste ETag, Last-Modified, status, IDs de entradas e a agenda de
+    polling dos feeds baixados.
+
+    Deve ser chamado depois que as entradas foram processadas, para que uma
+    execução interrompida não transforme entradas pendentes em 304 na próxima.
+    """
+    estados = {}
+    for feed_url, feed in feeds_baixados.items():
+        # Feed quebrado não deve gravar ETag, senão a próxima execução recebe 304
+        if feed is None or circuito_aberto(feed) or (feed.get('bozo') and not feed.entries):
+            continue
+
+        estado_anterior = feed.get('estado_anterior') or {}
+        status = feed.get('status')
+        if status == 304:
+            estados[feed_url] = {"last_status": status, **_agenda_feed(feed, estado_anterior)}
+            continue
+
+        estados[feed_url] = {
+            "etag": feed.get('etag'),
+            "last_modified": feed.get('modified'),
+            "last_status": status,
+            "last_entry_ids": [i for i in (_id_entrada(e) for e in feed.entries) if i],
+            **_agenda_feed(feed, estado_anterior),
+        }
+
+    try:
+        database.save_feed_states(estados, feed_profile)
+    except Exception as e:
+        logger.warning(f"Não foi possível salvar o estado dos feeds: {e}")
+
+
+def buscar_feeds(
+    feed_urls: list,
+    max_workers: int = None,
+    limite_por_host: int = None,
+    timeout: float = None,
+    condicional: bool = True,
+    feed_profile: str = TODOS_OS_PERFIS
+) -> dict:
+    """
+    Baixa e parseia vários feeds em paralelo.
+
+    URLs repetidas são baixadas uma única vez. Feeds que estouram o timeout
+    ou falham ficam como None no resultado. Com condicional=True, envia o
+    ETag/Last-Modified salvos do perfil; feeds sem mudança voltam com status 304.
+
+    Feeds com o circuit breaker aberto não são baixados: voltam como um dict
+    sem entradas marcado com circuito_aberto (ver circuito_aberto()). O
+    histórico de falhas/latência é salvo no feed_state ao final.
+
+    Returns:
+        dict: {feed_url: FeedParserDict | None}
+    """
+    max_workers = max_workers or config.FEED_FETCH_MAX_WORKERS
+    limite_por_host = limite_por_host or config.FEED_FETCH_PER_HOST_LIMIT
+    timeout = timeout or config.FEED_FETCH_TIMEOUT
+
+    urls_unicas = list(dict.fromkeys(u for u in feed_urls if u))
+    if not urls_unicas:
+        return {}
+
+    semaforos = {}
+    for url in urls_unicas:
+        semaforos.setdefault(_host(url), threading.Semaphore(limite_por_host))
+
+    estados = {}
+    try:
+        estados = database.get_feed_states(urls_unicas, feed_profile)
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar o estado dos feeds: {e}")
+
+    resultados = {}
+    agora_dt = datetime.now()
+    a_baixar = []
+    for feed_url in urls_unicas:
+        estado = estados.get(feed_url) or {}
+        aberto_ate = estado.get('circuit_open_until')
+        if aberto_ate and aberto_ate > agora_dt:
+            logger.info(f"Circuito aberto até {aberto_ate:%Y-%m-%d %H:%M}, pulando feed {feed_url} ({estado.get('last_error')})")
+            resultados[feed_url] = feedparser.FeedParserDict(
+                entries=[], feed=feedparser.FeedParserDict(), bozo=0,
+                status=None, circuito_aberto=True, estado_anterior=estado
+            )
+        else:
+            a_baixar.append(feed_url)
+
+    inicio = {}
+    saude = {}
+
+    def _baixar(feed_url):
+        estado = estados.get(feed_url) or {}
+        estado_http = estado if condicional else {}
+        with semaforos[_host(feed_url)]:
+            inicio[feed_url] = time.monotonic()
+            feed = _baixar_feed(feed_url, estado_http, timeout)
+        feed['estado_anterior'] = estado
+        return feed
+
+    logger.info(f"Baixando {len(a_baixar)} feeds ({max_workers} workers, {limite_por_host} por host)...")
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feed")
+    try:
+        futures = {executor.submit(_baixar, url): url for url in a_baixar}
+        pendentes = set(futures)
+
+        while pendentes:
+            concluidos, pendentes = wait(pendentes, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            for future in concluidos:
+                feed_url = futures[future]
+                estado = estados.get(feed_url) or {}
+                latencia = time.monotonic() - inicio[feed_url] if feed_url in inicio else None
+                try:
+                    feed = future.result()
+                except Exception as e:
+                    logger.warning(f"Erro ao baixar feed {feed_url}: {e}")
+                    resultados[feed_url] = None
+                    saude[feed_url] = _saude_feed(estado, False, latencia, str(e)[:500])
+                    continue
+
+                resultados[feed_url] = feed
+                # XML que não parseia é falha do feed, mesmo com HTTP 200
+                quebrado = feed.get('bozo') and not feed.entries and not feed_nao_modificado(feed)
+                erro = str(feed.get('bozo_exception'))[:500] if quebrado else None
+                saude[feed_url] = _saude_feed(estado, not quebrado, latencia, erro)
+
+            # Timeout rígido: abandona feeds que passaram do limite desde que começaram
+            agora = time.monotonic()
+            for future in list(pendentes):
+                feed_url = futures[future]
+                if feed_url in inicio and agora - inicio[feed_url] > timeout:
+                    logger.warning(f"Timeout ao baixar feed {feed_url} ({timeout}s), ignorando")
+                    future.cancel()
+                    pendentes.discard(future)
+                    resultados[feed_url] = None
+                    saude[feed_url] = _saude_feed(
+                        estados.get(feed_url) or {}, False, agora - inicio[feed_url], f"timeout ({timeout}s)"
+                    )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    try:
+        database.save_feed_states(saude, feed_profile)
+    except Exception as e:
+        logger.warning(f"Não foi possível salvar o histórico dos feeds: {e}")
+
+    resumo = resumo_feeds(resultados)
+    logger.info(
+        f"Feeds baixados: {resumo['ok'] + resumo['nao_modificados']}/{len(urls_unicas)} "
+        f"({resumo['nao_modificados']} sem mudanças, {resumo['falhas']} falhas, "
+        f"{resumo['circuito_aberto']} pulados por circuito aberto)"
+    )
+    return resultados
@@ -0,0 +1,83 @@
+"""
+Resumo e avaliação de impacto numa única chamada ao LLM.
+
+Monta um prompt com as duas tarefas a partir dos templates do perfil
+(PROMPT_ARTICLE_SUMMARY e PROMPT_IMPACT_RATING) e pede a resposta em JSON
+{"summary": ..., "impact_score": ...}. Com FUSED_SUMMARY_RATING ligado no
+perfil, cada artigo custa uma request em vez de duas, e o pipeline batch não
+precisa esperar um segundo batch só para o rating.
+"""
+
+import json, re
+
+_INSTRUCOES_JSON = """
+
+---
+FORMATO DA RESPOSTA: ignore as instruções de formato de saída acima (número
+sozinho, texto livre). Responda APENAS com um objeto JSON, sem texto extra:
+{"summary": "<o resumo da TAREFA 1>", "impact_score": <inteiro de 1 a 10 da TAREFA 2>}"""
+
+# Saída estruturada da OpenAI (modelos com suporte a json_schema)
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "resumo_e_impacto",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "impact_score": {"type": "integer"},
+            },
+            "required": ["summary", "impact_score"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_RE_OBJETO_JSON = re.compile(r'\{.*\}', re.S)
+
+
+def montar_prompt_fundido(template_resumo: str, template_impacto: str, conteudo: str) -> str:
+    """Prompt com a tarefa de resumo (sobre o artigo) e a de impacto (sobre o resumo)."""
+    return (
+        "TAREFA 1 — RESUMO\n\n"
+        + template_resumo.format(article_content=conteudo).strip()
+        + "\n\nTAREFA 2 — IMPACTO\n\n"
+        + "Avalie o resumo que você escreveu na TAREFA 1 com os critérios abaixo.\n\n"
+        + template_impacto.format(summary="(o resumo da TAREFA 1)").strip()
+        + _INSTRUCOES_JSON
+    )
+
+
+def parsear_resposta_fundida(resposta: str) -> tuple:
+    """
+    Extrai (resumo, impact_score) da resposta. Campos ausentes ou inválidos
+    voltam como None: sem resumo, o artigo falhou; sem score, fica para o
+    rating normal.
+    """
+    if not resposta:
+        return None, None
+
+    # Tolera cercas de código e texto em volta do objeto (modelos sem json_schema)
+    match = _RE_OBJETO_JSON.search(resposta.strip())
+    if not match:
+        return None, None
+    try:
+        dados = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None, None
+    if not isinstance(dados, dict):
+        return None, None
+
+    resumo = dados.get("summary")
+    resumo = resumo.strip() if isinstance(resumo, str) and resumo.strip() else None
+
+    try:
+        score = int(dados.get("impact_score"))
+    except (TypeError, ValueError):
+        score = None
+    if score is not None and not 1 <= score <= 10:
+        score = None
+
+    return resumo, score
@@ -0,0 +1,156 @@
+"""
+Cache em disco do HTML bruto das páginas de artigos.
+
+Cada página baixada com sucesso é gravada comprimida (zstd, ou zlib se o
+pacote zstandard não estiver instalado) em um arquivo nomeado pelo SHA-256
+da URL. Assim, se a extração, a validação ou uma fase posterior falhar, a
+próxima execução não precisa baixar a página de novo, e a extração pode ser
+refeita com outras configurações do trafilatura sem tocar na rede.
+
+Entradas expiram após HTML_CACHE_TTL_HOURS e, quando o diretório passa de
+HTML_CACHE_MAX_MB, as mais antigas são removidas.
+"""
+
+import hashlib, json, logging, os, tempfile, threading, time, zlib
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zlib como fallback
+    zstandard = None
+
+_EXTENSAO = ".zst" if zstandard else ".zz"
+
+# Verifica o tamanho do diretório a cada N gravações, não em toda gravação
+_EVICAO_A_CADA = 50
+
+_lock = threading.Lock()
+_gravacoes = 0
+
+
+def _comprimir(dados: bytes) -> bytes:
+    if zstandard:
+        return zstandard.ZstdCompressor(level=3).compress(dados)
+    return zlib.compress(dados, 6)
+
+
+def _descomprimir(dados: bytes) -> bytes:
+    if zstandard:
+        return zstandard.ZstdDecompressor().decompress(dados)
+    return zlib.decompress(dados)
+
+
+def _caminho(url: str) -> str:
+    chave = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    # Dois níveis de subdiretório para não acumular milhares de arquivos num só
+    return os.path.join(config.HTML_CACHE_DIR, chave[:2], chave + _EXTENSAO)
+
+
+def get(url: str) -> tuple | None:
+    """
+    Retorna (html, marreta) do cache, ou None se ausente/expirado/corrompido.
+    """
+    if not config.HTML_CACHE_ENABLED:
+        return None
+
+    caminho = _caminho(url)
+    try:
+        idade = time.time() - os.path.getmtime(caminho)
+        if idade > config.HTML_CACHE_TTL_HOURS * 3600:
+            os.remove(caminho)
+            return None
+
+        with open(caminho, "rb") as f:
+            registro = json.loads(_descomprimir(f.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Entrada inválida no cache de HTML para {url}: {e}")
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+        return None
+
+    # Colisão de hash é improvável, mas não custa conferir
+    if registro.get("url") != url:
+        return None
+    return registro["html"], registro.get("marreta", False)
+
+
+def put(url: str, html: str, marreta: bool) -> None:
+    """Grava o HTML no cache (escrita atômica). Erros são apenas logados."""
+    global _gravacoes
+
+    if not config.HTML_CACHE_ENABLED or not html:
+        return
+
+    caminho = _caminho(url)
+    dados = _comprimir(json.dumps(
+        {"url": url, "marreta": marreta, "html": html, "fetched_at": time.time()}
+    ).encode("utf-8"))
+
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar {url} no cache de HTML: {e}")
+        return
+
+    with _lock:
+        _gravacoes += 1
+        verificar = _gravacoes % _EVICAO_A_CADA == 0
+    if verificar:
+        evict()
+
+
+def evict() -> int:
+    """
+    Remove entradas expiradas e, se o cache passar de HTML_CACHE_MAX_MB,
+    as mais antigas até voltar ao limite. Retorna quantos arquivos removeu.
+    """
+    if not os.path.isdir(config.HTML_CACHE_DIR):
+        return 0
+
+    limite_idade = time.time() - config.HTML_CACHE_TTL_HOURS * 3600
+    limite_bytes = config.HTML_CACHE_MAX_MB * 1024 * 1024
+
+    entradas = []
+    removidos = 0
+    for raiz, _, arquivos in os.walk(config.HTML_CACHE_DIR):
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            try:
+                st = os.stat(caminho)
+            except OSError:
+                continue
+            if st.st_mtime < limite_idade:
+                try:
+                    os.remove(caminho)
+                    removidos += 1
+                except OSError:
+                    pass
+            else:
+                entradas.append((st.st_mtime, st.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    if total > limite_bytes:
+        for _, tamanho, caminho in sorted(entradas):
+            try:
+                os.remove(caminho)
+                removidos += 1
+                total -= tamanho
+            except OSError:
+                pass
+            if total <= limite_bytes:
+                break
+
+    if removidos:
+        logger.info(f"Cache de HTML: {removidos} arquivos removidos ({total / 1024 / 1024:.1f} MB restantes)")
+    return removidos
@@ -0,0 +1,158 @@
+"""
+Cliente HTTP compartilhado para a busca de artigos.
+
+Cada thread usa sua própria requests.Session (Session não é thread-safe),
+com pools de conexão keep-alive por host, retry com backoff para erros de
+conexão/5xx e limite de tamanho de resposta. Assim o Marreta, que recebe
+centenas de requisições por execução, reaproveita as conexões TCP/TLS.
+"""
+
+import logging, re, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0',
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+    "Cache-Control": "max-age=0",
+    "referer": "https://www.google.com"
+}
+
+_local = threading.local()
+
+# Content-Types aceitos por get_html (prefixos). Sem Content-Type, aceita.
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "application/xml", "text/xml", "text/plain")
+
+_RE_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?\s*([A-Za-z0-9_\-:.]+)', re.I)
+
+
+class ResponseTooLargeError(requests.exceptions.RequestException):
+    """A resposta ultrapassou HTTP_MAX_RESPONSE_BYTES."""
+
+
+class RequestCancelledError(requests.exceptions.RequestException):
+    """A requisição foi cancelada pelo chamador (ex.: perdeu uma corrida hedged)."""
+
+
+class UnsupportedContentTypeError(requests.exceptions.RequestException):
+    """O Content-Type da resposta não é um dos aceitos (ex.: PDF, vídeo)."""
+
+
+def _criar_sessao() -> requests.Session:
+    retry = Retry(
+        total=config.HTTP_RETRIES,
+        connect=config.HTTP_RETRIES,
+        read=0,  # Timeout de leitura não é repetido, o chamador já tem fallback
+        status=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Retorna a sessão HTTP da thread atual, criando-a na primeira chamada."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _criar_sessao()
+        _local.session = session
+    return session
+
+
+def get(url, headers=None, timeout=None, max_bytes=None, cancelar=None, tipos_aceitos=None, **kwargs) -> requests.Response:
+    """
+    GET pela sessão compartilhada da thread, com o corpo lido em streaming.
+
+    O download é abortado (e a conexão descartada) assim que:
+    - o corpo passa de max_bytes (padrão HTTP_MAX_RESPONSE_BYTES): ResponseTooLargeError;
+    - o Content-Type não começa com nenhum de tipos_aceitos: UnsupportedContentTypeError,
+      sem ler o corpo;
+    - o threading.Event `cancelar` é sinalizado: RequestCancelledError.
+
+    Levanta HTTPError para status >= 400. O corpo fica em response.content.
+    """
+    timeout = timeout or (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+    max_bytes = max_bytes or config.HTTP_MAX_RESPONSE_BYTES
+
+    response = get_session().get(url, headers=headers, timeout=timeout, stream=True, **kwargs)
+    try:
+        response.raise_for_status()
+
+        if tipos_aceitos:
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and not content_type.startswith(tuple(tipos_aceitos)):
+                raise UnsupportedContentTypeError(f"Content-Type não suportado ({content_type}): {url}")
+
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ResponseTooLargeError(f"Resposta maior que {max_bytes} bytes: {url}")
+
+        blocos = []
+        total = 0
+        for bloco in response.iter_content(chunk_size=64 * 1024):
+            if cancelar is not None and cancelar.is_set():
+                raise RequestCancelledError(f"Requisição cancelada: {url}")
+            total += len(bloco)
+            # Content-Length pode faltar ou mentir (e vem comprimido): conta o que chega
+            if total > max_bytes:
+                raise ResponseTooLargeError(f"Resposta maior que {max_bytes} bytes: {url}")
+            blocos.append(bloco)
+        response._content = b"".join(blocos)
+    finally:
+        response.close()
+
+    return response
+
+
+def decodificar(response: requests.Response) -> str:
+    """
+    Decodifica o corpo uma única vez: charset do Content-Type, senão o do
+    <meta charset> no início do HTML, senão UTF-8 (bytes inválidos substituídos).
+
+    Evita response.text, que sem charset no cabeçalho roda detecção de
+    encoding sobre o corpo inteiro.
+    """
+    encoding = None
+    if "charset=" in response.headers.get("Content-Type", "").lower():
+        encoding = response.encoding
+    if not encoding:
+        meta = _RE_META_CHARSET.search(response.content[:4096])
+        if meta:
+            encoding = meta.group(1).decode("ascii", "ignore")
+
+    try:
+        return response.content.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return response.content.decode("utf-8", errors="replace")
+
+
+def get_html(url, **kwargs) -> str:
+    """GET de uma página HTML (só Content-Types de HTML/texto), já decodificada."""
+    kwargs.setdefault("tipos_aceitos", HTML_CONTENT_TYPES)
+    return decodificar(get(url, **kwargs))
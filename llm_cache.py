@@ -0,0 +1,238 @@
+"""
+Cache persistente de respostas de LLM, por hash do prompt.
+
+A chave é o SHA-256 de (provedor, modelo, parâmetros, hash do prompt): o
+mesmo prompt com outro modelo, outro max_tokens ou outro system prompt é
+outra entrada. call_llm consulta o cache antes de chamar a API, e os envios
+para as Batch APIs (OpenAI e Anthropic) tiram do arquivo as linhas já
+respondidas. Assim, reexecuções depois de uma falha, recuperações de batch e
+experimentos que repetem prompts não pagam de novo pela mesma resposta.
+
+As entradas expiram após LLM_CACHE_TTL_DAYS e, quando a tabela passa de
+LLM_CACHE_MAX_MB, as usadas há mais tempo são removidas.
+"""
+
+import hashlib, json, logging, threading, uuid
+from datetime import datetime, timedelta
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+# Prefixo do batch_id "virtual" de um envio em que todas as linhas estavam no cache
+PREFIXO_LOTE_CACHE = "cache-"
+
+# Verifica o tamanho da tabela a cada N respostas gravadas
+_EVICAO_A_CADA = 200
+
+_lock = threading.Lock()
+_contadores = {"hits": 0, "misses": 0}
+_gravacoes = 0
+
+# batch_id -> {"respostas": {custom_id: resposta}, "chaves": {custom_id: registro}}
+_lotes = {}
+
+
+def _serializar(valor) -> str:
+    if isinstance(valor, str):
+        return valor
+    return json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def provedor_do_modelo(model: str) -> str:
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+def registro(provider: str, model: str, prompt, params: dict = None) -> dict:
+    """
+    Identificação de uma chamada no cache: cache_key, provider, model e
+    prompt_hash. `prompt` pode ser o texto ou a lista de mensagens.
+    """
+    prompt_hash = hashlib.sha256(_serializar(prompt).encode("utf-8")).hexdigest()
+    base = _serializar({
+        "provider": provider,
+        "model": model,
+        "params": {k: v for k, v in (params or {}).items() if v is not None},
+        "prompt": prompt_hash,
+    })
+    return {
+        "cache_key": hashlib.sha256(base.encode("utf-8")).hexdigest(),
+        "provider": provider,
+        "model": model,
+        "prompt_hash": prompt_hash,
+    }
+
+
+def _contar(hits: int, misses: int) -> None:
+    with _lock:
+        _contadores["hits"] += hits
+        _contadores["misses"] += misses
+
+
+def estatisticas(desde: dict = None) -> dict:
+    """
+    Contadores de hits/misses do processo. Com `desde` (um retorno anterior
+    desta função), devolve só o que aconteceu depois dele.
+    """
+    with _lock:
+        atual = dict(_contadores)
+    if desde:
+        atual = {k: atual[k] - desde.get(k, 0) for k in atual}
+    return atual
+
+
+def buscar(registros: list) -> dict:
+    """Respostas em cache ({cache_key: resposta}) para os registros dados."""
+    if not config.LLM_CACHE_ENABLED or not registros:
+        return {}
+
+    chaves = list(dict.fromkeys(r["cache_key"] for r in registros))
+    try:
+        import database
+        validade = datetime.now() - timedelta(days=config.LLM_CACHE_TTL_DAYS)
+        encontradas = database.get_llm_cache(chaves, validade)
+    except Exception as e:
+        logger.warning(f"Não foi possível consultar o cache de LLM: {e}")
+        encontradas = {}
+
+    hits = sum(1 for r in registros if r["cache_key"] in encontradas)
+    _contar(hits, len(registros) - hits)
+    return encontradas
+
+
+def get(reg: dict) -> str | None:
+    """Resposta em cache para uma chamada, ou None."""
+    return buscar([reg]).get(reg["cache_key"])
+
+
+def gravar(itens: list) -> None:
+    """Grava respostas no cache. itens: lista de (registro, resposta). Erros são apenas logados."""
+    global _gravacoes
+
+    itens = [(reg, resposta) for reg, resposta in itens if resposta]
+    if not config.LLM_CACHE_ENABLED or not itens:
+        return
+
+    try:
+        import database
+        database.put_llm_cache([dict(reg, response=resposta) for reg, resposta in itens])
+    except Exception as e:
+        logger.warning(f"Não foi possível gravar no cache de LLM: {e}")
+        return
+
+    with _lock:
+        antes = _gravacoes
+        _gravacoes += len(itens)
+        verificar = antes // _EVICAO_A_CADA != _gravacoes // _EVICAO_A_CADA
+    if verificar:
+        evict()
+
+
+def put(reg: dict, resposta: str) -> None:
+    gravar([(reg, resposta)])
+
+
+def descartar(registros: list) -> None:
+    """
+    Remove do cache as respostas dos registros dados (ex.: resposta gravada
+    por um batch mas que o chamador não conseguiu usar). Erros são apenas logados.
+    """
+    if not config.LLM_CACHE_ENABLED or not registros:
+        return
+
+    try:
+        import database
+        database.delete_llm_cache(list(dict.fromkeys(r["cache_key"] for r in registros)))
+    except Exception as e:
+        logger.warning(f"Não foi possível remover respostas do cache de LLM: {e}")
+
+
+def evict() -> int:
+    """Remove respostas expiradas e, acima de LLM_CACHE_MAX_MB, as usadas há mais tempo."""
+    try:
+        import database
+        removidos = database.evict_llm_cache(
+            datetime.now() - timedelta(days=config.LLM_CACHE_TTL_DAYS),
+            config.LLM_CACHE_MAX_MB * 1024 * 1024
+        )
+    except Exception as e:
+        logger.warning(f"Não foi possível limpar o cache de LLM: {e}")
+        return 0
+
+    if removidos:
+        logger.info(f"Cache de LLM: {removidos} respostas removidas")
+    return removidos
+
+
+# --- Batch APIs ---
+
+def separar_lote(requests_list: list, registro_de) -> tuple:
+    """
+    Separa as requests de um batch entre as já respondidas no cache e as que
+    precisam ir para a API.
+
+    Args:
+        requests_list: requests com "custom_id"
+        registro_de: request -> registro() da chamada, ou None se não cacheável
+
+    Returns:
+        tuple: (faltando, respostas_em_cache {custom_id: resposta}, registros {custom_id: registro})
+    """
+    registros = {}
+    for req in requests_list:
+        reg = registro_de(req)
+        if reg:
+            registros[req["custom_id"]] = reg
+
+    encontradas = buscar(list(registros.values()))
+    em_cache = {
+        custom_id: encontradas[reg["cache_key"]]
+        for custom_id, reg in registros.items()
+        if reg["cache_key"] in encontradas
+    }
+    faltando = [req for req in requests_list if req["custom_id"] not in em_cache]
+    return faltando, em_cache, registros
+
+
+def registrar_lote(batch_id: str | None, em_cache: dict, registros: dict) -> str:
+    """
+    Guarda as respostas em cache e os registros das linhas de um batch enviado.
+    Sem batch_id (todas as linhas no cache), cria um id virtual com PREFIXO_LOTE_CACHE.
+    """
+    batch_id = batch_id or f"{PREFIXO_LOTE_CACHE}{uuid.uuid4().hex}"
+    with _lock:
+        _lotes[batch_id] = {"respostas": dict(em_cache), "chaves": dict(registros)}
+    return batch_id
+
+
+def lote_so_cache(batch_id: str | None) -> bool:
+    return bool(batch_id) and batch_id.startswith(PREFIXO_LOTE_CACHE)
+
+
+def registros_do_lote(batch_id: str) -> dict | None:
+    with _lock:
+        lote = _lotes.get(batch_id)
+    return lote["chaves"] if lote else None
+
+
+def concluir_lote(batch_id: str, resultados: dict, registros: dict = None) -> dict:
+    """
+    Grava no cache as respostas novas do batch e devolve os resultados
+    completos (respostas da API + as que vieram do cache no envio).
+
+    registros: {custom_id: registro}, quando não foram guardados no envio
+    (ex.: batch recuperado em outro processo).
+    """
+    with _lock:
+        lote = _lotes.pop(batch_id, None) or {"respostas": {}, "chaves": {}}
+    registros = registros or lote["chaves"]
+
+    gravar([
+        (registros[custom_id], resposta)
+        for custom_id, resposta in resultados.items()
+        if custom_id in registros and custom_id not in lote["respostas"]
+    ])
+
+    if lote["respostas"]:
+        logger.info(f"  {len(lote['respostas'])} respostas vieram do cache de LLM")
+    return {**lote["respostas"], **resultados}
@@ -0,0 +1,206 @@
+"""
+Execução concorrente e limite de taxa das chamadas síncronas a LLMs.
+
+Cada requisição passa pelo limitador RPM/TPM do modelo (limitador_para),
+que começa com os limites de LLM_RATE_LIMITS e é ajustado pelos cabeçalhos
+de rate limit de cada resposta da OpenAI/Anthropic (registrar_resposta); um
+429 pausa todas as chamadas ao modelo pelo tempo que a API pedir
+(registrar_erro).
+
+mapear_concorrente roda até LLM_MAX_IN_FLIGHT chamadas ao mesmo tempo e
+entrega cada resultado ao chamador assim que fica pronto — a gravação no
+banco continua na thread principal, item a item.
+"""
+
+import logging, re, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import config_base as config
+from rate_limit import LimitadorRpmTpm
+
+logger = logging.getLogger(__name__)
+
+_limitadores = {}
+_lock = threading.Lock()
+
+
+def estimar_tokens(texto: str, max_saida: int = 0) -> int:
+    """Estimativa grosseira (~4 caracteres por token) de entrada + saída máxima."""
+    return len(texto or "") // 4 + max_saida
+
+
+def _limites_do_modelo(model: str) -> tuple:
+    limites = config.LLM_RATE_LIMITS
+    if model in limites:
+        return limites[model]
+    # Prefixo mais longo que casar (ex.: "claude-sonnet" para "claude-sonnet-4-5-...")
+    prefixos = sorted((p for p in limites if model.startswith(p)), key=len, reverse=True)
+    if prefixos:
+        return limites[prefixos[0]]
+    return config.LLM_DEFAULT_RPM, config.LLM_DEFAULT_TPM
+
+
+def limitador_para(model: str) -> LimitadorRpmTpm:
+    """Limitador RPM/TPM compartilhado por todas as chamadas do processo ao modelo."""
+    with _lock:
+        limitador = _limitadores.get(model)
+        if limitador is None:
+            rpm, tpm = _limites_do_modelo(model)
+            limitador = LimitadorRpmTpm(rpm, tpm, margem=config.LLM_RATE_LIMIT_HEADROOM)
+            _limitadores[model] = limitador
+        return limitador
+
+
+_RE_DURACAO = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+# Por provedor: (limite, restantes, reset) de requisições e as alternativas
+# de (limite, restantes, reset) de tokens, em ordem de preferência
+_CABECALHOS = (
+    (
+        ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        (
+            ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ),
+    ),
+    (
+        ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        (
+            ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+            # Sem os tokens-* combinados, vale o limite de tokens de entrada
+            ("anthropic-ratelimit-input-tokens-limit", "anthropic-ratelimit-input-tokens-remaining",
+             "anthropic-ratelimit-input-tokens-reset"),
+        ),
+    ),
+)
+
+
+def _numero(valor) -> float | None:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _segundos(valor) -> float | None:
+    """
+    Converte um reset/Retry-After em segundos a partir de agora: número
+    ("1.5"), duração da OpenAI ("6m0s", "20ms") ou instante RFC 3339 da Anthropic.
+    """
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    numero = _numero(valor)
+    if numero is not None:
+        return max(0.0, numero)
+
+    partes = _RE_DURACAO.findall(valor)
+    if partes and "".join(n + u for n, u in partes) == valor:
+        fatores = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * fatores[u] for n, u in partes)
+
+    try:
+        instante = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return max(0.0, (instante - datetime.now(timezone.utc)).total_seconds())
+
+
+def registrar_resposta(model: str, headers) -> None:
+    """Ajusta o limitador do modelo com os cabeçalhos de rate limit de uma resposta."""
+    if not headers:
+        return
+    for requisicoes, alternativas_tokens in _CABECALHOS:
+        # Cada campo de tokens vem da primeira alternativa que o traz
+        limite_tok, restantes_tok, reset_tok = (
+            next((headers.get(nomes[i]) for nomes in alternativas_tokens if headers.get(nomes[i]) is not None), None)
+            for i in range(3)
+        )
+        if headers.get(requisicoes[1]) is None and restantes_tok is None:
+            continue
+        limite_req, restantes_req, reset_req = (headers.get(n) for n in requisicoes)
+        limitador_para(model).ajustar(
+            limite_req=_numero(limite_req), restantes_req=_numero(restantes_req), reset_req=_segundos(reset_req),
+            limite_tok=_numero(limite_tok), restantes_tok=_numero(restantes_tok), reset_tok=_segundos(reset_tok),
+        )
+        return
+
+
+def registrar_erro(model: str, erro: Exception) -> bool:
+    """
+    Se o erro for um 429, pausa as chamadas ao modelo pelo tempo pedido pela
+    API (retry-after-ms, Retry-After ou o reset dos cabeçalhos; senão
+    LLM_RATE_LIMIT_BACKOFF_SECONDS) e retorna True.
+    """
+    resposta = getattr(erro, "response", None)
+    status = getattr(erro, "status_code", None) or getattr(resposta, "status_code", None)
+    if status != 429:
+        return False
+
+    headers = getattr(resposta, "headers", None) or {}
+    espera = None
+    if headers.get("retry-after-ms"):
+        espera = (_numero(headers.get("retry-after-ms")) or 0) / 1000
+    if not espera:
+        espera = _segundos(headers.get("retry-after"))
+    if not espera:
+        resets = [
+            _segundos(headers.get(nome))
+            for nome in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens",
+                         "anthropic-ratelimit-requests-reset", "anthropic-ratelimit-tokens-reset",
+                         "anthropic-ratelimit-input-tokens-reset")
+        ]
+        espera = max((r for r in resets if r), default=None)
+
+    espera = espera or config.LLM_RATE_LIMIT_BACKOFF_SECONDS
+    logger.warning(f"Rate limit (429) em {model}: pausando chamadas por {espera:.1f}s")
+    limitador_para(model).pausar(espera)
+    registrar_resposta(model, headers)
+    return True
+
+
+class CotaExcedida(Exception):
+    """Quota da API esgotada numa chamada: interrompe mapear_concorrente inteiro."""
+
+
+def mapear_concorrente(itens: list, funcao, max_em_voo: int = None):
+    """
+    Aplica `funcao(item)` a cada item em paralelo, com no máximo `max_em_voo`
+    chamadas simultâneas (padrão LLM_MAX_IN_FLIGHT). O ritmo de cada
+    requisição fica com o limitador do modelo, usado por quem chama a API
+    (call_llm).
+
+    Args:
+        itens: itens a processar
+        funcao: item -> resultado (faz a(s) chamada(s) ao LLM)
+        max_em_voo: chamadas simultâneas
+
+    Yields:
+        tuple: (item, resultado, erro) na ordem de conclusão; erro é None ou a exceção
+
+    Raises:
+        CotaExcedida: vinda de qualquer item; o que ainda está na fila é cancelado
+    """
+    if not itens:
+        return
+
+    max_em_voo = max_em_voo or config.LLM_MAX_IN_FLIGHT
+
+    with ThreadPoolExecutor(max_workers=max_em_voo, thread_name_prefix="llm") as executor:
+        futures = {executor.submit(funcao, item): item for item in itens}
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    yield item, future.result(), None
+                except CotaExcedida:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Erro na chamada ao LLM: {e}")
+                    yield item, None, e
+        finally:
+            # Consumidor desistiu no meio: não dispara o que ainda está na fila
+            for future in futures:
+                future.cancel()
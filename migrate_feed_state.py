@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Script de migração: adiciona as colunas de saúde (circuit breaker), de
+agenda de polling e o perfil (feed_profile) em feed_state. Colunas que já
+existem são puladas; linhas existentes ficam com o perfil '*' (pipeline de
+todos os perfis) e a chave única passa a ser (feed_profile, feed_url).
+"""
+from db import get_session
+from sqlalchemy import text
+
+print('=== Migração: Adicionando saúde, agenda de polling e perfil em feed_state ===\n')
+
+COLUNAS = [
+    ('feed_profile', "VARCHAR NOT NULL DEFAULT '*'"),
+    ('consecutive_failures', 'INTEGER NOT NULL DEFAULT 0'),
+    ('total_failures', 'INTEGER NOT NULL DEFAULT 0'),
+    ('avg_latency_ms', 'FLOAT'),
+    ('last_latency_ms', 'FLOAT'),
+    ('last_error', 'VARCHAR'),
+    ('circuit_open_until', 'TIMESTAMP'),
+    ('publish_interval_minutes', 'FLOAT'),
+    ('feed_ttl_minutes', 'INTEGER'),
+    ('skip_hours', 'VARCHAR'),
+    ('next_check_at', 'TIMESTAMP'),
+]
+
+for coluna, tipo in COLUNAS:
+    with get_session() as session:
+        try:
+            session.exec(text(f'ALTER TABLE feed_state ADD COLUMN {coluna} {tipo}'))
+            session.commit()
+            print(f'✅ Coluna {coluna} adicionada com sucesso!')
+        except Exception as e:
+            error_msg = str(e).lower()
+            if 'duplicate column' in error_msg or 'already exists' in error_msg:
+                print(f'ℹ️  Coluna {coluna} já existe, pulando...')
+            else:
+                print(f'❌ Erro ao adicionar coluna {coluna}: {e}\n')
+                raise
+
+with get_session() as session:
+    # Mesmos nomes de índice que o SQLModel cria em bancos novos
+    session.exec(text('DROP INDEX IF EXISTS ix_feed_state_feed_url'))
+    session.exec(text('CREATE INDEX IF NOT EXISTS ix_feed_state_feed_url ON feed_state (feed_url)'))
+    session.exec(text('CREATE INDEX IF NOT EXISTS ix_feed_state_feed_profile ON feed_state (feed_profile)'))
+    session.exec(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_feed_state_profile_url ON feed_state (feed_profile, feed_url)'
+    ))
+    session.commit()
+    print('✅ Índices de feed_state OK')
+
+print('\nMigração concluída!')
@@ -4,6 +4,7 @@ SQLModel database models for Meridiano application.
 
 from datetime import datetime
 from typing import Optional, ClassVar
+from sqlalchemy import UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 
@@ -37,6 +38,11 @@ class Article(SQLModel, table=True):
 
     id: Optional[int] = Field(default=None, primary_key=True)
     url: str = Field(unique=True, index=True)
+    canonical_url: Optional[str] = Field(
+        default=None,
+        index=True,
+        description="utils.canonicalizar_url(url), used to detect the same article under different URLs"
+    )
     title: Optional[str] = None
     published_date: Optional[datetime] = None
     feed_source: Optional[str] = None
@@ -58,6 +64,11 @@ class Article(SQLModel, table=True):
         default=None,
         description="Initial relevance score (1-5) from RSS snippet analysis"
     )
+    filter_source: Optional[str] = Field(
+        default=None,
+        description="Who set initial_filter_score: 'llm', 'prefiltro' (local classifier), "
+                    "'conteudo' (content validation/summary failure) or 'padrao' (assumed default)"
+    )
     briefing_analyzed: bool = Field(default=False, index=True)
     url_encoding: str = Field(unique=True, index=True)
     marreta: Optional[bool] = Field(default=False, index=True)
@@ -133,4 +144,95 @@ class User(SQLModel, table=True):
     preferences: Optional[str] = Field(
         default=None,
         description="JSON string com preferências do usuário"
-    )
\ No newline at end of file
+    )
+
+class FeedState(SQLModel, table=True):
+    """
+    Estado HTTP de cada feed RSS, usado para GET condicional entre execuções.
+
+    Uma linha por (feed_profile, feed_url): perfis que assinam o mesmo feed
+    não recebem 304/"não devido" por causa da execução de outro perfil.
+    O pipeline batch de todos os perfis usa feed_profile '*'.
+    """
+
+    __tablename__: ClassVar[str] = "feed_state"
+    __table_args__ = (UniqueConstraint("feed_profile", "feed_url", name="uq_feed_state_profile_url"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    feed_profile: str = Field(default="*", index=True)
+    feed_url: str = Field(index=True)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    last_status: Optional[int] = None
+    last_entry_ids: Optional[str] = Field(
+        default=None,
+        description="JSON array with the entry IDs seen on the last successful fetch"
+    )
+    last_fetched_at: Optional[datetime] = None
+
+    # Histórico de saúde (circuit breaker)
+    consecutive_failures: int = Field(default=0)
+    total_failures: int = Field(default=0)
+    avg_latency_ms: Optional[float] = None
+    last_latency_ms: Optional[float] = None
+    last_error: Optional[str] = None
+    circuit_open_until: Optional[datetime] = None
+
+    # Agenda de polling adaptativa
+    publish_interval_minutes: Optional[float] = Field(
+        default=None,
+        description="Moving average of the interval between published entries"
+    )
+    feed_ttl_minutes: Optional[int] = Field(default=None, description="<ttl> declared by the feed")
+    skip_hours: Optional[str] = Field(default=None, description="JSON array with the feed's <skipHours> (UTC)")
+    next_check_at: Optional[datetime] = None
+
+
+class DomainStats(SQLModel, table=True):
+    """Resultados acumulados da busca de conteúdo por domínio, usados no roteamento Marreta/origem."""
+
+    __tablename__: ClassVar[str] = "domain_stats"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    domain: str = Field(unique=True, index=True)
+    marreta_ok: int = Field(default=0)
+    marreta_homepage: int = Field(default=0, description="Marreta returned its own homepage (fallback to origin)")
+    marreta_error: int = Field(default=0)
+    origin_ok: int = Field(default=0)
+    origin_error: int = Field(default=0)
+    content_short: int = Field(default=0, description="Content rejected as too short or truncated")
+    paywall: int = Field(default=0)
+    origin_rejected: int = Field(default=0, description="content_short/paywall where the HTML came from the origin")
+    marreta_rejected: int = Field(default=0, description="content_short/paywall where the HTML came from Marreta")
+    updated_at: Optional[datetime] = None
+
+
+class LLMCache(SQLModel, table=True):
+    """Respostas de LLM já pagas, por (provedor, modelo, parâmetros, prompt), reaproveitadas entre execuções."""
+
+    __tablename__: ClassVar[str] = "llm_cache"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cache_key: str = Field(unique=True, index=True, description="SHA-256 of provider, model, parameters and prompt hash")
+    provider: str
+    model: str
+    prompt_hash: str
+    response: str
+    size_bytes: int = Field(default=0)
+    hits: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    last_used_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class EmbeddingCache(SQLModel, table=True):
+    """Vetores de embedding já gerados, por hash do texto normalizado e modelo."""
+
+    __tablename__: ClassVar[str] = "embedding_cache"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cache_key: str = Field(unique=True, index=True, description="SHA-256 of model and normalized input text")
+    model: str
+    embedding: str  # JSON string, no mesmo formato de Article.embedding
+    hits: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.now)
+    last_used_at: datetime = Field(default_factory=datetime.now, index=True)
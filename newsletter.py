@@ -1,11 +1,15 @@
 # newsletter.py
 
 import os, json, time, anthropic, importlib
+from types import SimpleNamespace
 import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
 
 import database
+import llm_cache
+from prompt_cache import params_anthropic
+import token_budget
 import config_base as config
 from utils import logger, similaridade_cosseno, deduplicar_artigos
 
@@ -91,34 +95,44 @@ def montar_requests_batch(artigos_por_feed: dict) -> list:
     Monta lista de requests para a Anthropic Batch API.
     """
     requests = []
+    orcamento_antes = token_budget.estatisticas("newsletter")
     
     for feed_name, artigos in artigos_por_feed.items():
         for artigo in artigos:
             custom_id = f"{feed_name}-{artigo['id']}"
             
-            # Monta o prompt com o conteúdo do artigo
-            prompt = PROMPT_NEWSLETTER.format(raw_content=artigo['raw_content'])
-            
+            # Instruções no system (iguais em todas as requests, cacheadas),
+            # conteúdo do artigo na mensagem
             request = {
                 "custom_id": custom_id,
-                "params": {
-                    "model": NEWSLETTER_MODEL,
-                    "max_tokens": 2024,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ]
-                }
+                "params": params_anthropic(
+                    NEWSLETTER_MODEL, 2024, PROMPT_NEWSLETTER,
+                    "raw_content",
+                    # Artigos muito longos são aparados ao orçamento da etapa, no fim de uma frase
+                    token_budget.aparar_para_etapa(artigo['raw_content'], "newsletter", NEWSLETTER_MODEL)
+                )
             }
             
             requests.append(request)
     
     total = len(requests)
     feeds = len(artigos_por_feed)
-    logger.info(f"Montadas {total} requests para {feeds} feeds")
+    orcamento = token_budget.estatisticas("newsletter")
+    logger.info(f"Montadas {total} requests para {feeds} feeds "
+                f"({orcamento['aparados'] - orcamento_antes['aparados']} artigos aparados, "
+                f"{orcamento['tokens_economizados'] - orcamento_antes['tokens_economizados']} tokens economizados)")
     
     return requests
 
 
+def _registro_cache(request: dict) -> dict:
+    """Registro no cache de LLM de uma linha do batch da Anthropic."""
+    params = request["params"]
+    prompt = {"system": params.get("system"), "messages": params["messages"]}
+    outros = {k: v for k, v in params.items() if k not in ("model", "messages", "system")}
+    return llm_cache.registro("anthropic", params["model"], prompt, outros)
+
+
 def enviar_batch_anthropic(requests_list: list, description: str = "newsletter") -> str | None:
     """
     Envia batch para Anthropic API.
@@ -127,16 +141,22 @@ def enviar_batch_anthropic(requests_list: list, description: str = "newsletter")
         logger.warning(f"Lista de requests vazia para {description}")
         return None
     
-    logger.info(f"Enviando batch '{description}' com {len(requests_list)} requests para Anthropic...")
+    # Linhas já respondidas no cache de LLM não vão para a API
+    faltando, em_cache, registros = llm_cache.separar_lote(requests_list, _registro_cache)
+    if not faltando:
+        logger.info(f"Batch '{description}': todas as {len(em_cache)} requests estão no cache de LLM")
+        return llm_cache.registrar_lote(None, em_cache, registros)
+    
+    logger.info(f"Enviando batch '{description}' com {len(faltando)} requests para Anthropic ({len(em_cache)} no cache)...")
     
     try:
-        batch = client.beta.messages.batches.create(requests=requests_list)
+        batch = client.beta.messages.batches.create(requests=faltando)
         
         logger.info(f"Batch criado com sucesso!")
         logger.info(f"  ID: {batch.id}")
         logger.info(f"  Status: {batch.processing_status}")
         
-        return batch.id
+        return llm_cache.registrar_lote(batch.id, em_cache, registros)
     
     except Exception as e:
         logger.error(f"Erro ao criar batch '{description}': {e}")
@@ -150,6 +170,9 @@ def aguardar_batch_anthropic(batch_id: str, description: str = "newsletter"):
     if not batch_id:
         return None
     
+    if llm_cache.lote_so_cache(batch_id):
+        return SimpleNamespace(id=batch_id, processing_status="ended")
+    
     logger.info(f"Aguardando batch '{description}' ({batch_id})...")
     
     start_time = time.time()
@@ -184,6 +207,9 @@ def processar_resultados_batch(batch_id: str, description: str = "newsletter") -
     if not batch_id:
         return None
     
+    if llm_cache.lote_so_cache(batch_id):
+        return llm_cache.concluir_lote(batch_id, {})
+    
     logger.info(f"Processando resultados do batch '{description}'...")
     
     try:
@@ -203,7 +229,7 @@ def processar_resultados_batch(batch_id: str, description: str = "newsletter") -
                 erros += 1
         
         logger.info(f"Resultados processados: {len(resultados)} sucesso, {erros} erros")
-        return resultados
+        return llm_cache.concluir_lote(batch_id, resultados)
     
     except Exception as e:
         logger.error(f"Erro ao processar resultados do batch: {e}")
@@ -281,6 +307,7 @@ def executar_pipeline_newsletter(feed_name: str = None) -> dict:
     logger.info(f"{'='*60}")
     logger.info(f"PIPELINE NEWSLETTER - {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     logger.info(f"{'='*60}")
+    cache_antes = llm_cache.estatisticas()
     
     # 1. Coletar artigos
     logger.info("\n>>> FASE 1: Coleta de artigos <<<")
@@ -394,5 +421,6 @@ def executar_pipeline_newsletter(feed_name: str = None) -> dict:
         "batch_id": batch_id,
         "total_requests": len(requests_list),
         "total_resultados": len(resultados),
-        "newsletters": newsletters_salvas
+        "newsletters": newsletters_salvas,
+        "cache": llm_cache.estatisticas(desde=cache_antes)
     }
\ No newline at end of file
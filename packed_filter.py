@@ -0,0 +1,105 @@
+"""
+Filtro de relevância em lote: vários snippets de RSS avaliados numa única
+chamada ao LLM.
+
+O prompt do perfil (PROMPT_INITIAL_FILTER) entra uma vez só, seguido da
+lista de artigos; a resposta é um JSON {id: score}. Itens que não vierem
+na resposta (ou resposta que não parseia) devem ser reavaliados um a um
+pelo chamador.
+"""
+
+import json, re
+
+# Tamanho máximo da descrição enviada por item (o prompt em lote cresce com N)
+MAX_DESCRICAO = 600
+
+_INSTRUCOES_LOTE = """
+
+---
+MODO LOTE: a lista abaixo tem {n} artigos. Avalie CADA um de forma independente,
+com os mesmos critérios acima (o título/descrição de cada artigo está na lista).
+Ignore a instrução de responder só com um número: responda APENAS com um objeto
+JSON que mapeia o id de cada artigo para o score (1-5), sem texto extra.
+Exemplo: {{"12": 4, "57": 1}}
+
+ARTIGOS:
+{itens}"""
+
+_RE_OBJETO_JSON = re.compile(r'\{.*\}', re.S)
+_RE_ID_ITEM = re.compile(r'^\[id=(\d+)\]\nTítulo: ', re.M)
+
+
+def dividir_em_lotes(itens: list, tamanho: int) -> list:
+    """Divide a lista em lotes de até `tamanho` itens."""
+    tamanho = max(1, tamanho)
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+
+def montar_prompt_lote(prompt_template: str, feed_profile: str, itens: list) -> str:
+    """
+    Monta o prompt em lote a partir do template de item único do perfil.
+
+    itens: lista de dicts com 'id', 'title' e 'description'.
+    """
+    cabecalho = prompt_template.format(
+        feed_profile=feed_profile,
+        title="(ver lista ARTIGOS abaixo)",
+        description="(ver lista ARTIGOS abaixo)"
+    )
+
+    linhas = []
+    for item in itens:
+        descricao = (item.get('description') or "Sem descrição").strip()
+        if len(descricao) > MAX_DESCRICAO:
+            descricao = descricao[:MAX_DESCRICAO] + "..."
+        linhas.append(
+            f"[id={item['id']}]\n"
+            f"Título: {item.get('title') or 'Sem título'}\n"
+            f"Descrição: {descricao}\n"
+        )
+
+    return cabecalho + _INSTRUCOES_LOTE.format(n=len(itens), itens="\n".join(linhas))
+
+
+def ids_do_prompt_lote(prompt: str) -> list:
+    """Ids dos artigos de um prompt montado por montar_prompt_lote, na ordem."""
+    _, _, itens = (prompt or "").rpartition("\nARTIGOS:\n")
+    return [int(id_) for id_ in _RE_ID_ITEM.findall(itens)]
+
+
+def max_tokens_lote(n_itens: int) -> int:
+    """Orçamento de saída para um JSON com n_itens scores."""
+    return 20 + 12 * n_itens
+
+
+def parsear_scores_lote(resposta: str, ids: list) -> dict:
+    """
+    Extrai {id: score} da resposta JSON. Só devolve ids pedidos com score
+    inteiro de 1 a 5; o resto fica de fora (para fallback item a item).
+    """
+    if not resposta:
+        return {}
+
+    texto = resposta.strip()
+    # Tolera cercas de código e texto em volta do objeto
+    match = _RE_OBJETO_JSON.search(texto)
+    if not match:
+        return {}
+    try:
+        dados = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(dados, dict):
+        return {}
+
+    por_chave = {str(k).strip(): v for k, v in dados.items()}
+    scores = {}
+    for id_ in ids:
+        valor = por_chave.get(str(id_))
+        try:
+            score = int(valor)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= score <= 5:
+            scores[id_] = score
+    return scores
@@ -0,0 +1,211 @@
+"""
+Pré-filtro local aprendido com os scores do filtro inicial.
+
+Cada perfil de feed já tem milhares de snippets (título + descrição do RSS)
+avaliados pelo LLM em initial_filter_score. Aqui um TF-IDF + regressão
+logística por perfil é treinado offline sobre esses rótulos (relevante =
+score >= MIN_INITIAL_FILTER_SCORE do perfil) e, antes do filtro do LLM,
+decide sozinho os snippets em que tem confiança alta: rejeita os claramente
+irrelevantes e aprova os claramente relevantes. O resto segue para o LLM.
+
+Os limiares de confiança são escolhidos num conjunto separado do treino:
+a maior cobertura em que a precisão do lado (rejeição ou aprovação) fica em
+PREFILTER_MIN_PRECISION. Um lado que não chega lá fica desligado, e sem
+modelo treinado o perfil vai inteiro para o LLM.
+"""
+
+import html, importlib, logging, os, pickle, re, threading
+from datetime import datetime
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+# Fração dos rótulos separada para medir a precisão dos limiares
+_FRACAO_TESTE = 0.2
+_MIN_POR_CLASSE = 50
+
+_RE_TAGS = re.compile(r"<[^>]+>")
+_RE_ESPACOS = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_modelos = {}  # feed_profile -> (mtime, modelo)
+_contadores = {"rejeitados": 0, "aceitos": 0, "enviados_ao_llm": 0}
+
+
+def texto_snippet(title: str, description: str) -> str:
+    """Título + descrição do RSS sem HTML, como o classificador vê o snippet."""
+    descricao = html.unescape(_RE_TAGS.sub(" ", description or ""))
+    return _RE_ESPACOS.sub(" ", f"{title or ''} {descricao}").strip()
+
+
+def _caminho(feed_profile: str) -> str:
+    return os.path.join(config.PREFILTER_MODEL_DIR, f"{feed_profile}.pkl")
+
+
+def _config_do_feed(feed_profile: str):
+    try:
+        return importlib.import_module(f"feeds.{feed_profile}")
+    except ImportError:
+        return None
+
+
+def _limiar(probs: list, rotulos: list, aceitar: bool) -> dict | None:
+    """
+    Limiar de maior cobertura com precisão >= PREFILTER_MIN_PRECISION.
+
+    aceitar=True: aprova p >= limiar (precisão = fração de relevantes);
+    aceitar=False: rejeita p <= limiar (precisão = fração de irrelevantes).
+    """
+    pares = sorted(zip(probs, rotulos), reverse=aceitar)
+    melhor = None
+    acertos = 0
+    for n, (p, rotulo) in enumerate(pares, 1):
+        acertos += rotulo if aceitar else 1 - rotulo
+        # Só corta entre probabilidades diferentes: empates ficam do mesmo lado
+        if n < len(pares) and pares[n][0] == p:
+            continue
+        if n >= config.PREFILTER_MIN_SUPPORT and acertos / n >= config.PREFILTER_MIN_PRECISION:
+            melhor = {"limiar": float(p), "precisao": acertos / n, "cobertura": n / len(pares)}
+    return melhor
+
+
+def treinar(feed_profile: str) -> dict | None:
+    """
+    Treina e salva o modelo do perfil em PREFILTER_MODEL_DIR.
+
+    Returns:
+        dict: métricas no conjunto de teste (amostras, limiares, precisão e
+        cobertura de cada lado), ou None se não há rótulos suficientes.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import make_pipeline
+    import database
+
+    feed_config = _config_do_feed(feed_profile)
+    min_score = getattr(feed_config, 'MIN_INITIAL_FILTER_SCORE', config.MIN_INITIAL_FILTER_SCORE)
+
+    rotulados = database.get_filter_labels(feed_profile)
+    textos = [texto_snippet(r["title"], r["rss_description"]) for r in rotulados]
+    rotulos = [int(r["initial_filter_score"] >= min_score) for r in rotulados]
+    positivos = sum(rotulos)
+
+    if len(rotulos) < config.PREFILTER_MIN_LABELS or min(positivos, len(rotulos) - positivos) < _MIN_POR_CLASSE:
+        logger.warning(f"Pré-filtro [{feed_profile}]: rótulos insuficientes "
+                       f"({positivos} relevantes, {len(rotulos) - positivos} irrelevantes)")
+        return None
+
+    textos_treino, textos_teste, rotulos_treino, rotulos_teste = train_test_split(
+        textos, rotulos, test_size=_FRACAO_TESTE, stratify=rotulos, random_state=42
+    )
+    classificador = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), min_df=2, max_features=50_000, sublinear_tf=True),
+        LogisticRegression(class_weight="balanced", max_iter=1000),
+    )
+    classificador.fit(textos_treino, rotulos_treino)
+    probs = classificador.predict_proba(textos_teste)[:, 1].tolist()
+
+    modelo = {
+        "classificador": classificador,
+        "min_score": min_score,
+        "rejeicao": _limiar(probs, rotulos_teste, aceitar=False),
+        "aceite": _limiar(probs, rotulos_teste, aceitar=True),
+        "amostras": len(rotulos),
+        "treinado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    os.makedirs(config.PREFILTER_MODEL_DIR, exist_ok=True)
+    temporario = _caminho(feed_profile) + ".tmp"
+    with open(temporario, "wb") as f:
+        pickle.dump(modelo, f)
+    os.replace(temporario, _caminho(feed_profile))
+
+    metricas = {k: v for k, v in modelo.items() if k != "classificador"}
+    logger.info(f"Pré-filtro [{feed_profile}] treinado: {metricas}")
+    return metricas
+
+
+def _carregar(feed_profile: str) -> dict | None:
+    """Modelo do perfil, recarregado quando o arquivo muda (novo treino)."""
+    caminho = _caminho(feed_profile)
+    try:
+        mtime = os.path.getmtime(caminho)
+    except OSError:
+        return None
+
+    with _lock:
+        em_memoria = _modelos.get(feed_profile)
+    if em_memoria and em_memoria[0] == mtime:
+        return em_memoria[1]
+
+    try:
+        with open(caminho, "rb") as f:
+            modelo = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar o pré-filtro de '{feed_profile}': {e}")
+        modelo = None
+
+    with _lock:
+        _modelos[feed_profile] = (mtime, modelo)
+    return modelo
+
+
+def classificar(feed_profile: str, textos: list, feed_config=None) -> list:
+    """
+    Scores do pré-filtro alinhados com `textos` (ver texto_snippet):
+    PREFILTER_REJECT_SCORE, PREFILTER_ACCEPT_SCORE ou None (vai para o LLM).
+    """
+    if not textos:
+        return []
+
+    modelo = None
+    if getattr(feed_config, 'PREFILTER_ENABLED', config.PREFILTER_ENABLED):
+        modelo = _carregar(feed_profile)
+    if not modelo or not (modelo["rejeicao"] or modelo["aceite"]):
+        with _lock:
+            _contadores["enviados_ao_llm"] += len(textos)
+        return [None] * len(textos)
+
+    # O score gravado tem de cair do lado certo do corte do perfil
+    nota_rejeicao = min(config.PREFILTER_REJECT_SCORE, modelo["min_score"] - 1)
+    nota_aceite = max(config.PREFILTER_ACCEPT_SCORE, modelo["min_score"])
+
+    scores = []
+    for p in modelo["classificador"].predict_proba(textos)[:, 1]:
+        if modelo["rejeicao"] and p <= modelo["rejeicao"]["limiar"]:
+            scores.append(nota_rejeicao)
+        elif modelo["aceite"] and p >= modelo["aceite"]["limiar"]:
+            scores.append(nota_aceite)
+        else:
+            scores.append(None)
+
+    with _lock:
+        _contadores["rejeitados"] += scores.count(nota_rejeicao)
+        _contadores["aceitos"] += scores.count(nota_aceite)
+        _contadores["enviados_ao_llm"] += scores.count(None)
+    return scores
+
+
+def precisao(feed_profile: str) -> dict:
+    """Precisão medida no treino para cada lado do modelo do perfil (None se desligado)."""
+    modelo = _carregar(feed_profile) or {}
+    return {
+        lado: round(modelo[lado]["precisao"], 3) if modelo.get(lado) else None
+        for lado in ("rejeicao", "aceite")
+    }
+
+
+def estatisticas(desde: dict = None) -> dict:
+    """
+    Snippets decididos pelo pré-filtro (rejeitados/aceitos), avaliações de
+    LLM evitadas e snippets enviados ao LLM. Com `desde` (um retorno
+    anterior desta função), devolve só o que aconteceu depois dele.
+    """
+    with _lock:
+        atual = dict(_contadores)
+    if desde:
+        atual = {k: atual[k] - desde.get(k, 0) for k in atual}
+    atual["chamadas_evitadas"] = atual["rejeitados"] + atual["aceitos"]
+    return atual
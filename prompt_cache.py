@@ -0,0 +1,63 @@
+"""
+Templates de prompt divididos em bloco estático + bloco variável.
+
+Os templates por feed (PROMPT_CLUSTER_ANALYSIS, PROMPT_BRIEF_SYNTHESIS,
+PROMPT_NEWSLETTER) são instruções longas e fixas com o conteúdo variável no
+meio ou no fim. Aqui o template vira o system prompt — com o campo variável
+trocado por uma referência à mensagem do usuário — e o conteúdo vai sozinho
+na mensagem do usuário. Como o system prompt é idêntico em todas as requests
+do mesmo feed, ele é marcado com cache_control da Anthropic e cobrado/
+processado a preço de cache a partir da segunda request.
+
+A Anthropic só cacheia prefixos a partir de ~1024 tokens; com um template
+menor que isso (ou com o cache desligado) a divisão não traria economia, e o
+prompt segue como antes: inteiro na mensagem do usuário, sem system.
+"""
+
+import config_base as config
+from token_budget import contar_tokens
+
+# Tamanho mínimo de um prefixo cacheável na Anthropic
+_MIN_TOKENS_CACHE = 1024
+
+
+def dividir_template(template: str, campo: str, valor: str, **fixos) -> tuple:
+    """
+    Separa o template em (estatico, variavel).
+
+    Se o bloco estático não chega a _MIN_TOKENS_CACHE (ou o cache está
+    desligado), devolve (None, prompt completo formatado).
+
+    Args:
+        template: template com o placeholder {campo}
+        campo: nome do placeholder do conteúdo variável
+        valor: conteúdo variável
+        fixos: demais placeholders, iguais em todas as requests (ex.: feed_profile)
+    """
+    rotulo = campo.upper()
+    estatico = template.format(**fixos, **{campo: f"[{rotulo}: enviado na mensagem do usuário]"})
+    if not config.ANTHROPIC_PROMPT_CACHING or contar_tokens(estatico) < _MIN_TOKENS_CACHE:
+        return None, template.format(**fixos, **{campo: valor})
+    return estatico.strip(), f"{rotulo}:\n{valor}"
+
+
+def bloco_sistema(texto: str):
+    """System prompt no formato da Anthropic, marcado para o cache de prompt."""
+    if not config.ANTHROPIC_PROMPT_CACHING:
+        return texto
+    return [{"type": "text", "text": texto, "cache_control": {"type": "ephemeral"}}]
+
+
+def params_anthropic(model: str, max_tokens: int, template: str, campo: str, valor: str, **fixos) -> dict:
+    """params de uma request da Messages API com o template em bloco estático cacheável."""
+    estatico, variavel = dividir_template(template, campo, valor, **fixos)
+    params = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": variavel}
+        ]
+    }
+    if estatico is not None:
+        params["system"] = bloco_sistema(estatico)
+    return params
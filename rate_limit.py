@@ -0,0 +1,170 @@
+"""
+Limitadores de taxa compartilhados pelo pipeline.
+
+TokenBucket é thread-safe e bloqueia o chamador até haver tokens (ou, com
+tentar_adquirir, diz quanto falta sem bloquear).
+LimitadorPorDominio mantém um bucket por domínio, para buscar publishers
+diferentes em paralelo sem martelar nenhum deles.
+"""
+
+import threading, time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Token bucket clássico: `taxa` tokens por segundo, até `capacidade` acumulados.
+    """
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self) -> None:
+        agora = time.monotonic()
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def adquirir(self, quantidade: float = 1.0) -> float:
+        """
+        Bloqueia até conseguir `quantidade` tokens. Retorna o tempo esperado (s).
+
+        Pedidos maiores que a capacidade são atendidos quando o bucket enche,
+        deixando o saldo negativo (o próximo chamador paga a diferença).
+        """
+        esperado = 0.0
+        while True:
+            with self._lock:
+                self._repor()
+                necessario = min(quantidade, self.capacidade)
+                if self._tokens >= necessario:
+                    self._tokens -= quantidade
+                    return esperado
+                espera = (necessario - self._tokens) / self.taxa
+            time.sleep(espera)
+            esperado += espera
+
+    def tentar_adquirir(self, quantidade: float = 1.0) -> float:
+        """
+        Sem bloquear: pega `quantidade` tokens e retorna 0, ou retorna quantos
+        segundos faltam para haver tokens (sem consumir nada).
+        """
+        with self._lock:
+            self._repor()
+            necessario = min(quantidade, self.capacidade)
+            if self._tokens >= necessario:
+                self._tokens -= quantidade
+                return 0.0
+            return (necessario - self._tokens) / self.taxa
+
+    def ajustar(self, taxa: float = None, capacidade: float = None, disponivel: float = None) -> None:
+        """
+        Ajusta o bucket a limites observados (ex.: cabeçalhos de rate limit de
+        uma API). `disponivel` só reduz o saldo, nunca aumenta.
+        """
+        with self._lock:
+            self._repor()
+            if taxa:
+                self.taxa = taxa
+            if capacidade:
+                self.capacidade = capacidade
+            if disponivel is not None:
+                self._tokens = min(self._tokens, disponivel)
+
+
+def dominio(url: str) -> str:
+    """Domínio da URL em minúsculas, sem 'www.'."""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class LimitadorPorDominio:
+    """Um TokenBucket por domínio, criado sob demanda."""
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, url: str) -> TokenBucket:
+        chave = dominio(url)
+        with self._lock:
+            bucket = self._buckets.get(chave)
+            if bucket is None:
+                bucket = TokenBucket(self.taxa, self.capacidade)
+                self._buckets[chave] = bucket
+        return bucket
+
+    def adquirir(self, url: str) -> float:
+        return self._bucket(url).adquirir()
+
+    def tentar_adquirir(self, url: str) -> float:
+        """Versão sem bloqueio de adquirir(): 0 se liberou, senão os segundos que faltam."""
+        return self._bucket(url).tentar_adquirir()
+
+
+class LimitadorRpmTpm:
+    """
+    Limite de requisições e tokens por minuto (RPM/TPM) de um modelo de LLM,
+    com um TokenBucket para cada dimensão.
+
+    Os limites configurados são só o ponto de partida: ajustar() sincroniza os
+    buckets com o que a API informa nos cabeçalhos de cada resposta (limite,
+    restante, tempo até o reset), mantendo uma folga de `margem`, e pausar()
+    segura todas as chamadas até o fim de um 429.
+    """
+
+    def __init__(self, rpm: float, tpm: float, margem: float = 0.05):
+        self.requisicoes = TokenBucket(rpm / 60.0, rpm)
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.margem = margem
+        self._pausa_ate = 0.0
+        self._lock = threading.Lock()
+
+    def pausar(self, segundos: float) -> None:
+        """Segura novas chamadas por `segundos` (ex.: 429 com Retry-After)."""
+        with self._lock:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+
+    def _aguardar_pausa(self) -> float:
+        esperado = 0.0
+        while True:
+            with self._lock:
+                espera = self._pausa_ate - time.monotonic()
+            if espera <= 0:
+                return esperado
+            time.sleep(espera)
+            esperado += espera
+
+    def ajustar(
+        self,
+        limite_req: float = None, restantes_req: float = None, reset_req: float = None,
+        limite_tok: float = None, restantes_tok: float = None, reset_tok: float = None
+    ) -> None:
+        """
+        Sincroniza com os limites informados pelo servidor. Com o saldo abaixo
+        da folga, pausa até o reset informado; senão o bucket passa a ter no
+        máximo o saldo restante (menos a folga).
+        """
+        for bucket, limite, restantes, reset in (
+            (self.requisicoes, limite_req, restantes_req, reset_req),
+            (self.tokens, limite_tok, restantes_tok, reset_tok),
+        ):
+            if limite:
+                bucket.ajustar(taxa=limite * (1 - self.margem) / 60.0, capacidade=limite)
+            if restantes is None:
+                continue
+            reserva = (limite or bucket.capacidade) * self.margem
+            if restantes <= reserva and reset:
+                self.pausar(reset)
+            else:
+                bucket.ajustar(disponivel=restantes - reserva)
+
+    def adquirir(self, tokens_estimados: float) -> float:
+        """Bloqueia até haver 1 requisição e `tokens_estimados` tokens. Retorna o tempo esperado (s)."""
+        esperado = self._aguardar_pausa()
+        return esperado + self.requisicoes.adquirir() + self.tokens.adquirir(tokens_estimados)
@@ -22,12 +22,14 @@ try:
         batch_client,
         aguardar_batch,
         baixar_resultados_batch,
+        lotes_do_arquivo_batch,
         fetch_approved_content,
         batch_summary,
         batch_embedding,
         batch_rating
     )
     from database import update_article_filter_score
+    from packed_filter import parsear_scores_lote
     from utils import logger
     import database
 except ImportError as e:
@@ -36,14 +38,38 @@ except ImportError as e:
     sys.exit(1)
 
 
-def processar_resultados_filtro(resultados):
+def processar_resultados_filtro(resultados, lotes=None):
     """
     Processa os resultados do batch de filtro e atualiza o banco.
     Replica a lógica do batch_filter (linhas 403-443 do batch.py).
+
+    Respostas em lote (custom_id "feed-lote-N") usam `lotes` (custom_id ->
+    ids, ver lotes_do_arquivo_batch). Artigos sem score válido nelas contam
+    como erro e ficam sem score, para o próximo batch_filter reavaliar.
     """
+    lotes = lotes or {}
     stats = {"total": len(resultados), "aprovados": 0, "rejeitados": 0, "erros": 0}
     
     for custom_id, resposta in resultados.items():
+        if "-lote-" in custom_id:
+            if custom_id not in lotes:
+                logger.warning(f"Lote sem ids no arquivo de entrada, ignorado: {custom_id}")
+                stats["erros"] += 1
+                continue
+            
+            scores = parsear_scores_lote(resposta, lotes[custom_id])
+            faltando = len(lotes[custom_id]) - len(scores)
+            if faltando:
+                logger.warning(f"{faltando} artigos sem score válido em {custom_id}")
+                stats["erros"] += faltando
+            for article_id, score in scores.items():
+                update_article_filter_score(article_id, score, source='llm')
+                if score >= 3:
+                    stats["aprovados"] += 1
+                else:
+                    stats["rejeitados"] += 1
+            continue
+        
         # Extrair article_id do custom_id (formato: "feed-123")
         parts = custom_id.rsplit("-", 1)
         if len(parts) != 2:
@@ -60,14 +86,16 @@ def processar_resultados_filtro(resultados):
         
         # Parsear score da resposta (1-5)
         match = re.search(r'\b([1-5])\b', resposta.strip())
+        origem = 'llm'
         if match:
             score = int(match.group(1))
         else:
             logger.warning(f"Score inválido para {custom_id}: '{resposta}'")
             score = 3  # Default se não conseguir parsear
+            origem = 'padrao'
         
         # Atualizar no banco
-        update_article_filter_score(article_id, score)
+        update_article_filter_score(article_id, score, source=origem)
         
         if score >= 3:
             stats["aprovados"] += 1
@@ -89,7 +117,7 @@ def main():
     logger.info(f"\n>>> Aguardando batch completar <<<")
     batch_status = aguardar_batch(BATCH_ID, description="filter (recuperado)")
     
-    #if not batch_status:
+    if not batch_status:
         logger.error("Batch falhou ou timeout!")
         sys.exit(1)
     
@@ -97,7 +125,7 @@ def main():
     logger.info(f"\n>>> Baixando resultados <<<")
     resultados = baixar_resultados_batch(batch_status, description="filter")
     
-    #if not resultados:
+    if not resultados:
         logger.error("Falha ao baixar resultados!")
         sys.exit(1)
     
@@ -105,7 +133,8 @@ def main():
     
     # 3. Processar resultados (atualizar banco com scores)
     logger.info(f"\n>>> Processando resultados do filtro <<<")
-    stats_filter = processar_resultados_filtro(resultados)
+    lotes = lotes_do_arquivo_batch(batch_status)
+    stats_filter = processar_resultados_filtro(resultados, lotes)
     logger.info(f"Filtro concluído: {stats_filter}")
     
     # 4. Continuar pipeline - Fase 3
@@ -1,12 +1,26 @@
 # simple-meridian/run_briefing.py
 
-import os, importlib, feedparser, json, time, re, anthropic, openai, argparse, sys
+import os, importlib, json, time, re, anthropic, openai, argparse, sys, threading
 import numpy as np
 from sklearn.cluster import KMeans
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
-from utils import fetch_article_content_and_og_image
+from content_pipeline import buscar_e_extrair
+from utils import canonicalizar_url
+from llm_executor import mapear_concorrente, CotaExcedida, estimar_tokens, limitador_para, registrar_resposta, registrar_erro
+import llm_cache
+import embedding_cache
+from prompt_cache import dividir_template, bloco_sistema
+import token_budget
+import prefilter
+from fused_summary import montar_prompt_fundido, parsear_resposta_fundida, RESPONSE_FORMAT as FUSED_RESPONSE_FORMAT
+from packed_filter import dividir_em_lotes, montar_prompt_lote, max_tokens_lote, parsear_scores_lote
+import domain_stats
+from rate_limit import LimitadorPorDominio
+from feed_fetcher import (
+    buscar_feeds, feeds_devidos, feed_nao_modificado, circuito_aberto, registrar_estado_feeds, resumo_feeds
+)
 
 try:
     import config_base as config # Load base config first
@@ -87,7 +101,13 @@ def is_quota_exceeded_error(exception: Exception) -> bool:
 def handle_quota_exceeded(error_context: str = ""):
     """
     Envia notificação no Telegram e encerra o script quando a quota da OpenAI é excedida.
+
+    Numa thread de mapear_concorrente só levanta CotaExcedida: o alerta e a
+    saída ficam com a thread principal, uma vez só (ver run_concurrently).
     """
+    if threading.current_thread() is not threading.main_thread():
+        raise CotaExcedida(error_context)
+
     print("\n" + "=" * 60)
     print("ERRO CRÍTICO: Quota da OpenAI excedida!")
     print("=" * 60)
@@ -115,20 +135,43 @@ def handle_quota_exceeded(error_context: str = ""):
     sys.exit(1)
 
 
+def run_concurrently(items, func, effective_config):
+    """
+    mapear_concorrente with the profile's LLM_MAX_IN_FLIGHT. A quota error in
+    any call cancels the pending ones and is handled here, in the main thread.
+    """
+    try:
+        yield from mapear_concorrente(
+            items,
+            func,
+            max_em_voo=getattr(effective_config, 'LLM_MAX_IN_FLIGHT', config.LLM_MAX_IN_FLIGHT)
+        )
+    except CotaExcedida as e:
+        handle_quota_exceeded(str(e))
+
+
 def get_deepseek_embedding(text, model=config.EMBEDDING_MODEL):
     """Gets embeddings."""
+    cached = embedding_cache.get(text, model)
+    if cached:
+        return cached
+
     print(f"INFO: Attempting to get embedding for text snippet: '{text[:50]}...'")
+    limitador_para(model).adquirir(estimar_tokens(text))
 
     try:
-         response = embedding_client.embeddings.create(
+         raw_response = embedding_client.embeddings.with_raw_response.create(
              model=model, # Use the actual model name from Deepseek docs
              input=[text] # API likely expects a list of strings
          )
+         registrar_resposta(model, raw_response.headers)
+         response = raw_response.parse()
          # Access the embedding vector based on the actual API response structure
          if response.data and len(response.data) > 0:
               embedding = response.data[0].embedding
               # Validate embedding is not empty and has valid structure
               if embedding and len(embedding) > 0:
+                  embedding_cache.put(text, embedding, model)
                   return embedding
               else:
                   print(f"Warning: Empty or invalid embedding returned for text.")
@@ -140,12 +183,96 @@ def get_deepseek_embedding(text, model=config.EMBEDDING_MODEL):
          if is_quota_exceeded_error(e):
             handle_quota_exceeded(f"geração de embedding com modelo {model}")
 
+         registrar_erro(model, e)
          print(f"Error calling Embedding API: {e}")
          return None
+
+
+def group_embedding_inputs(texts, max_items, max_tokens):
+    """
+    Splits texts into request groups of at most max_items texts and roughly
+    max_tokens tokens. Returns lists of indexes into texts.
+    """
+    groups = []
+    current, current_tokens = [], 0
+    for index, text in enumerate(texts):
+        tokens = estimar_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def get_embeddings_batch(texts, model=config.EMBEDDING_MODEL):
+    """
+    Gets embeddings for many texts, sending them in groups (EMBEDDING_BATCH_MAX_ITEMS
+    texts / EMBEDDING_BATCH_MAX_TOKENS tokens per request). Vectors are mapped back
+    by index; returns a list aligned with texts, with None where no embedding came back.
+    A group whose request fails falls back to one request per text.
+    """
+    # Texts already embedded (same normalized text and model) come from the cache
+    embeddings = embedding_cache.buscar(texts, model)
+    missing_indexes = [i for i, e in enumerate(embeddings) if not e]
+    if len(missing_indexes) < len(texts):
+        print(f"INFO: {len(texts) - len(missing_indexes)} embeddings found in cache.")
+
+    groups = group_embedding_inputs(
+        [texts[i] for i in missing_indexes], config.EMBEDDING_BATCH_MAX_ITEMS, config.EMBEDDING_BATCH_MAX_TOKENS
+    )
+    limiter = limitador_para(model)
+
+    for group in groups:
+        group = [missing_indexes[i] for i in group]
+        group_texts = [texts[i] for i in group]
+        print(f"INFO: Requesting {len(group)} embeddings in one call...")
+        limiter.adquirir(sum(estimar_tokens(t) for t in group_texts))
+
+        try:
+            raw_response = embedding_client.embeddings.with_raw_response.create(model=model, input=group_texts)
+            registrar_resposta(model, raw_response.headers)
+            response = raw_response.parse()
+            for item in response.data:
+                # item.index is the position inside this request's input list
+                if 0 <= item.index < len(group) and item.embedding:
+                    embeddings[group[item.index]] = item.embedding
+            embedding_cache.gravar(group_texts, [embeddings[i] for i in group], model)
+        except Exception as e:
+            if is_quota_exceeded_error(e):
+                handle_quota_exceeded(f"geração de embedding com modelo {model}")
+            registrar_erro(model, e)
+            print(f"Error calling Embedding API for a group of {len(group)} texts: {e}. Falling back to one request per text.")
+            for i in group:
+                embeddings[i] = get_deepseek_embedding(texts[i], model=model)
+
+    missing = sum(1 for e in embeddings if not e)
+    if missing:
+        print(f"Warning: {missing} of {len(texts)} texts got no embedding.")
+    return embeddings
     
 
-def call_llm(prompt, model, system_prompt=None, max_tokens=2048, temperature=0.7):
-    """Calls the Claude API for chat completion."""
+def call_llm(prompt, model, system_prompt=None, max_tokens=2048, temperature=0.7, use_cache=True, response_format=None,
+             validate=None):
+    """
+    Calls the Claude API for chat completion.
+    response_format (OpenAI structured output) is ignored by Claude models.
+    validate: optional response -> bool; responses it rejects are not cached
+    (and cached ones it rejects are ignored), so a bad reply is not replayed.
+    """
+
+    # Identical (provider, model, parameters, prompt) calls are answered from the LLM cache
+    cache_entry = llm_cache.registro(
+        llm_cache.provedor_do_modelo(model), model, prompt,
+        {"system": system_prompt, "max_tokens": max_tokens, "temperature": temperature,
+         "response_format": response_format}
+    )
+    if use_cache:
+        cached = llm_cache.get(cache_entry)
+        if cached is not None and (validate is None or validate(cached)):
+            return cached
 
     max_retries = 3
     base_wait_time = 2
@@ -155,35 +282,51 @@ def call_llm(prompt, model, system_prompt=None, max_tokens=2048, temperature=0.7
         fallback_model = "gpt-5-mini"
         print(f"  Fallback model configured: {fallback_model}")
     
-    result = _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max_retries, base_wait_time)
+    result = _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max_retries, base_wait_time,
+                               response_format)
 
     if result is None and fallback_model:
         print(f"  ⚠ All attempts with {model} failed. Trying fallback model {fallback_model}...")
         
         fallback_retries = 2
         result = _attempt_llm_call(prompt, fallback_model, system_prompt, max_tokens, 
-                                   temperature, fallback_retries, base_wait_time)
+                                   temperature, fallback_retries, base_wait_time, response_format)
         
         if result is not None:
             print(f"  ✓ Fallback successful with {fallback_model}")
         else:
             print(f"  ✗ Fallback also failed with {fallback_model}")
     
+    if result is not None and (validate is None or validate(result)):
+        llm_cache.put(cache_entry, result)
 
     return result
 
 
-def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max_retries, base_wait_time):
+def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max_retries, base_wait_time,
+                      response_format=None):
     """
     Tenta fazer uma chamada LLM com retries.
     Esta é uma função auxiliar usada por call_llm.
+
+    Cada tentativa passa pelo limitador do modelo, que é ajustado pelos
+    cabeçalhos de rate limit da resposta; um 429 pausa o modelo pelo tempo
+    pedido pela API, então só os outros erros usam backoff exponencial.
     """
-    
+    limiter = limitador_para(model)
+    estimated_tokens = estimar_tokens((system_prompt or "") + prompt, max_tokens)
+    rate_limited = False
+
     for attempt in range(max_retries):
-        if attempt > 0:
+        if attempt > 0 and not rate_limited:
             wait_time = base_wait_time * (2 ** (attempt - 1))  # Backoff exponencial
             print(f"  Retry attempt {attempt + 1}/{max_retries} after {wait_time}s wait...")
             time.sleep(wait_time)
+        elif attempt > 0:
+            print(f"  Retry attempt {attempt + 1}/{max_retries} after rate limit pause...")
+
+        limiter.adquirir(estimated_tokens)
+        rate_limited = False
 
         if model.startswith("gpt"):
             try:
@@ -192,11 +335,15 @@ def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max
                     messages.append({"role": "system", "content": system_prompt})
                 messages.append({"role": "user", "content": prompt})
                 
-                response = openai_chat_client.chat.completions.create(
+                extra_params = {"response_format": response_format} if response_format else {}
+                raw_response = openai_chat_client.chat.completions.with_raw_response.create(
                     model=model,
                     messages=messages,
-                    max_completion_tokens=max_tokens
+                    max_completion_tokens=max_tokens,
+                    **extra_params
                 )
+                registrar_resposta(model, raw_response.headers)
+                response = raw_response.parse()
 
                 content = response.choices[0].message.content
                 result = content.strip() if content else None
@@ -215,27 +362,27 @@ def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max
                 if is_quota_exceeded_error(e):
                     handle_quota_exceeded(f"chamada LLM com modelo {model}")
 
+                rate_limited = registrar_erro(model, e)
                 if attempt == max_retries - 1:
                     print(f"  Error on attempt {attempt + 1}/{max_retries} with {model}: {e}")
                 else:
                     print(f"  Error on attempt {attempt + 1}: {e}, will retry...")
-                time.sleep(1)
             
 
         elif model.startswith("claude"):
             try:
                 if system_prompt:
-                    response = client.messages.create(
+                    raw_response = client.messages.with_raw_response.create(
                         model=model,
                         max_tokens=max_tokens,
                         temperature=temperature,
-                        system=system_prompt,
+                        system=bloco_sistema(system_prompt), # Static prefix, marked for prompt caching
                         messages=[
                             {"role": "user", "content": prompt}
                         ]
                     )
                 else:
-                    response = client.messages.create(
+                    raw_response = client.messages.with_raw_response.create(
                         model=model,
                         max_tokens=2048,
                         temperature=0.7,
@@ -243,12 +390,16 @@ def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max
                             {"role": "user", "content": prompt}
                         ]
                     )
+                registrar_resposta(model, raw_response.headers)
+                response = raw_response.parse()
                 return response.content[0].text.strip()                                         # type: ignore
             
             except Exception as e:
                 print(f"Error calling Claude API: {e}")
-                time.sleep(1)
-                return None
+                # Só 429 é repetido (depois da pausa pedida pela API)
+                rate_limited = registrar_erro(model, e)
+                if not rate_limited:
+                    return None
         
         else:
             print(f"Unknown model type: {model}")
@@ -257,6 +408,24 @@ def _attempt_llm_call(prompt, model, system_prompt, max_tokens, temperature, max
     return None
 
 
+DEFAULT_PROMPT_INITIAL_FILTER = """Avalie rapidamente se este artigo parece relevante para o tema '{feed_profile}'.
+
+            Título: {title}
+            Descrição: {description}
+
+            Baseado APENAS nestas informações, dê um score de 1 a 5:
+
+            1 = Completamente irrelevante, descarte
+            2 = Provavelmente irrelevante, mas não tenho certeza
+            3 = Pode ser relevante, vale investigar
+            4 = Provavelmente relevante
+            5 = Claramente relevante e importante
+
+            Seja CONSERVADOR - na dúvida, dê score menor. É melhor descartar um artigo duvidoso que processar muito lixo.
+
+            Responda APENAS com o número (1-5)."""
+
+
 def evaluate_rss_snippet_relevance(title, description, feed_profile, effective_config):
     """
     Evaluates if an RSS entry is worth fetching and processing based on title and snippet.
@@ -274,26 +443,7 @@ def evaluate_rss_snippet_relevance(title, description, feed_profile, effective_c
     
     filter_model = getattr(effective_config, 'FILTER_MODEL', config.FILTER_MODEL)
     
-    filter_prompt_template = getattr(
-        effective_config, 
-        'PROMPT_INITIAL_FILTER',
-        """Avalie rapidamente se este artigo parece relevante para o tema '{feed_profile}'.
-
-            Título: {title}
-            Descrição: {description}
-
-            Baseado APENAS nestas informações, dê um score de 1 a 5:
-
-            1 = Completamente irrelevante, descarte
-            2 = Provavelmente irrelevante, mas não tenho certeza
-            3 = Pode ser relevante, vale investigar
-            4 = Provavelmente relevante
-            5 = Claramente relevante e importante
-
-            Seja CONSERVADOR - na dúvida, dê score menor. É melhor descartar um artigo duvidoso que processar muito lixo.
-
-            Responda APENAS com o número (1-5)."""
-    )
+    filter_prompt_template = getattr(effective_config, 'PROMPT_INITIAL_FILTER', DEFAULT_PROMPT_INITIAL_FILTER)
     
     prompt = filter_prompt_template.format(
         feed_profile=feed_profile,
@@ -330,6 +480,54 @@ def evaluate_rss_snippet_relevance(title, description, feed_profile, effective_c
 
 # --- Core Functions ---
 
+def evaluate_rss_snippets_packed(items, feed_profile, effective_config):
+    """
+    Scores several RSS snippets with one LLM call per pack of FILTER_PACK_SIZE items.
+
+    Args:
+        items: list of dicts with 'id', 'title' and 'description'
+        feed_profile: Which feed profile this is for
+        effective_config: Config object with prompts and model settings
+
+    Returns:
+        dict: {id: score 1-5}. Items missing from a pack's JSON answer are
+        re-evaluated one by one; items that still fail are left out.
+    """
+    filter_model = getattr(effective_config, 'FILTER_MODEL', config.FILTER_MODEL)
+    filter_prompt_template = getattr(effective_config, 'PROMPT_INITIAL_FILTER', DEFAULT_PROMPT_INITIAL_FILTER)
+    pack_size = getattr(effective_config, 'FILTER_PACK_SIZE', config.FILTER_PACK_SIZE)
+
+    scores = {}
+    for pack in dividir_em_lotes(items, pack_size):
+        ids = [item['id'] for item in pack]
+        print(f"  Evaluating pack of {len(pack)} snippets...")
+
+        response = None
+        try:
+            response = call_llm(
+                montar_prompt_lote(filter_prompt_template, feed_profile, pack),
+                model=filter_model,
+                max_tokens=max_tokens_lote(len(pack)),
+                temperature=0
+            )
+        except Exception as e:
+            print(f"  Error in packed filter evaluation: {e}")
+
+        pack_scores = parsear_scores_lote(response, ids)
+        scores.update(pack_scores)
+
+        # Per-item fallback for anything the packed answer didn't cover
+        missing = [item for item in pack if item['id'] not in pack_scores]
+        if missing:
+            print(f"  Packed answer missing {len(missing)}/{len(pack)} scores, evaluating them one by one")
+        for item in missing:
+            score = evaluate_rss_snippet_relevance(item['title'], item['description'], feed_profile, effective_config)
+            if score is not None:
+                scores[item['id']] = score
+
+    return scores
+
+
 def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
     """Scrapes articles for a specific feed profile."""
     print(f"\n--- Starting Article Scraping [{feed_profile}] ---")
@@ -353,16 +551,42 @@ def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
 
 
     new_articles_count = 0
+    pending_filter = []  # New entries waiting for the relevance filter
+    candidates = []  # Entries that passed the filter, waiting for content
+    seen_canonical_urls = set()
     if not rss_feeds:
         print(f"Warning: No RSS_FEEDS defined for profile '{feed_profile}'. Skipping scrape.")
         return
 
-    for feed_url in rss_feeds:
+    # Adaptive schedule: only feeds that are due on this run are fetched
+    due_feeds, postponed_feeds = feeds_devidos(rss_feeds, feed_profile)
+    if postponed_feeds:
+        print(f"{len(postponed_feeds)} feeds not due yet, skipping them this run")
+
+    # Download every due feed concurrently up front; entries are handled below as before
+    fetched_feeds = buscar_feeds(due_feeds, feed_profile=feed_profile)
+
+    for feed_url in due_feeds:
         print(f"Fetching feed: {feed_url}")
-        feed = feedparser.parse(feed_url)
+        feed = fetched_feeds.get(feed_url)
+
+        if feed is None:
+            print(f"Warning: Could not fetch feed {feed_url}. Skipping.")
+            continue
+
+        if circuito_aberto(feed):
+            print(f"  Circuit open (recent failures or slow responses). Skipping.")
+            continue
+
+        if feed_nao_modificado(feed):
+            print(f"  Feed not modified since last run (304). Skipping.")
+            continue
 
         if feed.bozo: print(f"Warning: Potential issue parsing feed {feed_url}: {feed.bozo_exception}")
 
+        # One bulk lookup per feed instead of one query per entry
+        existing_urls = database.get_existing_urls([e.get('link') for e in feed.entries])
+
         for entry in feed.entries:
             replaces = [
                 ("/", "%2F"),
@@ -395,18 +619,67 @@ def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
                 print(f"  Skipping old article from {published_date.strftime('%Y-%m-%d')}: {title[:60]}...")            # type: ignore
                 continue
 
-            # --- Check if article exists ---
-            with get_db_connection() as session:
-                exists = session.exec(select(Article).where(Article.url == url)).first()
-            if exists: continue
+            # --- Check if article exists (exact or canonical URL) ---
+            if url in existing_urls: continue
+            canonical_url = canonicalizar_url(url)
+            if canonical_url in seen_canonical_urls: continue # Same article under another URL in this run
+            seen_canonical_urls.add(canonical_url)
             # --- End Check ---
 
 
-            # FILTRO INICIAL - Avaliar se vale a pena processar este artigo
+            # The relevance filter runs after every feed was read, so snippets can be packed
+            pending_filter.append({
+                'id': len(pending_filter),
+                'entry': entry,
+                'url': url,
+                'url_encoding': url_encoding,
+                'title': title,
+                'description': description,
+                'published_date': published_date,
+                'feed_source': feed_source,
+            })
+
+    # FILTRO INICIAL - Avaliar se vale a pena processar cada artigo
+    min_filter_score = getattr(effective_config, 'MIN_INITIAL_FILTER_SCORE', 3)
+    packed_filter = getattr(effective_config, 'FILTER_PACKED_ENABLED', config.FILTER_PACKED_ENABLED)
+
+    # Local pre-filter: snippets it is confident about skip the LLM filter
+    prefilter_before = prefilter.estatisticas()
+    prefilter_scores = dict(zip(
+        (item['id'] for item in pending_filter),
+        prefilter.classificar(
+            feed_profile,
+            [prefilter.texto_snippet(item['title'], item['description']) for item in pending_filter],
+            effective_config
+        )
+    ))
+    llm_pending = [item for item in pending_filter if prefilter_scores[item['id']] is None]
+
+    packed_scores = {}
+    if packed_filter and llm_pending:
+        print(f"Evaluating {len(llm_pending)} snippets in packs...")
+        packed_scores = evaluate_rss_snippets_packed(llm_pending, feed_profile, effective_config)
+
+    for item in pending_filter:
+        entry = item['entry']
+        url = item['url']
+        url_encoding = item['url_encoding']
+        title = item['title']
+        description = item['description']
+        published_date = item['published_date']
+        feed_source = item['feed_source']
+
+        filter_source = 'llm'
+        filter_score = prefilter_scores[item['id']]
+        if filter_score is not None:
+            filter_source = 'prefiltro'
+            print(f"  Pre-filter score: {filter_score}/5 - {title[:60]}...")
+        elif packed_filter:
+            filter_score = packed_scores.get(item['id'])
+            if filter_score is not None:
+                print(f"  Initial filter score: {filter_score}/5 - {title[:60]}...")
+        else:
             print(f"Evaluating: {title[:70]}...")
-
-            min_filter_score = getattr(effective_config, 'MIN_INITIAL_FILTER_SCORE', 3)
-
             filter_score = evaluate_rss_snippet_relevance(
                 title, 
                 description, 
@@ -414,13 +687,142 @@ def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
                 effective_config
             )
 
-            if filter_score is None:
-                filter_score = 3
-                print(f"  Filter evaluation failed, assuming score 3")
+        if filter_score is None:
+            filter_score = 3
+            filter_source = 'padrao'
+            print(f"  Filter evaluation failed, assuming score 3")
+
+        if filter_score < min_filter_score:
+            print(f"  FILTERED OUT (score {filter_score} < {min_filter_score})")
+
+            database.add_article(
+                url=url,
+                title=title,
+                published_date=published_date,
+                feed_source=feed_source,
+                raw_content=None,
+                feed_profile=feed_profile,
+                url_encoding=url_encoding,
+                image_url=None,
+                initial_filter_score=filter_score,
+                rss_description=description,
+                filter_source=filter_source
+            )
+
+            continue
+
+        print(f"  PASSED filter (score {filter_score} >= {min_filter_score})")
+
+
+        print(f"Processing new entry: {title} ({url})")
+
+        # --- 1. Try getting image from RSS feed ---
+        rss_image_url = None
+        # Check enclosures
+        if 'enclosures' in entry:
+            for enc in entry.enclosures:
+                if enc.get('type', '').startswith('image/'):
+                    rss_image_url = enc.get('href')
+                    break # Take the first image enclosure
+        # Check media_content if no enclosure image found
+        if not rss_image_url and 'media_content' in entry:
+             for media in entry.media_content:
+                 if media.get('medium') == 'image' and media.get('url'):
+                      rss_image_url = media.get('url')
+                      break # Take the first media image
+                 elif media.get('type', '').startswith('image/') and media.get('url'):
+                      rss_image_url = media.get('url')
+                      break
+        # Check simple image tag (less common)
+        if not rss_image_url and 'image' in entry and isinstance(entry.image, dict) and entry.image.get('url'):
+            rss_image_url = entry.image.get('url')
+
+        if rss_image_url:
+            print(f"  Found image in RSS: {rss_image_url[:60]}...")
+        # --- End RSS Image Check ---
+
+        # Content is fetched for all candidates at once, after every feed was read
+        candidates.append({
+            'url': url,
+            'url_encoding': url_encoding,
+            'title': title,
+            'published_date': published_date,
+            'feed_source': feed_source,
+            'filter_score': filter_score,
+            'filter_source': filter_source,
+            'description': description,
+            'rss_image_url': rss_image_url,
+        })
+
+    # --- 2. Fetch Article Content & OG Image ---
+    # Downloads run on a thread pool (rate-limited per domain) and HTML extraction
+    # on a process pool; results arrive here as they are ready.
+    print(f"Fetching content for {len(candidates)} articles...")
+    limiter = LimitadorPorDominio(config.CONTENT_FETCH_DOMAIN_RATE, config.CONTENT_FETCH_DOMAIN_BURST)
+
+    results = buscar_e_extrair(
+        candidates,
+        obter_urls=lambda c: (c['url'], c['url_encoding']),
+        limitador=limiter
+    )
+
+    for candidate, fetch_result, marreta, fetch_error in results:
+        url = candidate['url']
+        url_encoding = candidate['url_encoding']
+        title = candidate['title']
+        published_date = candidate['published_date']
+        feed_source = candidate['feed_source']
+        filter_score = candidate['filter_score']
+        rss_image_url = candidate['rss_image_url']
+
+        print(f"Fetched: {title[:70]} ({url})")
+        if fetch_error is not None:
+            print(f"  Error fetching {url}: {fetch_error}")
+
+        raw_content = fetch_result['content']
+        formatted_content = fetch_result['formatted']
+        og_image_url = fetch_result['og_image']
+        # --- End Fetch ---
+
+        if not raw_content:
+            print(f"  Skipping article, failed to extract main content: {title}")
+            continue
+
+        MIN_CONTENT_LENGTH = 500
+        if len(raw_content) < MIN_CONTENT_LENGTH:
+            print(f"  FILTERED: Content too short ({len(raw_content)} chars, minimum {MIN_CONTENT_LENGTH})")
+            print(f"  Skipping: {title[:70]}...")
+            domain_stats.registrar_rejeicao(url, 'curto', marreta)
+            # Salva no banco com initial_filter_score baixo para não tentar de novo
+            database.add_article(
+                url=url,
+                title=title,
+                published_date=published_date,
+                feed_source=feed_source,
+                raw_content=None,
+                feed_profile=feed_profile,
+                url_encoding=url_encoding,
+                image_url=None,
+                initial_filter_score=1,
+                marreta=marreta,
+                filter_source='conteudo'
+            )
+            continue
+
+
+        content_tail = raw_content[-50:].strip()
+        last_char = content_tail[-1] if content_tail else ''
 
-            if filter_score < min_filter_score:
-                print(f"  FILTERED OUT (score {filter_score} < {min_filter_score})")
+        if last_char.isalnum():
+            last_words = content_tail.split()[-3:]
+            last_fragment = ' '.join(last_words)
 
+            if len(last_words[-1]) < 3 and len(raw_content) < 3000:
+                print(f"  WARNING: Article appears truncated (ends with: '...{content_tail[-30:]}')")
+                print(f"  Content length: {len(raw_content)} chars")
+                print(f"  Skipping: {title[:70]}...")
+                domain_stats.registrar_rejeicao(url, 'truncado', marreta)
+                
                 database.add_article(
                     url=url,
                     title=title,
@@ -430,58 +832,34 @@ def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
                     feed_profile=feed_profile,
                     url_encoding=url_encoding,
                     image_url=None,
-                    initial_filter_score=filter_score
+                    initial_filter_score=1,
+                    marreta=marreta,
+                    filter_source='conteudo'
                 )
-
                 continue
 
-            print(f"  PASSED filter (score {filter_score} >= {min_filter_score})")
-
-
-            print(f"Processing new entry: {title} ({url})")
-
-            # --- 1. Try getting image from RSS feed ---
-            rss_image_url = None
-            # Check enclosures
-            if 'enclosures' in entry:
-                for enc in entry.enclosures:
-                    if enc.get('type', '').startswith('image/'):
-                        rss_image_url = enc.get('href')
-                        break # Take the first image enclosure
-            # Check media_content if no enclosure image found
-            if not rss_image_url and 'media_content' in entry:
-                 for media in entry.media_content:
-                     if media.get('medium') == 'image' and media.get('url'):
-                          rss_image_url = media.get('url')
-                          break # Take the first media image
-                     elif media.get('type', '').startswith('image/') and media.get('url'):
-                          rss_image_url = media.get('url')
-                          break
-            # Check simple image tag (less common)
-            if not rss_image_url and 'image' in entry and isinstance(entry.image, dict) and entry.image.get('url'):
-                rss_image_url = entry.image.get('url')
-
-            if rss_image_url:
-                print(f"  Found image in RSS: {rss_image_url[:60]}...")
-            # --- End RSS Image Check ---
-
-            # --- 2. Fetch Article Content & OG Image ---
-            print(f"  Fetching article content and OG image...")
-            fetch_result, marreta = fetch_article_content_and_og_image(url, url_encoding)
-            raw_content = fetch_result['content']
-            formatted_content = fetch_result['formatted']
-            og_image_url = fetch_result['og_image']
-            # --- End Fetch ---
-
-            if not raw_content:
-                print(f"  Skipping article, failed to extract main content: {title}")
-                continue
+            
+            if len(raw_content) < 2000:
+                print(f"  WARNING: Short article ending without punctuation")
+                print(f"  Last fragment: '...{content_tail[-30:]}'")
+                print(f"  Will attempt to process, but may be incomplete")
 
-            MIN_CONTENT_LENGTH = 500
-            if len(raw_content) < MIN_CONTENT_LENGTH:
-                print(f"  FILTERED: Content too short ({len(raw_content)} chars, minimum {MIN_CONTENT_LENGTH})")
+        
+        paywall_indicators = [
+            'subscribe to continue reading',
+            'this content is for subscribers',
+            'sign up to read more',
+            'become a member to',
+            'subscribe for full access',
+            'continue reading for',
+        ]
+
+        content_lower = raw_content[-200:].lower()  # Últimos 200 chars em lowercase
+        for indicator in paywall_indicators:
+            if indicator in content_lower:
+                print(f"  FILTERED: Paywall detected ('{indicator}')")
                 print(f"  Skipping: {title[:70]}...")
-                # Salva no banco com initial_filter_score baixo para não tentar de novo
+                domain_stats.registrar_rejeicao(url, 'paywall', marreta)
                 database.add_article(
                     url=url,
                     title=title,
@@ -492,95 +870,50 @@ def scrape_articles(feed_profile, rss_feeds, effective_config): # Added params
                     url_encoding=url_encoding,
                     image_url=None,
                     initial_filter_score=1,
-                    marreta=marreta
+                    marreta=marreta,
+                    filter_source='conteudo'
                 )
                 continue
 
 
-            content_tail = raw_content[-50:].strip()
-            last_char = content_tail[-1] if content_tail else ''
-
-            if last_char.isalnum():
-                last_words = content_tail.split()[-3:]
-                last_fragment = ' '.join(last_words)
-
-                if len(last_words[-1]) < 3 and len(raw_content) < 3000:
-                    print(f"  WARNING: Article appears truncated (ends with: '...{content_tail[-30:]}')")
-                    print(f"  Content length: {len(raw_content)} chars")
-                    print(f"  Skipping: {title[:70]}...")
+        # Se chegou aqui, o conteúdo passou em todas as verificações
+        print(f"  ✓ Content validation passed ({len(raw_content)} chars)")
                     
-                    database.add_article(
-                        url=url,
-                        title=title,
-                        published_date=published_date,
-                        feed_source=feed_source,
-                        raw_content=None,
-                        feed_profile=feed_profile,
-                        url_encoding=url_encoding,
-                        image_url=None,
-                        initial_filter_score=1,
-                        marreta=marreta
-                    )
-                    continue
-
-                
-                if len(raw_content) < 2000:
-                    print(f"  WARNING: Short article ending without punctuation")
-                    print(f"  Last fragment: '...{content_tail[-30:]}'")
-                    print(f"  Will attempt to process, but may be incomplete")
-
-            
-            paywall_indicators = [
-                'subscribe to continue reading',
-                'this content is for subscribers',
-                'sign up to read more',
-                'become a member to',
-                'subscribe for full access',
-                'continue reading for',
-            ]
-
-            content_lower = raw_content[-200:].lower()  # Últimos 200 chars em lowercase
-            for indicator in paywall_indicators:
-                if indicator in content_lower:
-                    print(f"  FILTERED: Paywall detected ('{indicator}')")
-                    print(f"  Skipping: {title[:70]}...")
-                    database.add_article(
-                        url=url,
-                        title=title,
-                        published_date=published_date,
-                        feed_source=feed_source,
-                        raw_content=None,
-                        feed_profile=feed_profile,
-                        url_encoding=url_encoding,
-                        image_url=None,
-                        initial_filter_score=1,
-                        marreta=marreta
-                    )
-                    continue
-
-
-            # Se chegou aqui, o conteúdo passou em todas as verificações
-            print(f"  ✓ Content validation passed ({len(raw_content)} chars)")
-                        
-
-            # --- 3. Determine Final Image URL and Save ---
-            final_image_url = rss_image_url if rss_image_url else og_image_url
-            if final_image_url:
-                 print(f"  Using image URL: {final_image_url[:60]}...")
-            else:
-                 print("  No image found in RSS or OG tags.")
-
-            article_id = database.add_article(
-                url, title, published_date, feed_source, raw_content,
-                feed_profile,
-                url_encoding,
-                final_image_url,
-                initial_filter_score=filter_score,
-                marreta=marreta,
-                formatted_content=formatted_content)
-            if article_id: new_articles_count += 1
-            time.sleep(0.5) # Be polite
 
+        # --- 3. Determine Final Image URL and Save ---
+        final_image_url = rss_image_url if rss_image_url else og_image_url
+        if final_image_url:
+             print(f"  Using image URL: {final_image_url[:60]}...")
+        else:
+             print("  No image found in RSS or OG tags.")
+
+        article_id = database.add_article(
+            url, title, published_date, feed_source, raw_content,
+            feed_profile,
+            url_encoding,
+            final_image_url,
+            initial_filter_score=filter_score,
+            marreta=marreta,
+            formatted_content=formatted_content,
+            rss_description=candidate['description'],
+            filter_source=candidate['filter_source'])
+        if article_id: new_articles_count += 1
+
+    # Per-domain outcomes drive the Marreta/origin routing of the next fetches
+    domain_stats.salvar()
+
+    # Only persist ETag/Last-Modified once the entries were handled
+    registrar_estado_feeds(fetched_feeds, feed_profile)
+
+    feed_stats = resumo_feeds(fetched_feeds)
+    print(f"Feeds: {feed_stats['ok']} fetched, {feed_stats['nao_modificados']} not modified, "
+          f"{feed_stats['falhas']} failed, {feed_stats['circuito_aberto']} skipped (circuit open), "
+          f"{len(postponed_feeds)} not due")
+    prefilter_stats = prefilter.estatisticas(desde=prefilter_before)
+    if prefilter_stats['chamadas_evitadas']:
+        print(f"Pre-filter: {prefilter_stats['rejeitados']} rejected, {prefilter_stats['aceitos']} accepted, "
+              f"{prefilter_stats['chamadas_evitadas']} LLM evaluations avoided "
+              f"(held-out precision {prefilter.precisao(feed_profile)})")
     print(f"--- Scraping Finished [{feed_profile}]. Added {new_articles_count} new articles. ---")
 
 
@@ -589,6 +922,9 @@ def process_articles(feed_profile, effective_config):
     print("\n--- Starting Article Processing ---")
     summary_model = getattr(effective_config, 'SUMMARY_MODEL', config.SUMMARY_MODEL)
     summary_prompt_template = getattr(effective_config, 'PROMPT_ARTICLE_SUMMARY', config.PROMPT_ARTICLE_SUMMARY)
+    # Fused mode: summary and impact score come back together, as JSON, from one call
+    fused = getattr(effective_config, 'FUSED_SUMMARY_RATING', config.FUSED_SUMMARY_RATING)
+    rating_prompt_template = getattr(effective_config, 'PROMPT_IMPACT_RATING', config.PROMPT_IMPACT_RATING)
 
     unprocessed = database.get_unprocessed_articles(feed_profile, 1000)
     processed_count = 0
@@ -597,15 +933,65 @@ def process_articles(feed_profile, effective_config):
         return
 
     print(f"Found {len(unprocessed)} articles to process.")
-    for article in unprocessed:
-        print(f"Processing article ID: {article['id']} - {article['url'][:50]}...")
+    cache_before = llm_cache.estatisticas()
+    budget_before = token_budget.estatisticas('summary')
+    token_budgets = getattr(effective_config, 'TOKEN_BUDGETS', None)
 
+    def summarize(article):
         # 1. Summarize using Deepseek Chat
-        # Format the potentially profile-specific summary prompt
-        summary_prompt = summary_prompt_template.format(
-            article_content=article['raw_content'][:4000] # Limit context
+        # Trimmed to the 'summary' token budget, at a sentence boundary
+        article_content = token_budget.aparar_para_etapa(
+            article['raw_content'], 'summary', summary_model, token_budgets
         )
-        summary = call_llm(summary_prompt, model=summary_model)
+        if fused:
+            summary_prompt = montar_prompt_fundido(summary_prompt_template, rating_prompt_template, article_content)
+            response = call_llm(
+                summary_prompt, model=summary_model, response_format=FUSED_RESPONSE_FORMAT,
+                validate=lambda r: parsear_resposta_fundida(r)[0] is not None
+            )
+            summary, impact_score = parsear_resposta_fundida(response)
+            if summary:
+                return summary_prompt, summary, impact_score
+            # Reply not in the JSON format (model ignored response_format, truncated
+            # answer...): fall back to the plain summary; rate_articles scores it later
+            print(f"  Fused reply for article {article['id']} had no valid summary, using the plain summary prompt")
+
+        # Format the potentially profile-specific summary prompt
+        summary_prompt = summary_prompt_template.format(article_content=article_content)
+        return summary_prompt, call_llm(summary_prompt, model=summary_model), None
+
+    # 2. Embeddings are requested in groups, once EMBEDDING_BATCH_MAX_ITEMS
+    # summaries are ready (and for the remainder at the end)
+    pending_embedding = []
+
+    def embed_and_save():
+        nonlocal processed_count
+        if not pending_embedding:
+            return
+        # Use summary for embedding to focus on core topics and save tokens/time
+        embeddings = get_embeddings_batch([summary for _, summary, _ in pending_embedding])
+        for (article, summary, impact_score), embedding in zip(pending_embedding, embeddings):
+            if not embedding:
+                print(f"Skipping article {article['id']} due to embedding error.")
+                continue # Or store article without embedding if desired
+
+            # 3. Update Database
+            database.update_article_processing(article['id'], summary, embedding)
+            if impact_score is not None:
+                # Fused mode: already rated, rate_articles will skip it
+                database.update_article_rating(article['id'], impact_score)
+                print(f"  Article ID {article['id']} rated as: {impact_score}")
+            processed_count += 1
+            print(f"Successfully processed article ID: {article['id']}")
+        pending_embedding.clear()
+
+    # Calls run concurrently (LLM_MAX_IN_FLIGHT, RPM/TPM-limited per model);
+    # each result is written to the DB here as soon as it completes
+    results = run_concurrently(unprocessed, summarize, effective_config)
+
+    for article, result, error in results:
+        print(f"Processing article ID: {article['id']} - {article['url'][:50]}...")
+        summary_prompt, summary, impact_score = result if result else (None, None, None)
 
         if not summary:
             print(f"WARNING: Failed to summarize article {article['id']} after all attempts")
@@ -615,6 +1001,7 @@ def process_articles(feed_profile, effective_config):
                 article_record = session.exec(stmt).first()
                 if article_record:
                     article_record.initial_filter_score = 1
+                    article_record.filter_source = 'conteudo'
                     session.add(article_record)
                     session.commit()
             
@@ -632,11 +1019,11 @@ def process_articles(feed_profile, effective_config):
                     f.write(f"Timestamp: {datetime.now().isoformat()}\n")
                     f.write(f"Article ID: {article['id']}\n")
                     f.write(f"Article URL: {article['url']}\n")
-                    f.write(f"Prompt length: {len(summary_prompt)} characters\n")
+                    f.write(f"Prompt length: {len(summary_prompt or '')} characters\n")
                     f.write(f"\n{'='*80}\n")
                     f.write(f"FULL PROMPT:\n")
                     f.write(f"{'='*80}\n\n")
-                    f.write(summary_prompt)
+                    f.write(summary_prompt or f"(not built: {error})")
                 print(f"  Debug prompt saved to: {debug_file}")
             except Exception as e:
                 print(f"  Failed to save debug prompt: {e}")
@@ -646,21 +1033,18 @@ def process_articles(feed_profile, effective_config):
 
         print(f"Article summary is: {summary}")
 
-        # 2. Generate Embedding using Deepseek (or alternative)
-        # Use summary for embedding to focus on core topics and save tokens/time
-        embedding = get_deepseek_embedding(summary)
-
-        if not embedding:
-             print(f"Skipping article {article['id']} due to embedding error.")
-             continue # Or store article without embedding if desired
+        pending_embedding.append((article, summary, impact_score))
+        if len(pending_embedding) >= config.EMBEDDING_BATCH_MAX_ITEMS:
+            embed_and_save()
 
-        # 3. Update Database
-        database.update_article_processing(article['id'], summary, embedding)
-        processed_count += 1
-        print(f"Successfully processed article ID: {article['id']}")
-        time.sleep(1) # Avoid hitting API rate limits
+    embed_and_save()
 
-    print(f"--- Processing Finished. Processed {processed_count} articles. ---")
+    cache_stats = llm_cache.estatisticas(desde=cache_before)
+    budget_stats = token_budget.estatisticas('summary')
+    print(f"--- Processing Finished. Processed {processed_count} articles "
+          f"(LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses; "
+          f"{budget_stats['aparados'] - budget_before['aparados']} inputs trimmed, "
+          f"{budget_stats['tokens_economizados'] - budget_before['tokens_economizados']} tokens saved). ---")
 
 def rate_articles(feed_profile, effective_config):
     """Rates the impact of processed articles using an LLM."""
@@ -679,18 +1063,28 @@ def rate_articles(feed_profile, effective_config):
         return
 
     print(f"Found {len(unrated)} processed articles to rate.")
+    cache_before = llm_cache.estatisticas()
+
+    to_rate = []
     for article in unrated:
-        print(f"Rating article ID: {article['id']}: {article['title']}...")
-        summary = article['processed_content']
-        if not summary:
+        if not article['processed_content']:
             print(f"  Skipping article {article['id']} - no summary found.")
             continue
+        to_rate.append(article)
 
+    def rate(article):
         # Format the potentially profile-specific rating prompt
         rating_prompt = rating_prompt_template.format(
-            summary=summary
+            summary=article['processed_content']
         )
-        rating_response = call_llm(rating_prompt, model=rating_model)
+        return call_llm(rating_prompt, model=rating_model)
+
+    # Calls run concurrently (LLM_MAX_IN_FLIGHT, RPM/TPM-limited per model);
+    # each rating is written to the DB here as soon as it completes
+    results = run_concurrently(to_rate, rate, effective_config)
+
+    for article, rating_response, error in results:
+        print(f"Rating article ID: {article['id']}: {article['title']}...")
 
         impact_score = None
         if rating_response:
@@ -720,9 +1114,9 @@ def rate_articles(feed_profile, effective_config):
         # else: # Decide if you want to mark failed attempts differently
              # database.update_article_rating(article['id'], -1) # Example: Mark as failed with -1? Or leave NULL? Leaving NULL for now.
 
-        time.sleep(1) # API rate limiting
-
-    print(f"--- Rating Finished. Rated {rated_count} articles. ---")
+    cache_stats = llm_cache.estatisticas(desde=cache_before)
+    print(f"--- Rating Finished. Rated {rated_count} articles "
+          f"(LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses). ---")
 
 def append_article_references(brief_markdown, articles, feed_profile):
     """
@@ -882,21 +1276,22 @@ def generate_brief(feed_profile, effective_config): # Added feed_profile param
         cluster_summaries_text = "\n\n".join([f"- {s}" for s in cluster_summaries[:MAX_SUMMARIES_PER_CLUSTER]])
 
         # *** Format the chosen prompt template ***
-        analysis_prompt = cluster_analysis_prompt_template.format(
-            cluster_summaries_text=cluster_summaries_text,
+        # Static instructions go in the (cached) system prompt, the summaries in the user message
+        # (short templates, below the cacheable minimum, stay a single user prompt)
+        analysis_system, analysis_prompt = dividir_template(
+            cluster_analysis_prompt_template, 'cluster_summaries_text', cluster_summaries_text,
             feed_profile=feed_profile
         )
 
         # *** Call LLM with the formatted prompt ***
         #cluster_analysis = call_deepseek_chat(analysis_prompt) # System prompt could also be configurable
         #cluster_analysis = call_claude_chat(analysis_prompt)
-        cluster_analysis = call_llm(analysis_prompt, model=cluster_model)
+        cluster_analysis = call_llm(analysis_prompt, model=cluster_model, system_prompt=analysis_system)
 
         if cluster_analysis:
             # (Consider adding more robust filtering of non-analysis responses)
             if "unrelated" not in cluster_analysis.lower() or len(cluster_summaries) > 2:
                  cluster_analyses.append({"topic": f"Cluster {i+1}", "analysis": cluster_analysis, "size": len(cluster_summaries)})
-        time.sleep(1) # Rate limiting
     # --- End Analyze each cluster ---
 
     if not cluster_analyses:
@@ -916,11 +1311,11 @@ def generate_brief(feed_profile, effective_config): # Added feed_profile param
     
     brief_model = getattr(effective_config, 'BRIEF_MODEL', config.BRIEF_MODEL)
 
-    synthesis_prompt = brief_synthesis_prompt_template.format(
-        cluster_analyses_text=cluster_analyses_text,
+    synthesis_system, synthesis_prompt = dividir_template(
+        brief_synthesis_prompt_template, 'cluster_analyses_text', cluster_analyses_text,
         feed_profile=feed_profile
     )
-    final_brief_md = call_llm(synthesis_prompt, model=brief_model)
+    final_brief_md = call_llm(synthesis_prompt, model=brief_model, system_prompt=synthesis_system)
 
     if final_brief_md:
 
@@ -1062,6 +1457,12 @@ if __name__ == "__main__":
         action='store_true',
         help='Run preparation stages, generate newsletter and generate weekly briefing using Batch API. Runs: scrape → batch_filter → fetch_content → batch_summary → batch_embedding → batch_rating -> newsletter -> weekly briefing'
     )
+    parser.add_argument(
+        '--train-prefilter',
+        dest='train_prefilter',
+        action='store_true',
+        help='Train the local pre-filter on past LLM filter scores. Optional: use with --feed to train a specific feed only.'
+    )
 
     args = parser.parse_args()
 
@@ -1112,6 +1513,32 @@ if __name__ == "__main__":
         sys.exit(0)
 
 
+    # --- Local pre-filter training (offline) ---
+    if args.train_prefilter:
+        print(f"\nMeridian Pre-filter Training - {datetime.now()}")
+        print("Initializing database...")
+        database.init_db()
+
+        from utils import get_active_feeds
+        for feed in ([args.feed] if args.feed else get_active_feeds()):
+            print(f"\nTraining pre-filter [{feed}]...")
+            metrics = prefilter.treinar(feed)
+            if metrics is None:
+                print("  Not enough labelled snippets, skipping.")
+                continue
+            for side, label in (("rejeicao", "Auto-reject"), ("aceite", "Auto-accept")):
+                threshold = metrics[side]
+                if threshold:
+                    print(f"  {label}: p {'<=' if side == 'rejeicao' else '>='} {threshold['limiar']:.3f}, "
+                          f"precision {threshold['precisao']:.1%}, coverage {threshold['cobertura']:.1%}")
+                else:
+                    print(f"  {label}: disabled (precision target not reached)")
+            print(f"  Trained on {metrics['amostras']} labelled snippets")
+
+        print(f"\nRun Finished - {datetime.now()}")
+        sys.exit(0)
+
+
     # --- Batch prepare and newsletter generation via Batch API ---
     if args.batch_prepare_and_newsletter:
         print(f"\nMeridian Batch Prepare and Newsletter Generation Pipeline - {datetime.now()}")
@@ -0,0 +1,121 @@
+"""
+Orçamento de tokens para os textos enviados aos LLMs.
+
+Em vez de cortar o artigo num número fixo de caracteres (ou não cortar), cada
+etapa tem um orçamento em tokens (TOKEN_BUDGETS) e o texto é aparado para
+caber nele, de preferência no fim de uma frase. Isso limita o custo e a
+latência do pior caso — artigos enormes — sem mexer nos artigos normais.
+
+A contagem usa o tiktoken, se estiver instalado, para os modelos da OpenAI;
+para os demais (ou sem tiktoken) usa uma estimativa por caracteres.
+Os tokens economizados por etapa ficam em estatisticas().
+"""
+
+import logging, re, threading
+
+import config_base as config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # estimativa por caracteres como fallback
+    tiktoken = None
+
+# Caracteres por token na estimativa sem tokenizer (texto em português/inglês)
+CARACTERES_POR_TOKEN = 4
+
+# Só corta na frase se o corte não jogar fora mais que esta fração do orçamento
+_MIN_APROVEITAMENTO = 0.6
+
+_RE_FIM_FRASE = re.compile(r'[.!?…]["”’\')\]]*\s')
+
+_lock = threading.Lock()
+_codificadores = {}
+_economia = {}  # etapa -> {"aparados": n, "tokens_economizados": n}
+
+
+def _codificador(model: str):
+    if tiktoken is None or not model or model.startswith("claude"):
+        return None
+    with _lock:
+        if model not in _codificadores:
+            try:
+                try:
+                    _codificadores[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _codificadores[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Ex.: sem rede para baixar o BPE; fica a estimativa por caracteres
+                logger.warning(f"tiktoken indisponível para '{model}', usando estimativa: {e}")
+                _codificadores[model] = None
+        return _codificadores[model]
+
+
+def contar_tokens(texto: str, model: str = None) -> int:
+    """Tokens de `texto` para o modelo (exato com tiktoken, senão estimado)."""
+    if not texto:
+        return 0
+    codificador = _codificador(model)
+    if codificador is not None:
+        return len(codificador.encode(texto, disallowed_special=()))
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def _cortar_em_frase(texto: str, limite: int) -> str:
+    """Corta em até `limite` caracteres, no último fim de frase (ou espaço) antes dele."""
+    trecho = texto[:limite]
+    fins = [m.end() for m in _RE_FIM_FRASE.finditer(trecho + " ")]
+    if fins and fins[-1] >= limite * _MIN_APROVEITAMENTO:
+        return trecho[:fins[-1]].rstrip()
+    espaco = trecho.rfind(" ")
+    if espaco >= limite * _MIN_APROVEITAMENTO:
+        return trecho[:espaco].rstrip()
+    return trecho
+
+
+def aparar(texto: str, max_tokens: int, model: str = None) -> tuple:
+    """
+    Apara o texto para caber em max_tokens, de preferência no fim de uma frase.
+
+    Returns:
+        tuple: (texto, tokens_economizados)
+    """
+    if not texto or not max_tokens:
+        return texto, 0
+
+    total = contar_tokens(texto, model)
+    if total <= max_tokens:
+        return texto, 0
+
+    # Primeira estimativa proporcional; reduz até caber (o tokenizer não é linear)
+    limite = int(len(texto) * max_tokens / total)
+    aparado = _cortar_em_frase(texto, limite)
+    while aparado and contar_tokens(aparado, model) > max_tokens:
+        limite = int(limite * 0.9)
+        aparado = _cortar_em_frase(texto, limite)
+
+    return aparado, total - contar_tokens(aparado, model)
+
+
+def aparar_para_etapa(texto: str, etapa: str, model: str = None, orcamentos: dict = None) -> str:
+    """
+    Apara o texto ao orçamento da etapa (TOKEN_BUDGETS, ou `orcamentos` do
+    perfil) e registra os tokens economizados. Etapa sem orçamento: texto intacto.
+    """
+    orcamento = (orcamentos or config.TOKEN_BUDGETS).get(etapa)
+    aparado, economizados = aparar(texto, orcamento, model)
+    if economizados:
+        with _lock:
+            registro = _economia.setdefault(etapa, {"aparados": 0, "tokens_economizados": 0})
+            registro["aparados"] += 1
+            registro["tokens_economizados"] += economizados
+    return aparado
+
+
+def estatisticas(etapa: str = None) -> dict:
+    """Textos aparados e tokens economizados no processo, por etapa (ou de uma etapa)."""
+    with _lock:
+        if etapa is not None:
+            return dict(_economia.get(etapa, {"aparados": 0, "tokens_economizados": 0}))
+        return {e: dict(v) for e, v in _economia.items()}
@@ -1,10 +1,16 @@
-import trafilatura, requests, logging, json
+import trafilatura, requests, logging, json, hashlib, math, threading, copy
 from datetime import datetime
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from trafilatura.utils import load_html
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
 from pathlib import Path
 import numpy as np
 
+import http_client
+import html_cache
+import domain_stats
+import config_base as config
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -13,6 +19,61 @@ logging.basicConfig(
 
 logger = logging.getLogger()
 
+# Parâmetros de rastreamento removidos na canonicalização de URLs
+_PARAMETROS_RASTREAMENTO = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid',
+    'ref', 'ref_src', 'cmpid', 'ncid', 'guccounter', 'guce_referrer', 'guce_referrer_sig',
+    'amp', 'outputtype',  # Marcadores de AMP (?amp=1, ?outputType=amp)
+}
+
+
+def canonicalizar_url(url):
+    """
+    Forma canônica de uma URL de artigo, para deduplicação (não para download).
+
+    http e https viram https; host em minúsculas, sem 'www.'/'amp.' e sem
+    porta padrão; sem fragmento, sem parâmetros de rastreamento (utm_*,
+    fbclid, ref...) nem marcadores de AMP; query ordenada e sem barra final
+    no path.
+    """
+    if not url:
+        return url
+    try:
+        partes = urlsplit(url.strip())
+    except ValueError:
+        return url
+
+    esquema = partes.scheme.lower()
+    if esquema == 'http':
+        esquema = 'https'
+
+    host = (partes.hostname or '').lower()
+    for prefixo in ('www.', 'amp.'):
+        if host.startswith(prefixo):
+            host = host[len(prefixo):]
+    try:
+        porta = partes.port
+    except ValueError:
+        porta = None
+    if porta and porta not in (80, 443):
+        host = f"{host}:{porta}"
+
+    # Variantes AMP: /noticia/amp, /amp/noticia, /noticia.amp.html
+    path = partes.path.replace('.amp.html', '.html')
+    if path.startswith('/amp/'):
+        path = path[4:]
+    path = path.rstrip('/')
+    if path.endswith('/amp'):
+        path = path[:-4]
+    path = path or '/'
+
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True)
+        if not k.lower().startswith('utm_') and k.lower() not in _PARAMETROS_RASTREAMENTO
+    ))
+    return urlunsplit((esquema, host, path, query, ''))
+
+
 # Helper function for date formatting (optional but nice)
 def format_datetime(value, format='%Y-%m-%d %H:%M'):
     if value is None:
@@ -26,90 +87,248 @@ def format_datetime(value, format='%Y-%m-%d %H:%M'):
         return value.strftime(format)
     return value
 
-def fetch_article_content_and_og_image(url, url_encoded):
+def _primeiro_xpath(tree, expressao):
+    """Primeiro valor não vazio de uma expressão XPath, já sem espaços."""
+    for valor in tree.xpath(expressao):
+        valor = str(valor).strip()
+        if valor:
+            return valor
+    return None
+
+
+def extrair_pagina(html_content, url):
     """
-    Fetches HTML, extracts main content using Trafilatura,
-    and extracts the og:image URL using BeautifulSoup.
+    Extrai conteúdo e metadados de uma página a partir de um único parse do HTML.
+
+    A mesma árvore lxml alimenta as duas extrações do Trafilatura (texto puro e
+    markdown) e as consultas de og:image, título e URL canônica.
 
     Returns:
-        dict: {'content': str|None, 'og_image': str|None}
+        dict: {'content', 'formatted', 'og_image', 'title', 'canonical_url'} (valores podem ser None)
+    """
+    resultado = {'content': None, 'formatted': None, 'og_image': None, 'title': None, 'canonical_url': None}
+
+    tree = load_html(html_content)
+    if tree is None:
+        return resultado
+
+    # Metadados primeiro: o Trafilatura limpa a árvore durante a extração
+    og_image = _primeiro_xpath(tree, '//meta[@property="og:image"]/@content')
+    if og_image:
+        resultado['og_image'] = urljoin(url, og_image)
+
+    resultado['title'] = (
+        _primeiro_xpath(tree, '//head/title/text()')
+        or _primeiro_xpath(tree, '//title/text()')
+        or _primeiro_xpath(tree, '//meta[@property="og:title"]/@content')
+    )
+
+    canonical = _primeiro_xpath(tree, '//link[@rel="canonical"]/@href')
+    if canonical:
+        resultado['canonical_url'] = urljoin(url, canonical)
+
+    # Cópia da árvore é bem mais barata que parsear o HTML de novo
+    resultado['content'] = trafilatura.extract(
+        copy.deepcopy(tree), include_comments=False, include_tables=False
+    )
+
+    resultado['formatted'] = trafilatura.extract(
+        tree,
+        include_comments=False,
+        include_tables=False,
+        include_formatting=True,
+        favor_precision=True,
+        output_format='markdown'
+    )
+
+    return resultado
+
+
+# Pool dedicado às requisições hedged (Marreta + origem em paralelo)
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def _marreta_retornou_homepage(html_content):
+    return '<div class="brand">' in html_content and 'Galdinho News' in html_content
+
+
+def _get_marreta(url, url_encoded, cancelar=None):
+    """GET via Marreta, registrando o resultado nas estatísticas do domínio."""
+    try:
+        html_content = http_client.get_html(url_encoded, cancelar=cancelar)
+    except http_client.RequestCancelledError:
+        raise
+    except requests.exceptions.RequestException:
+        domain_stats.registrar(url, 'marreta_error')
+        raise
+    homepage = _marreta_retornou_homepage(html_content)
+    domain_stats.registrar(url, 'marreta_homepage' if homepage else 'marreta_ok')
+    return html_content
+
+
+def _get_origem(url, cancelar=None):
+    """GET na URL original, registrando o resultado nas estatísticas do domínio."""
+    try:
+        html_content = http_client.get_html(url, cancelar=cancelar)
+    except http_client.RequestCancelledError:
+        raise
+    except requests.exceptions.RequestException:
+        domain_stats.registrar(url, 'origin_error')
+        raise
+    domain_stats.registrar(url, 'origin_ok')
+    return html_content
+
+
+def _baixar_sequencial(url, url_encoded):
+    """Marreta primeiro; origem só se o Marreta falhar ou devolver a homepage."""
+    print(f"  Tentando extrair página com Marreta...")
+    try:
+        html_content = _get_marreta(url, url_encoded)
+
+        if _marreta_retornou_homepage(html_content):
+            print(f"  Marreta retornou homepage, tentando URL original...")
+            # Fallback: tentar URL original
+            return _get_origem(url), False
+
+        print(f"  Marreta funcionou...")
+        return html_content, True
+
+    except requests.exceptions.RequestException as marreta_error:
+        # FALLBACK: Se Marreta falhou, tenta URL original
+        print(f"  Marreta falhou ({marreta_error}), tentando URL original...")
+        return _get_origem(url), False
+
+
+def _baixar_origem_primeiro(url, url_encoded):
+    """Origem primeiro (domínios onde o Marreta costuma falhar); Marreta como fallback."""
+    print(f"  Domínio roteado direto para a URL original...")
+    try:
+        return _get_origem(url), False
+    except requests.exceptions.RequestException as origem_error:
+        print(f"  URL original falhou ({origem_error}), tentando Marreta...")
+        html_content = _get_marreta(url, url_encoded)
+        if _marreta_retornou_homepage(html_content):
+            raise requests.exceptions.RequestException(f"Marreta retornou homepage para {url}")
+        return html_content, True
+
+
+def _baixar_hedged(url, url_encoded, atraso):
+    """
+    Dispara o Marreta e, se ele não responder em `atraso` segundos, dispara
+    também a origem. Vence a primeira resposta que não seja a homepage do
+    Marreta; a outra requisição é cancelada.
     """
-    content = None
-    formatted_content = None
-    og_image = None
-    marreta = False
+    cancelar = {url_encoded: threading.Event(), url: threading.Event()}
+
+    def _get(alvo):
+        if alvo == url_encoded:
+            return _get_marreta(url, url_encoded, cancelar=cancelar[alvo])
+        return _get_origem(url, cancelar=cancelar[alvo])
+
+    print(f"  Tentando extrair página com Marreta (hedged, {atraso}s)...")
+    fut_marreta = _hedge_executor.submit(_get, url_encoded)
+    futures = {fut_marreta: url_encoded}
+
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0',
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Accept-Encoding": "gzip, deflate",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "none",
-            "Sec-Fetch-User": "?1",
-            "Cache-Control": "max-age=0",
-            "referer": "https://www.google.com"
-        }
-
-        print(f"  Tentando extrair página com Marreta...")
+        html_content = fut_marreta.result(timeout=atraso)
+        if not _marreta_retornou_homepage(html_content):
+            print(f"  Marreta funcionou...")
+            return html_content, True
+        print(f"  Marreta retornou homepage, tentando URL original...")
+        futures = {}
+    except FutureTimeoutError:
+        print(f"  Marreta lento, disparando URL original em paralelo...")
+    except requests.exceptions.RequestException as marreta_error:
+        print(f"  Marreta falhou ({marreta_error}), tentando URL original...")
+        futures = {}
+
+    fut_origem = _hedge_executor.submit(_get, url)
+    futures[fut_origem] = url
+
+    ultimo_erro = None
+    for future in as_completed(futures):
         try:
-            response = requests.get(url_encoded, headers=headers, timeout=20)
-            response.raise_for_status()
-            html_content = response.text
-
-            if '<div class="brand">' in html_content and 'Galdinho News' in html_content:
-                print(f"  Marreta retornou homepage, tentando URL original...")
-                # Fallback: tentar URL original
-                response = requests.get(url, headers=headers, timeout=20)
-                response.raise_for_status()
-                html_content = response.text
-                marreta = False
-            else:
-                print(f"  Marreta funcionou...")
-                marreta = True
-        
-        except requests.exceptions.RequestException as marreta_error:
-            # FALLBACK: Se Marreta falhou, tenta URL original
-            print(f"  Marreta falhou ({marreta_error}), tentando URL original...")
-            response = requests.get(url, headers=headers, timeout=20)
-            response.raise_for_status()
-            html_content = response.text
-            marreta = False
-
-        # 1. Extract text content
-        content = trafilatura.extract(html_content, include_comments=False, include_tables=False)
-
-        formatted_content = trafilatura.extract(
-            html_content,
-            include_comments=False,
-            include_tables=False,
-            include_formatting=True,
-            favor_precision=True,
-            output_format='markdown'
-        )
-        
-
-        # 2. Extract og:image using BeautifulSoup
-        soup = BeautifulSoup(html_content, 'lxml') # Use lxml or html.parser
-        og_image_tag = soup.find('meta', property='og:image')
-        if og_image_tag and og_image_tag.get('content'):
-            og_image = og_image_tag['content']
-            # Optionally resolve relative URLs - less common for og:image but possible
-            og_image = urljoin(url, og_image)
-
-        return {'content': content, 'formatted': formatted_content, 'og_image': og_image}, marreta
+            html_content = future.result()
+        except requests.exceptions.RequestException as e:
+            ultimo_erro = e
+            continue
+
+        if future is fut_marreta and _marreta_retornou_homepage(html_content):
+            print(f"  Marreta retornou homepage, aguardando URL original...")
+            continue
+
+        # Cancela a perdedora (se ainda estiver na fila ou baixando)
+        for outro, alvo in futures.items():
+            if outro is not future:
+                cancelar[alvo].set()
+                outro.cancel()
+
+        venceu_marreta = future is fut_marreta
+        print(f"  {'Marreta' if venceu_marreta else 'URL original'} respondeu primeiro...")
+        return html_content, venceu_marreta
+
+    raise ultimo_erro or requests.exceptions.RequestException(f"Nenhuma resposta válida para {url}")
+
+
+def baixar_html(url, url_encoded, hedged=None, usar_cache=True):
+    """
+    Baixa o HTML da página (Marreta com fallback para a URL original), sem extrair nada.
+
+    Com hedged=True (padrão: config.HEDGED_FETCH_ENABLED) a URL original é pedida
+    em paralelo quando o Marreta não responde em HEDGED_FETCH_DELAY segundos.
+    Sem hedge, domain_stats.rota() decide se o domínio vai primeiro ao Marreta
+    ou direto à origem.
+    O HTML é consultado/gravado no html_cache local.
+
+    Returns:
+        tuple: (html | None, marreta)
+    """
+    if hedged is None:
+        hedged = config.HEDGED_FETCH_ENABLED
+
+    em_cache = html_cache.get(url) if usar_cache else None
+    if em_cache:
+        print(f"  HTML encontrado no cache local...")
+        return em_cache
 
+    try:
+        if hedged:
+            html_content, marreta = _baixar_hedged(url, url_encoded, config.HEDGED_FETCH_DELAY)
+        elif domain_stats.rota(url) == domain_stats.ORIGEM:
+            html_content, marreta = _baixar_origem_primeiro(url, url_encoded)
+        else:
+            html_content, marreta = _baixar_sequencial(url, url_encoded)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching {url}: {e}")
-        return {'content': None, 'formatted': None, 'og_image': None}, marreta
+        return None, False
+
+    if usar_cache:
+        html_cache.put(url, html_content, marreta)
+    return html_content, marreta
+
+
+def fetch_article_content_and_og_image(url, url_encoded, hedged=None, usar_cache=True):
+    """
+    Fetches HTML (via Marreta, falling back to the original URL) and extracts
+    content, markdown, og:image, title and canonical URL in a single parse.
+
+    Download and extraction run inline; for many articles use
+    content_pipeline.buscar_e_extrair, which extracts on a process pool.
+
+    Returns:
+        tuple: ({'content', 'formatted', 'og_image', 'title', 'canonical_url'}, marreta)
+    """
+    vazio = {'content': None, 'formatted': None, 'og_image': None, 'title': None, 'canonical_url': None}
+
+    html_content, marreta = baixar_html(url, url_encoded, hedged=hedged, usar_cache=usar_cache)
+    if html_content is None:
+        return vazio, False
+
+    try:
+        return extrair_pagina(html_content, url), marreta
     except Exception as e:
-        # Catch potential BeautifulSoup errors or others
         print(f"Error processing content/og:image from {url}: {e}")
-        # Still return content if it was extracted before the error
-        return {'content': content, 'formatted': formatted_content, 'og_image': None}, marreta
+        return vazio, marreta
 
 def scrape_single_article_details(article_url):
     """
@@ -144,43 +363,12 @@ def scrape_single_article_details(article_url):
 
         raw_content = fetch_result['content']
         og_image_url = fetch_result['og_image']
+        fetched_title = fetch_result['title'] # Same parse as the content, no refetch needed
 
         if not raw_content:
             # fetch_article_content_and_og_image might have already logged, but good to have a specific error here
             error_message = "Failed to extract main content from the article."
             logger.warning(f"{error_message} URL: {article_url}")
-            # Even if content fails, we might still get a title or image from OG tags if fetch worked partially
-            # So, continue to try and extract title if possible.
-
-        # --- Attempt to get a title from the page if not from RSS ---
-        # We need to re-fetch or use the already fetched HTML if available from fetch_article_content_and_og_image
-        # Let's assume fetch_article_content_and_og_image doesn't return the full soup object.
-        # If it did, we could reuse it. For now, we might need a minimal re-fetch or a helper modification.
-        # Simplification: If trafilatura got content, it often implies page was fetched.
-        # We could parse the title from the raw_content's source HTML (if fetch_... stored it)
-        # or do another small HEAD request or parse from a snippet.
-        # For now, we'll use a placeholder if the feed didn't provide it.
-        # A more robust solution would be to enhance fetch_article_content_and_og_image
-        # to also return the <title> tag content.
-
-        if raw_content: # If we got content, try to get title from HTML
-            try:
-                # Need to parse the HTML again if not already available from previous fetch
-                headers = {'User-Agent': 'Mozilla/5.0 ...'} # Your headers
-                response = requests.get(article_url, headers=headers, timeout=15)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.text, 'lxml')
-                title_tag = soup.find('title')
-                if title_tag and title_tag.string:
-                    fetched_title = title_tag.string.strip()
-                # Fallback to OG title if HTML title is poor/missing
-                if not fetched_title:
-                    og_title_tag = soup.find('meta', property='og:title')
-                    if og_title_tag and og_title_tag.get('content'):
-                        fetched_title = og_title_tag['content'].strip()
-            except Exception as title_e:
-                logger.warning(f"Could not extract title for {article_url}: {title_e}")
-                # Continue without title if it fails
 
         final_image_url = og_image_url # For a single manual add, OG image is the primary target
 
@@ -221,6 +409,34 @@ def get_active_feeds():
     return sorted(feeds)
 
 
+class BloomFilter:
+    """
+    Filtro de Bloom simples em memória, com hash duplo sobre SHA-256.
+    Falsos positivos são possíveis (na taxa configurada); falsos negativos não.
+    """
+
+    def __init__(self, capacidade: int, taxa_erro: float = 1e-6):
+        capacidade = max(capacidade, 1)
+        self.num_bits = max(8, math.ceil(-capacidade * math.log(taxa_erro) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacidade * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _posicoes(self, item: str):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> None:
+        with self._lock:
+            for pos in self._posicoes(item):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posicoes(item))
+
+
 def similaridade_cosseno(emb1: list, emb2: list) -> float:
     """Calcula similaridade de cosseno entre dois embeddings."""
     a = np.array(emb1)